@@ -0,0 +1,85 @@
+"""
+Per-request overhead of building a fresh LLM client vs. reusing the pooled one.
+
+Runs against a local OpenAI-compatible stub, so it measures only our side:
+config parsing, client construction and connection setup.
+
+    python benchmarks/bench_client_registry.py [requests]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai_stub import OpenAIStub  # noqa: E402
+from src.client_registry import ClientRegistry  # noqa: E402
+from src.provider_config import load_providers, load_models  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def write_config(folder, base_url):
+    provider_file = os.path.join(folder, "provider.txt")
+    models_file = os.path.join(folder, "models.txt")
+    with open(provider_file, "w", encoding="utf-8") as f:
+        f.write(f"name=Stub\napiKey=\nbaseUrl={base_url}\n")
+    with open(models_file, "w", encoding="utf-8") as f:
+        f.write("provider=Stub\nmodel-id=stub-model\n")
+    return provider_file, models_file
+
+
+async def run_fresh_client(provider_file, models_file, n):
+    """The old get_llm_client(): parse both files and build a new client every call."""
+    import openai
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        provider = load_providers(provider_file)[0]
+        model = load_models(models_file)[0]
+        client = openai.AsyncOpenAI(api_key="not-required", base_url=provider["baseurl"])
+        await client.chat.completions.create(model=model["model-id"], messages=MESSAGES)
+        timings.append(time.perf_counter() - start)
+        await client.close()
+    return timings
+
+
+async def run_registry(provider_file, models_file, n):
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file)
+    timings = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            client = registry.checkout(registry.providers[0])
+            try:
+                await client.chat.completions.create(model=registry.models[0]["model-id"], messages=MESSAGES)
+            finally:
+                await registry.checkin(client)
+            timings.append(time.perf_counter() - start)
+    finally:
+        await registry.aclose()
+    return timings
+
+
+def report(label, timings, connections):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:<14} mean {mean * 1000:7.2f} ms | p50 {p50 * 1000:7.2f} ms | "
+          f"p99 {p99 * 1000:7.2f} ms | TCP connections {connections}")
+
+
+async def main(n):
+    with tempfile.TemporaryDirectory() as folder:
+        for label, runner in (("fresh client", run_fresh_client), ("pooled client", run_registry)):
+            async with OpenAIStub() as stub:
+                provider_file, models_file = write_config(folder, stub.base_url)
+                timings = await runner(provider_file, models_file, n)
+                report(label, timings, len(stub.connections))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
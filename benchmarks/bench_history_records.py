@@ -0,0 +1,99 @@
+"""
+Memory per cached channel and prompt-assembly time at the history cap,
+history entries as plain dicts vs. HistoryRecords (src/history_records.py).
+
+Histories are decoded from JSON lines like the store reads them, so every dict
+holds its own copy of each key and author string.
+
+    python benchmarks/bench_history_records.py [channels]
+"""
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import MAX_HISTORY_LEN  # noqa: E402
+from src.context_builder import TokenCounter, build_context, heuristic_tokenizer  # noqa: E402
+from src.history_records import HistoryRecord  # noqa: E402
+
+USERS = [(f"user{i}", f"{1000 + i}", str(100000000000000000 + i)) for i in range(30)]
+WORDS = "the a bot said hey what is going on lol ok so I think we should try that again later".split()
+SYSTEM_PROMPT = "You are a helpful Discord bot.\n" * 40
+
+
+def make_log(seed: int) -> list:
+    """One channel's on-disk log: MAX_HISTORY_LEN JSON lines."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(MAX_HISTORY_LEN):
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+        if i % 3 == 2:
+            record = {"id": str(seed * 10000 + i), "role": "assistant", "content": content}
+        else:
+            name, discriminator, user_id = rng.choice(USERS)
+            record = {"id": str(seed * 10000 + i), "role": "user", "name": name,
+                      "discriminator": discriminator, "user_id": user_id, "content": content}
+        lines.append(json.dumps(record))
+    return lines
+
+
+def measure_memory(logs, convert) -> float:
+    """Bytes retained per channel by the decoded histories (content strings included)."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    channels = [convert([json.loads(line) for line in log]) for log in logs]
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del channels
+    return retained / len(logs)
+
+
+def render_all(history) -> list:
+    """Records of a channel that was prompted (each caches its API message)."""
+    records = [HistoryRecord.from_dict(r) for r in history]
+    for record in records:
+        record.api_message()
+    return records
+
+
+def measure_assembly(history, runs=200) -> float:
+    """Median ms of one build_context() call, token counts already cached."""
+    counter = TokenCounter(tokenizer=heuristic_tokenizer)
+    build_context(SYSTEM_PROMPT, history, budget=10**9, counter=counter)  # warm up
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        build_context(SYSTEM_PROMPT, history, budget=10**9, counter=counter)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    logs = [make_log(seed) for seed in range(channels)]
+
+    as_dicts = measure_memory(logs, list)
+    as_records = measure_memory(logs, lambda history: [HistoryRecord.from_dict(r) for r in history])
+    rendered = measure_memory(logs, render_all)
+    print(f"Memory per channel ({MAX_HISTORY_LEN} entries, {channels} channels):")
+    print(f"  dicts:   {as_dicts / 1024:7.1f} KiB")
+    print(f"  records: {as_records / 1024:7.1f} KiB ({as_records / as_dicts:.0%})")
+    print(f"  records, API messages rendered: {rendered / 1024:7.1f} KiB ({rendered / as_dicts:.0%})")
+
+    history = [json.loads(line) for line in logs[0]]
+    records = [HistoryRecord.from_dict(r) for r in history]
+    print(f"Prompt assembly ({MAX_HISTORY_LEN} entries, median):")
+    print(f"  dicts:   {measure_assembly(history):.3f} ms")
+    print(f"  records: {measure_assembly(records):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cold-start cost: how long importing the bot (and collecting the tests) takes,
+and which packages that time goes to.
+
+Each import runs in a fresh interpreter with `-X importtime`, so nothing is
+cached in sys.modules between runs.
+
+    python benchmarks/bench_import_time.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["src.config", "src.llm_client", "bot"]
+
+
+def import_profile(module: str):
+    """Wall time of `import module` and self time (µs) per top-level package."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    wall = time.perf_counter() - start
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    return wall, packages
+
+
+def collect_time() -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider"],
+        cwd=ROOT, capture_output=True, check=True,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = statistics.median(
+        import_profile("os")[0] for _ in range(runs)
+    )
+    print(f"Interpreter start: {baseline * 1000:.0f} ms (median of {runs})")
+
+    for module in MODULES:
+        walls, packages = [], Counter()
+        for _ in range(runs):
+            wall, profile = import_profile(module)
+            walls.append(wall)
+            packages = profile  # Last run: warm disk cache, same as a bot restart
+        top = ", ".join(f"{name} {us / 1000:.0f}" for name, us in packages.most_common(6))
+        print(f"import {module:<15} {statistics.median(walls) * 1000:6.0f} ms | top (ms): {top}")
+
+    collect = statistics.median(collect_time() for _ in range(max(1, runs // 2)))
+    print(f"pytest --collect-only   {collect * 1000:6.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
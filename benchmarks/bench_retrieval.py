@@ -0,0 +1,89 @@
+"""
+Local BM25 retrieval (src/retrieval.py): how long building a channel's index
+from its archive file, archiving one entry and answering one query take, and
+how much history a prompt carries with and without it.
+
+    python benchmarks/bench_retrieval.py [archive sizes...]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import MAX_HISTORY_LEN  # noqa: E402
+from src.context_builder import heuristic_tokenizer, render_entry  # noqa: E402
+from src.history_log import append_records  # noqa: E402
+from src.history_records import HistoryRecord  # noqa: E402
+from src.retrieval import ChannelIndex, HistoryRetriever, search, term_counts  # noqa: E402
+
+USERS = [(f"user{i}", "0", str(100000000000000000 + i)) for i in range(30)]
+WORDS = ("the a bot said hey what is going on lol ok so I think we should try that again later "
+         "pizza raid tonight server patch build deploy cat dog movie song game boss loot guild "
+         "python discord token prompt model latency queue cache history summary").split()
+TOP_K, TAIL = 8, 20
+
+
+def make_entries(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    entries = []
+    for i in range(count):
+        content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+        name, discriminator, user_id = rng.choice(USERS)
+        entries.append(HistoryRecord.from_dict({"id": str(i), "role": "user", "name": name,
+                                                "discriminator": discriminator, "user_id": user_id,
+                                                "content": content}))
+    return entries
+
+
+def median_ms(func, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def tokens(entries) -> int:
+    return sum(heuristic_tokenizer(render_entry(entry)["content"]) for entry in entries)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 5000, 20000]
+    window = make_entries(MAX_HISTORY_LEN, seed=1)
+    queries = [" ".join(random.Random(i).sample(WORDS, 6)) for i in range(50)]
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for size in sizes:
+            entries = make_entries(size)
+            retriever = HistoryRetriever(enabled=True, max_entries=size, cache_dir=cache_dir)
+            append_records(retriever._path(str(size)), [entry.to_dict() for entry in entries])
+
+            def load():
+                term_counts.cache_clear()  # Cold: as after a restart
+                return retriever._read(str(size))
+            build = median_ms(load, 5)
+
+            index, new = load(), make_entries(1000, seed=2)
+            start = time.perf_counter()
+            for entry in new:
+                index.add(entry)
+            add_us = (time.perf_counter() - start) * 1e6 / len(new)
+
+            older = window[:-TAIL]
+            query = median_ms(lambda: [search(index, older, q, TOP_K) for q in queries], 5) / len(queries)
+            print(f"archive {size:6d} entries: index load {build:7.1f} ms | archive one entry {add_us:5.1f} µs "
+                  f"| query (+{len(older)} window entries) {query:6.2f} ms")
+
+    index = ChannelIndex(make_entries(5000))
+    recalled = search(index, window[:-TAIL], queries[0], TOP_K)
+    print(f"History in the prompt ({MAX_HISTORY_LEN}-entry window): {tokens(window)} tokens as is, "
+          f"{tokens(window[-TAIL:]) + tokens(recalled)} tokens as the {TAIL}-entry tail + top {TOP_K}")
+
+
+if __name__ == "__main__":
+    main()
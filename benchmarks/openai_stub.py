@@ -0,0 +1,104 @@
+"""
+Minimal local OpenAI-compatible server for benchmarks and tests.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) on 127.0.0.1
+using aiohttp, which is already installed as a discord.py dependency.
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+class OpenAIStub:
+    """
+    Args:
+        reply: Text returned by every completion.
+        delay: Seconds to wait before answering (simulates model latency).
+        fail_status: If set, requests fail with this HTTP status.
+        fail_times: Only the first N requests fail (None = all of them).
+        chunk_size: Characters per streamed delta.
+        break_after: Drop the connection after this many streamed deltas.
+    """
+
+    def __init__(self, reply="Hello from the stub!", delay=0.0, fail_status=None, fail_times=None,
+                 chunk_size=4, break_after=None):
+        self.reply = reply
+        self.delay = delay
+        self.fail_status = fail_status
+        self.fail_times = fail_times
+        self.chunk_size = chunk_size
+        self.break_after = break_after
+        self.requests = 0
+        self.connections = set()
+        self._runner = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def _handle(self, request):
+        self.requests += 1
+        transport = request.transport
+        if transport is not None:
+            self.connections.add(transport.get_extra_info("peername"))
+        body = await request.json()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail_status and (self.fail_times is None or self.requests <= self.fail_times):
+            return web.json_response(
+                {"error": {"message": "stub failure", "type": "server_error"}},
+                status=self.fail_status,
+            )
+        base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub")}
+        if not body.get("stream"):
+            return web.json_response({
+                **base,
+                "object": "chat.completion",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.reply},
+                    "finish_reason": "stop",
+                }],
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for n, i in enumerate(range(0, len(self.reply), self.chunk_size)):
+            if self.break_after is not None and n >= self.break_after:
+                request.transport.close()
+                return response
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": self.reply[i:i + self.chunk_size]},
+                    "finish_reason": None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
@@ -2,20 +2,31 @@ import discord
 import asyncio
 import random
 from discord import app_commands
-from asyncio import Queue
 import aiohttp
 import socket
 from src.llm_client import request_completion
 
 from src.config import (
     DISCORD_TOKEN, ALLOWED_CHANNELS, USE_GUILD_ID, ALLOWED_GUILD_IDS, ALLOWED_GUILD_NAMES,
-    CUSTOM_INSTRUCTIONS, MAX_HISTORY_LEN, WELCOME_MSG, DYNAMIC
+    WELCOME_MSG, DYNAMIC
 )
-from src.cache_utils import load_channel_history, save_channel_history
+from src.cache_utils import append_channel_history, ingest_message, history_store
+from src.history_records import assistant_record
 from src.mention_utils import resolve_mentions, replace_mentions_with_username_discriminator
-from src.llm_client import llm_worker
+from src.llm_client import process_request
+from src.scheduler import ChannelScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, SHED_STALE
 from src.commands import register_commands
-from src.provider_config import get_llm_client
+from src.client_registry import registry as llm_clients
+from src.member_index import member_directory
+from src.user_list import user_activity
+from src.prompt_cache import prompt_cache
+from src.router import llm_router
+from src.relevance import relevance_gate, SKIP
+from src.async_io import run_blocking, loop_monitor
+from src.startup import startup
+from src.summarizer import summarizer
+from src.retrieval import retriever
+from src.context_builder import token_counter
 
 # Load admin IDs
 ADMIN_IDS = []
@@ -36,113 +47,193 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = discord.Client(intents=intents)
+class LousyBot(discord.Client):
+    async def close(self):
+        # Stop in-flight AI requests and pooled LLM connections before the Discord session goes away
+        await startup.close()
+        await request_queue.stop()
+        await summarizer.close()
+        await retriever.close()
+        await llm_clients.aclose()
+        await history_store.close()
+        await loop_monitor.stop()
+        await super().close()
+
+bot = LousyBot(intents=intents)
 tree = app_commands.CommandTree(bot)
-request_queue = Queue()
+
+async def react_to_shed(message, reason):
+    """Shed messages get a reaction instead of a (late) reply."""
+    try:
+        await message.add_reaction("⌛" if reason == SHED_STALE else "🚦")
+    except discord.HTTPException as e:
+        print(f"⚠️ Failed to react to shed message: {e}")
+
+request_queue = ChannelScheduler(process_request, on_shed=react_to_shed)
+summarizer.scheduler = request_queue  # Summaries only take LLM slots no chat is waiting for
+
+async def send_welcome_message():
+    """Generate and send the "back online" message (deferred: readiness never waits on the LLM)."""
+    messages = [
+        {
+            "role": "system",
+            "content": "You are an AI assistant. Generate a friendly, energetic message to announce you are back online and ready to chat. Be creative and welcoming!"
+        },
+        {
+            "role": "user",
+            "content": "Announce that the AI is back online."
+        }
+    ]
+
+    # Fun rotating fallback messages
+    fallbacks = [
+        "🤖 Beep boop! Systems nominal and ready for your commands!",
+        "✨ Back in action! What can I help you with?",
+        "🚀 Online and operational! Let's chat!",
+        "👋 Hello world! Ready to assist!",
+        "💡 Lights on! Ask me anything!"
+    ]
+
+    ai_content = random.choice(fallbacks) # Fallback
+    try:
+        response = await request_completion(
+            messages=messages,
+            temperature=0.8
+        )
+        if response:
+            ai_content = response
+    except Exception as e:
+        print(f"⚠️ Error generating online message: {e}")
+
+    # Try to send the message to the first allowed channel
+    try:
+        first_guild = None
+        first_channel = None
+        if USE_GUILD_ID and ALLOWED_GUILD_IDS:
+            for g in bot.guilds:
+                if g.id in ALLOWED_GUILD_IDS:
+                    first_guild = g
+                    break
+        elif ALLOWED_GUILD_NAMES:
+            for g in bot.guilds:
+                if g.name in ALLOWED_GUILD_NAMES:
+                    first_guild = g
+                    break
+
+        if first_guild:
+            # Find the first allowed channel within the selected guild
+            for channel_id in ALLOWED_CHANNELS:
+                channel = first_guild.get_channel(channel_id)
+                if channel and isinstance(channel, discord.TextChannel):
+                    first_channel = channel
+                    break
+
+        if first_channel: # Check if a suitable channel was found
+            sent_message = await first_channel.send(ai_content)
+            print(f"✅ Sent 'back online' message to {first_channel.name} in {first_guild.name}")
+
+            # Save the 'back online' message to channel history
+            try:
+                await append_channel_history(str(first_channel.id), assistant_record(
+                    ai_content, sent_message, type="back_online" # Add a type for clarity
+                ), guild_id=first_guild.id)
+                print(f"✅ Saved 'back online' message to history for channel {first_channel.name}")
+            except Exception as hist_e:
+                print(f"⚠️ Failed to save 'back online' message to history: {hist_e}")
+
+        else:
+            print("⚠️ Could not find a suitable channel to send the 'back online' message.")
+    except Exception as e:
+        print(f"⚠️ Could not send back-online message: {e}")
+
+async def warm_member_index():
+    """Build the member/role index of every allowed guild, yielding to the loop between guilds."""
+    for guild in bot.guilds:
+        if (guild.id in ALLOWED_GUILD_IDS) if USE_GUILD_ID else (guild.name in ALLOWED_GUILD_NAMES):
+            member_directory.get(guild)
+            await asyncio.sleep(0)
+
+def start_workers():
+    """AI scheduler, history flusher, summarizer, retrieval archive and loop lag monitor (each a no-op if already running)."""
+    request_queue.start()
+    history_store.start()
+    summarizer.start()
+    retriever.start()
+    loop_monitor.start()
 
 @bot.event
 async def on_ready():
     await bot.wait_until_ready()
-    print(f'✅ Logged in as {bot.user.name} (ID: {bot.user.id})')
-    print(f"👂 Listening in channels: {ALLOWED_CHANNELS if ALLOWED_CHANNELS else 'None specified'}")
-    print(f"📋 Connected guilds ({len(bot.guilds)}):")
-    for g in bot.guilds:
-        print(f"  - {g.name} (ID: {g.id})")
-    if USE_GUILD_ID:
-        print(f"👂 Allowed guilds (ID): {ALLOWED_GUILD_IDS if ALLOWED_GUILD_IDS else 'None specified'}")
-    else:
-        print(f"👂 Allowed guilds (Name): {ALLOWED_GUILD_NAMES if ALLOWED_GUILD_NAMES else 'None specified'}")
-    print('------')
-
-    # Register commands from src/commands.py FIRST!
-    register_commands(tree, bot)
-    print("✅ Commands registered locally.")
-    # Syncing is now handled by the !sync command below.
-    # You might want to run !sync once after starting the bot.
-
-    # Start AI worker task
-    asyncio.create_task(llm_worker(request_queue))
-
-    # Generate and send "back online" message (if enabled)
-    if WELCOME_MSG:
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI assistant. Generate a friendly, energetic message to announce you are back online and ready to chat. Be creative and welcoming!"
-            },
-            {
-                "role": "user",
-                "content": "Announce that the AI is back online."
-            }
-        ]
-
-        # Fun rotating fallback messages
-        fallbacks = [
-            "🤖 Beep boop! Systems nominal and ready for your commands!",
-            "✨ Back in action! What can I help you with?",
-            "🚀 Online and operational! Let's chat!",
-            "👋 Hello world! Ready to assist!",
-            "💡 Lights on! Ask me anything!"
-        ]
-
-        ai_content = random.choice(fallbacks) # Fallback
-        try:
-            response = await request_completion(
-                messages=messages,
-                temperature=0.8
-            )
-            if response:
-                ai_content = response
-        except Exception as e:
-            print(f"⚠️ Error generating online message: {e}")
+    first = startup.begin()
+    print(f'✅ Logged in as {bot.user.name} (ID: {bot.user.id})' if first else
+          f'🔁 on_ready fired again (#{startup.runs}, e.g. after a reconnect): skipping finished startup work')
+    if first:
+        print(f"👂 Listening in channels: {ALLOWED_CHANNELS if ALLOWED_CHANNELS else 'None specified'}")
+        print(f"📋 Connected guilds ({len(bot.guilds)}):")
+        for g in bot.guilds:
+            print(f"  - {g.name} (ID: {g.id})")
+        if USE_GUILD_ID:
+            print(f"👂 Allowed guilds (ID): {ALLOWED_GUILD_IDS if ALLOWED_GUILD_IDS else 'None specified'}")
+        else:
+            print(f"👂 Allowed guilds (Name): {ALLOWED_GUILD_NAMES if ALLOWED_GUILD_NAMES else 'None specified'}")
+        print('------')
 
-        # Try to send the message to the first allowed channel
-        try:
-            first_guild = None
-            first_channel = None
-            if USE_GUILD_ID and ALLOWED_GUILD_IDS:
-                for g in bot.guilds:
-                    if g.id in ALLOWED_GUILD_IDS:
-                        first_guild = g
-                        break
-            elif ALLOWED_GUILD_NAMES:
-                for g in bot.guilds:
-                    if g.name in ALLOWED_GUILD_NAMES:
-                        first_guild = g
-                        break
-
-            if first_guild:
-                # Find the first allowed channel within the selected guild
-                for channel_id in ALLOWED_CHANNELS:
-                    channel = first_guild.get_channel(channel_id)
-                    if channel and isinstance(channel, discord.TextChannel):
-                        first_channel = channel
-                        break
-
-            if first_channel: # Check if a suitable channel was found
-                sent_message = await first_channel.send(ai_content)
-                print(f"✅ Sent 'back online' message to {first_channel.name} in {first_guild.name}")
-
-                # Save the 'back online' message to channel history
-                try:
-                    history = load_channel_history(str(first_channel.id))
-                    history.append({
-                        "role": "assistant",
-                        "content": ai_content,
-                        "type": "back_online" # Add a type for clarity
-                    })
-                    save_channel_history(str(first_channel.id), history)
-                    print(f"✅ Saved 'back online' message to history for channel {first_channel.name}")
-                except Exception as hist_e:
-                    print(f"⚠️ Failed to save 'back online' message to history: {hist_e}")
-
-            else:
-                print("⚠️ Could not find a suitable channel to send the 'back online' message.")
-        except Exception as e:
-            print(f"⚠️ Could not send back-online message: {e}")
-    else:
+    # Independent startup phases run concurrently; each runs once (until it succeeds).
+    # Commands are only registered locally: syncing is handled by the !sync command below.
+    await startup.run(
+        ("commands", lambda: register_commands(tree, bot, scheduler=request_queue)),
+        ("workers", start_workers),
+        # Parse provider/model config off the event loop now, instead of on the first request
+        ("model config", lambda: run_blocking(llm_clients.load)),
+        # Load the tokenizer (tiktoken may download its encoding) before the first request counts tokens
+        ("tokenizer", lambda: run_blocking(lambda: token_counter.tokenizer)),
+        ("member index", warm_member_index),
+    )
+    print(startup.report())
+
+    if WELCOME_MSG:
+        startup.defer("welcome", send_welcome_message)
+    elif first:
         print("👋 Welcome message suppressed (WELCOME_MSG is false in .env)")
 
+# --- Keep the member/role index used for mentions (src/member_index.py) in sync ---
+@bot.event
+async def on_member_join(member):
+    member_directory.on_member_join(member)
+
+@bot.event
+async def on_member_remove(member):
+    member_directory.on_member_remove(member)
+
+@bot.event
+async def on_member_update(before, after):
+    member_directory.on_member_update(before, after)
+
+@bot.event
+async def on_user_update(before, after):
+    member_directory.on_user_update(before, after)
+
+@bot.event
+async def on_guild_role_create(role):
+    member_directory.on_role_create(role)
+
+@bot.event
+async def on_guild_role_delete(role):
+    member_directory.on_role_delete(role)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    member_directory.on_role_update(before, after)
+
+@bot.event
+async def on_guild_available(guild):
+    # Rebuilt lazily from the fresh member cache after a (re)connect
+    member_directory.forget(guild)
+
+@bot.event
+async def on_guild_remove(guild):
+    member_directory.forget(guild)
+
 @bot.event
 async def on_message(message: discord.Message):
     if message.author == bot.user or message.webhook_id:
@@ -182,6 +273,55 @@ async def on_message(message: discord.Message):
             print(f"❌ Error during !sync: {e}")
         return # Don't process !sync as a regular message
 
+    # Handle !queue command (admin only): per-channel AI queue stats and event loop lag
+    if message.content.startswith('!queue'):
+        if message.author.id not in ADMIN_IDS:
+            await message.channel.send(":no_entry_sign: You don't have permission to view queue stats!")
+            return
+        await message.channel.send(f"{request_queue.format_stats()}\n{loop_monitor.format_stats()}")
+        return
+
+    # Handle !prompt command (admin only): system prompt cache, history summary and retrieval stats
+    if message.content.startswith('!prompt'):
+        if message.author.id not in ADMIN_IDS:
+            await message.channel.send(":no_entry_sign: You don't have permission to view prompt stats!")
+            return
+        await message.channel.send(f"{prompt_cache.format_stats()}\n{summarizer.format_stats()}\n{retriever.format_stats()}")
+        return
+
+    # Handle !routes command (admin only): provider/model routing stats
+    if message.content.startswith('!routes'):
+        if message.author.id not in ADMIN_IDS:
+            await message.channel.send(":no_entry_sign: You don't have permission to view routing stats!")
+            return
+        try:
+            await message.channel.send(llm_router.format_stats())
+        except Exception as e:
+            await message.channel.send(f":x: Could not load routes: {e}")
+        return
+
+    # Handle !relevance command (admin only): relevance gate decisions and accuracy
+    if message.content.startswith('!relevance'):
+        if message.author.id not in ADMIN_IDS:
+            await message.channel.send(":no_entry_sign: You don't have permission to view relevance stats!")
+            return
+        await message.channel.send(relevance_gate.format_stats())
+        return
+
+    # Handle !reload command (admin only): re-read bot.txt and model config
+    if message.content.startswith('!reload'):
+        if message.author.id not in ADMIN_IDS:
+            await message.channel.send(":no_entry_sign: You don't have permission to reload the config!")
+            return
+        try:
+            await prompt_cache.reload_instructions()
+            await llm_clients.reload()
+            await message.channel.send(":arrows_counterclockwise: Reloaded bot.txt and model config!")
+        except Exception as e:
+            await message.channel.send(f":x: Reload failed: {e}")
+            print(f"❌ Error during !reload: {e}")
+        return
+
     # --- Rest of on_message logic ---
     should_respond = False
     if message.channel.id in ALLOWED_CHANNELS:
@@ -197,6 +337,9 @@ async def on_message(message: discord.Message):
     if not should_respond:
         return
 
+    if message.guild:
+        user_activity.record(message.guild.id, message.author.id)
+
     # Dynamic response logic will be handled after AI response
 
     # Check channel slowmode
@@ -208,6 +351,10 @@ async def on_message(message: discord.Message):
         )
         return
 
+    # DYNAMIC mode: cheap rules decide respond/skip/ask before spending an LLM call
+    # (on the raw content, before mentions are rewritten below)
+    decision = relevance_gate.decide(message, bot.user) if DYNAMIC and message.guild else None
+
     # Convert mentions to username#discriminator for AI input if enabled
     processed_content = (
         replace_mentions_with_username_discriminator(message.content, message.guild)
@@ -216,20 +363,21 @@ async def on_message(message: discord.Message):
     # Overwrite the message.content for AI processing
     message.content = processed_content
 
-    # Save message to channel history
+    # Save message to channel history (the only place user messages are stored; replays are ignored)
     try:
-        history = load_channel_history(str(message.channel.id))
-        history.append({
-            "role": "user",
-            "content": message.content,
-            "author": f"{message.author.name}#{message.author.discriminator}"
-        })
-        save_channel_history(str(message.channel.id), history)
+        if not await ingest_message(message):
+            print(f"🔁 Message {message.id} is already in the history, ignoring it")
+            return
     except Exception as e:
         print(f"⚠️ Failed to save message to history: {e}")
 
+    if decision is not None and decision.verdict == SKIP and not decision.audit:
+        print(f"🚪 Relevance gate: skipping message from {message.author.name} ({decision.reason})")
+        return
+
     print(f"📥 Queuing request from {message.author.name} in {message.channel.name}: '{message.content[:50]}...'")
-    await request_queue.put(message)
+    # Admins skip ahead of ambient chat
+    await request_queue.put(message, priority=PRIORITY_HIGH if message.author.id in ADMIN_IDS else PRIORITY_NORMAL)
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,136 @@
+"""
+Keep blocking work (disk I/O, config parsing) off the discord.py event loop.
+
+run_blocking() runs a plain function in a thread pool and awaits its result;
+LoopLagMonitor warns when something blocks the loop anyway, naming the code
+that was running on the loop thread at the time.
+"""
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
+from .config import IO_THREADS, LOOP_LAG_WARN
+
+_executor: Optional[ThreadPoolExecutor] = None
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def io_executor() -> ThreadPoolExecutor:
+    """Shared thread pool for blocking I/O (created on first use)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=max(1, IO_THREADS), thread_name_prefix="lousybot-io")
+    return _executor
+
+
+async def run_blocking(func, *args, executor: Optional[Executor] = None, **kwargs):
+    """
+    Run `func(*args, **kwargs)` in a worker thread and return its result.
+
+    Args:
+        executor: Pool to run in (default: the shared io_executor()). A
+            single-worker executor runs calls one at a time, in order.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs) if kwargs else func
+    return await loop.run_in_executor(executor or io_executor(), call, *(() if kwargs else args))
+
+
+def _blocking_frame(thread_id: int) -> Optional[str]:
+    """Innermost project frame (or the innermost frame) a thread is executing."""
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return None
+    stack = traceback.extract_stack(frame)
+    own = [f for f in stack if f.filename.startswith(_PROJECT_ROOT) and "site-packages" not in f.filename]
+    where = (own or stack)[-1]
+    return f"{os.path.relpath(where.filename, _PROJECT_ROOT)}:{where.lineno} in {where.name}()"
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop lag with a heartbeat task that should wake up every
+    `interval` seconds; a late wake-up means a callback blocked the loop.
+
+    A watchdog thread notices a stall while it is still happening and records
+    what the loop thread is executing, so the warning names the culprit.
+    """
+
+    def __init__(self, threshold: float = LOOP_LAG_WARN, interval: Optional[float] = None):
+        self.threshold = threshold
+        self.interval = interval if interval is not None else max(threshold / 2, 0.01)
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0  # EWMA
+        self.last_culprit: Optional[str] = None
+        self._beat = 0.0
+        self._culprit: Optional[str] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[threading.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start the heartbeat task and watchdog thread (no-op if running or disabled)."""
+        if self.running or self.threshold <= 0:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._culprit = None
+        self._stop = threading.Event()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True).start()
+
+    async def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self.record(now - start - self.interval)
+
+    def _watch(self, stop: threading.Event):
+        while not stop.wait(self.interval):
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled > self.threshold and self._culprit is None:
+                self._culprit = _blocking_frame(self._loop_thread)
+
+    def record(self, lag: float):
+        """One heartbeat arrived `lag` seconds late."""
+        lag = max(0.0, lag)
+        self.max_lag = max(self.max_lag, lag)
+        self.avg_lag = 0.9 * self.avg_lag + 0.1 * lag
+        culprit, self._culprit = self._culprit, None
+        if lag > self.threshold:
+            self.stalls += 1
+            self.last_culprit = culprit or self.last_culprit
+            where = f" (in {culprit})" if culprit else ""
+            print(f"🐌 Event loop was blocked for {lag * 1000:.0f} ms{where}")
+
+    def format_stats(self) -> str:
+        return (f"🐌 Loop lag: avg {self.avg_lag * 1000:.1f} ms, max {self.max_lag * 1000:.0f} ms, "
+                f"{self.stalls} stalls over {self.threshold * 1000:.0f} ms"
+                + (f" (last in {self.last_culprit})" if self.last_culprit else ""))
+
+
+loop_monitor = LoopLagMonitor()
@@ -1,37 +1,424 @@
-import json
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from .config import CACHE_DIR
+from .config import (
+    CACHE_DIR, MAX_HISTORY_LEN, HISTORY_LEN_CHANNELS, HISTORY_LEN_GUILDS, HISTORY_CACHE_SIZE,
+    HISTORY_FLUSH_INTERVAL, HISTORY_FLUSH_BATCH, HISTORY_DURABILITY
+)
+from . import history_log
+from . import history_records
+from .history_buffer import ChannelHistory
+from .history_records import HistoryRecord
+from .async_io import run_blocking
 
-def load_channel_history(channel_id):
+DURABILITY_MODES = ("batch", "immediate", "fsync")
+
+class HistoryStore:
+    """
+    In-memory, write-behind cache of per-channel chat history.
+
+    - Reads hit memory; a channel's file is only read on its first access.
+    - Each channel keeps its newest `max_len` entries in a ring buffer
+      (src/history_buffer.py); channel and guild overrides (HISTORY_LEN_OVERRIDES)
+      set a different length for some of them.
+    - Changes mark the channel dirty; a background task flushes dirty channels
+      every `flush_interval` seconds or once `flush_batch` changes have piled up.
+    - At most `max_channels` histories are kept in memory (LRU); a dirty channel
+      is written out before it is evicted.
+    - On disk each channel is an append-only log (src/history_log.py): a flush
+      appends only the new entries, and the log is compacted down to the
+      retained entries once it grows past `compact_factor` times the capacity.
+    - Entries with an "id" (the Discord message id, src/history_records.py) are
+      stored once per channel: appending an id that is already there is a no-op.
+      Older logs are migrated to the canonical schema (and deduplicated) on read.
+    - In memory entries are compact, read-only HistoryRecords; get() returns
+      them (they compare equal to, and read like, the dicts stored on disk).
+
+    Durability modes:
+    - "batch": write-behind as above (a crash can lose up to `flush_interval` seconds).
+    - "immediate": every change is written before returning.
+    - "fsync": like "immediate", and also fsync'd to disk.
+    When the flush task is not running (tests, scripts) changes are written immediately.
+
+    All disk access runs on one worker thread (reads and writes stay in order),
+    so a slow disk never blocks the event loop; the in-memory state is only
+    touched on the loop.
+    """
+
+    def __init__(
+        self,
+        cache_dir=CACHE_DIR,
+        max_channels=HISTORY_CACHE_SIZE,
+        flush_interval=HISTORY_FLUSH_INTERVAL,
+        flush_batch=HISTORY_FLUSH_BATCH,
+        durability=HISTORY_DURABILITY,
+        max_len=MAX_HISTORY_LEN,
+        compact_factor=2,
+        channel_limits=None,
+        guild_limits=None,
+    ):
+        """
+        Args:
+            max_len: Entries kept per channel (None = unbounded).
+            channel_limits: {channel id: entries kept} overriding max_len.
+            guild_limits: {guild id: entries kept} for the channels of a guild
+                (a channel's guild is learnt from the guild_id callers pass).
+        """
+        if durability not in DURABILITY_MODES:
+            print(f"⚠️ Unknown HISTORY_DURABILITY '{durability}', using 'batch'.")
+            durability = "batch"
+        self.cache_dir = Path(cache_dir)
+        self.max_channels = max(1, max_channels)
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self.durability = durability
+        self.max_len = max_len
+        self.compact_factor = max(1, compact_factor)
+        self.channel_limits = {str(k): v for k, v in (HISTORY_LEN_CHANNELS if channel_limits is None else channel_limits).items()}
+        self.guild_limits = {str(k): v for k, v in (HISTORY_LEN_GUILDS if guild_limits is None else guild_limits).items()}
+        self._guilds = {}  # channel -> guild id, as passed by callers
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._pending = {}  # channel -> entries appended since the last flush
+        self._rewrite = set()  # channels whose log must be rewritten, not appended to
+        self._log_lines = {}  # channel -> records currently in the on-disk log
+        self._pending_changes = 0
+        self._flush_wakeup = None
+        self._flusher = None
+        self._loading = {}  # channel -> future resolved when its disk read is done
+        self._generation = 0  # bumped by clear(): reads started and writes taken before it are dropped
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-io")
+        self._dir_ready = False  # cache_dir is created on the first write, not at import
+        self.evict_listeners = []  # `(channel_id, entry)` callables told about entries evicted from a full history
+
+    @property
+    def write_behind(self):
+        return self.durability == "batch" and self._flusher is not None and not self._flusher.done()
+
+    async def _io(self, func, *args):
+        return await run_blocking(func, *args, executor=self._executor)
+
+    def capacity(self, channel_id, guild_id=None):
+        """Entries kept for a channel: its own override, else its guild's, else max_len."""
+        channel_id = str(channel_id)
+        if channel_id in self.channel_limits:
+            return self.channel_limits[channel_id]
+        guild_id = str(guild_id) if guild_id is not None else self._guilds.get(channel_id)
+        return self.guild_limits.get(guild_id, self.max_len)
+
+    def _bind_guild(self, channel_id, guild_id):
+        """Remember a channel's guild; a cached history is resized if that changes its capacity."""
+        if guild_id is None or self._guilds.get(channel_id) == str(guild_id):
+            return
+        self._guilds[channel_id] = str(guild_id)
+        history = self._cache.get(channel_id)
+        if history is not None:
+            self._resize(channel_id, history, self.capacity(channel_id))
+
+    def _resize(self, channel_id, history, capacity):
+        if capacity == history.capacity:
+            return
+        size = len(history)
+        history.resize(capacity)
+        if len(history) < size:  # Entries were dropped: the log is rewritten
+            self._pending.pop(channel_id, None)
+            self._rewrite.add(channel_id)
+            self._dirty.add(channel_id)
+
+    def _read(self, channel_id, capacity):
+        """Read one channel from disk (worker thread). Returns (history, log records, needs migration)."""
+        path = history_log.log_path(self.cache_dir, channel_id)
+        migrate = False
+        if path.exists():
+            history, good_size = history_log.read_log(path)
+            if good_size < path.stat().st_size:
+                history_log.repair(path, good_size)
+            log_lines = len(history)
+        else:
+            # Legacy JSON array: migrated to the log format on the next flush
+            history = history_log.read_legacy(history_log.legacy_path(self.cache_dir, channel_id))
+            log_lines = 0
+            migrate = bool(history)
+        history, changed = history_records.migrate(history)
+        return ChannelHistory(history, capacity), log_lines, migrate or changed
+
+    async def _load(self, channel_id):
+        while channel_id not in self._cache:
+            loading = self._loading.get(channel_id)
+            if loading is not None:
+                await asyncio.shield(loading)  # Someone else is reading this channel already
+                continue
+            loading = self._loading[channel_id] = asyncio.get_running_loop().create_future()
+            generation = self._generation
+            try:
+                history, log_lines, migrate = await self._io(self._read, channel_id, self.capacity(channel_id))
+            except Exception as e:
+                print(f"⚠️ Failed to load chat history for channel {channel_id}: {e}")
+                history, log_lines, migrate = ChannelHistory((), self.capacity(channel_id)), 0, False
+            finally:
+                del self._loading[channel_id]
+                loading.set_result(None)
+            # Dropped if the channel was set meanwhile, or clear() ran during the read
+            if channel_id not in self._cache and generation == self._generation:
+                self._log_lines[channel_id] = log_lines
+                if migrate:
+                    self._rewrite.add(channel_id)
+                await self._remember(channel_id, history)
+        self._cache.move_to_end(channel_id)
+        return self._cache[channel_id]
+
+    async def _remember(self, channel_id, history):
+        self._cache[channel_id] = history
+        self._cache.move_to_end(channel_id)
+        while len(self._cache) > self.max_channels:
+            oldest = next(iter(self._cache))
+            job = self._take(oldest)
+            self._forget(oldest)
+            if job is not None:
+                await self._write(*job)
+
+    def _forget(self, channel_id):
+        self._cache.pop(channel_id, None)
+        self._dirty.discard(channel_id)
+        self._pending.pop(channel_id, None)
+        self._rewrite.discard(channel_id)
+        self._log_lines.pop(channel_id, None)
+
+    async def _changed(self, channel_id):
+        self._dirty.add(channel_id)
+        if not self.write_behind:
+            await self.flush_channel(channel_id)
+            return
+        self._pending_changes += 1
+        if self._pending_changes >= self.flush_batch:
+            self._flush_wakeup.set()
+
+    async def get(self, channel_id, guild_id=None, last=None):
+        """
+        Return a copy of the channel's history (a list of HistoryRecords).
+
+        Args:
+            guild_id: The channel's guild (selects its HISTORY_LEN_OVERRIDES entry).
+            last: Only the newest `last` entries.
+        """
+        self._bind_guild(channel_id, guild_id)
+        history = await self._load(channel_id)
+        return history.tail(last) if last is not None else list(history)
+
+    async def set(self, channel_id, history, guild_id=None):
+        """Replace the channel's history (the log is rewritten on the next flush)."""
+        self._bind_guild(channel_id, guild_id)
+        await self._remember(channel_id, ChannelHistory(history, self.capacity(channel_id)))
+        self._pending.pop(channel_id, None)
+        self._rewrite.add(channel_id)
+        await self._changed(channel_id)
+
+    async def append(self, channel_id, entry, max_len=None, guild_id=None):
+        """
+        Append one entry; once the channel's history is full the oldest entry is evicted.
+
+        Args:
+            max_len: Resize the channel's history to this many entries first
+                (default: keep its capacity, see capacity()).
+            guild_id: The channel's guild (selects its HISTORY_LEN_OVERRIDES entry).
+
+        Returns:
+            bool: False if an entry with the same "id" is already in the history (nothing changed).
+        """
+        entry = HistoryRecord.from_dict(entry)
+        self._bind_guild(channel_id, guild_id)
+        history = await self._load(channel_id)
+        if entry.id is not None and entry.id in history:
+            return False
+        if max_len is not None:
+            self._resize(channel_id, history, max_len)
+        evicted = history.append(entry)
+        if evicted is not None:
+            for listener in self.evict_listeners:
+                listener(channel_id, evicted)
+        if channel_id not in self._rewrite:
+            self._pending.setdefault(channel_id, []).append(entry)
+        await self._changed(channel_id)
+        return True
+
+    def _take(self, channel_id):
+        """
+        Snapshot the unsaved changes of one channel on the event loop.
+
+        Returns:
+            A (write function, channel_id, records, generation) job for _write(), or None if clean.
+        """
+        if channel_id not in self._dirty:
+            return None
+        self._dirty.discard(channel_id)
+        history = self._cache[channel_id]
+        pending = self._pending.pop(channel_id, [])
+        log_lines = self._log_lines.get(channel_id, 0) + len(pending)
+        limit = max(history.capacity or len(history), 1) * self.compact_factor
+        if channel_id in self._rewrite or log_lines > limit:
+            self._rewrite.discard(channel_id)
+            self._log_lines[channel_id] = len(history)
+            return self._compact, channel_id, list(history), self._generation
+        self._log_lines[channel_id] = log_lines
+        return self._append, channel_id, pending, self._generation
+
+    def _compact(self, channel_id, history):
+        self._ensure_dir()
+        history_log.compact(history_log.log_path(self.cache_dir, channel_id),
+                            [record.to_dict() for record in history], fsync=self.durability == "fsync")
+        legacy = history_log.legacy_path(self.cache_dir, channel_id)
+        if legacy.exists():
+            legacy.unlink()
+
+    def _append(self, channel_id, records):
+        self._ensure_dir()
+        history_log.append_records(history_log.log_path(self.cache_dir, channel_id),
+                                   [record.to_dict() for record in records], fsync=self.durability == "fsync")
+
+    def _ensure_dir(self):
+        if not self._dir_ready:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._dir_ready = True
+
+    async def _write(self, func, channel_id, records, generation):
+        if generation != self._generation:
+            return  # Taken before clear()/wipe(): writing it would bring the cleared history back
+        try:
+            await self._io(func, channel_id, records)
+        except Exception as e:
+            print(f"⚠️ Failed to save chat history for channel {channel_id}: {e}")
+            if channel_id in self._cache:
+                self._rewrite.add(channel_id)  # The next flush rewrites the whole log
+
+    async def flush_channel(self, channel_id):
+        """Write one channel to disk if it has unsaved changes."""
+        job = self._take(channel_id)
+        if job is not None:
+            await self._write(*job)
+
+    async def flush(self):
+        """Write every dirty channel to disk."""
+        self._pending_changes = 0
+        jobs = [job for job in map(self._take, list(self._dirty)) if job is not None]
+        for job in jobs:
+            await self._write(*job)
+
+    def clear(self):
+        """Forget every cached history without writing it."""
+        self._generation += 1
+        self._cache.clear()
+        self._dirty.clear()
+        self._pending.clear()
+        self._rewrite.clear()
+        self._log_lines.clear()
+        self._pending_changes = 0
+
+    def _delete_files(self):
+        removed = 0
+        for suffix in (history_log.LOG_SUFFIX, history_log.LEGACY_SUFFIX):
+            for f in self.cache_dir.glob(f"*{suffix}"):
+                try:
+                    f.unlink()
+                    removed += 1
+                except Exception as e:
+                    print(f"⚠️ Failed to delete cache file {f}: {e}")
+        return removed
+
+    async def wipe(self):
+        """Forget every history and delete the files (after any writes still queued)."""
+        self.clear()
+        return await self._io(self._delete_files)
+
+    def start(self):
+        """Start the background flush task (no-op if already running)."""
+        if self.durability != "batch" or self.write_behind:
+            return
+        self._flush_wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """Stop the flush task and write out everything still dirty."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+history_store = HistoryStore()
+
+async def load_channel_history(channel_id, guild_id=None):
     """
-    Load chat history for a specific channel from a file.
+    Load chat history for a specific channel (served from memory after the first read).
 
     Args:
         channel_id (str): The ID of the channel to load history for.
+        guild_id (int, optional): The channel's guild, for per-guild history lengths.
 
     Returns:
         list: The chat history as a list of messages, or an empty list if no history is found.
     """
-    file_path = CACHE_DIR / f"{channel_id}.lb01"
-    if file_path.exists():
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️ Failed to load chat history for channel {channel_id}: {e}")
-    return []
+    return await history_store.get(str(channel_id), guild_id=guild_id)
 
-def save_channel_history(channel_id, history):
+async def save_channel_history(channel_id, history):
     """
-    Save chat history for a specific channel to a file.
+    Save chat history for a specific channel. The write to disk happens in the
+    background according to HISTORY_DURABILITY.
 
     Args:
         channel_id (str): The ID of the channel to save history for.
         history (list): The chat history to save.
     """
-    file_path = CACHE_DIR / f"{channel_id}.lb01"
-    try:
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(history, f)
-    except Exception as e:
-        print(f"⚠️ Failed to save chat history for channel {channel_id}: {e}")
\ No newline at end of file
+    await history_store.set(str(channel_id), history)
+
+async def append_channel_history(channel_id, entry, max_len=None, guild_id=None):
+    """
+    Append a single entry to a channel's history; the oldest entry is evicted
+    once the channel holds its configured number of entries.
+
+    Args:
+        channel_id (str): The ID of the channel.
+        entry (dict or HistoryRecord): The history entry to append (src/history_records.py).
+        max_len (int, optional): Resize the channel's history to this many entries.
+        guild_id (int, optional): The channel's guild, for per-guild history lengths.
+
+    Returns:
+        bool: False if the entry's message id was already in the history.
+    """
+    return await history_store.append(str(channel_id), entry, max_len=max_len, guild_id=guild_id)
+
+async def ingest_message(message):
+    """
+    Store a user's Discord message in its channel's history. This is the one
+    place user messages enter the history (bot.on_message calls it for every
+    message it accepts); a message already stored is not stored again.
+
+    Args:
+        message (discord.Message): The message, with its content as the model should see it.
+
+    Returns:
+        bool: False if the message was already in the history.
+    """
+    guild_id = message.guild.id if message.guild else None
+    return await append_channel_history(message.channel.id, history_records.user_record(message), guild_id=guild_id)
+
+async def clear_channel_histories():
+    """
+    Drop every cached history (memory and disk).
+
+    Returns:
+        int: Number of history files removed.
+    """
+    return await history_store.wipe()
@@ -0,0 +1,70 @@
+"""Per-provider circuit breaker used by the LLM router (src/router.py)."""
+import time
+from typing import Optional
+
+from .config import LLM_BREAKER_FAILURES, LLM_BREAKER_RESET, LLM_SLOW_CALL
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitBreaker:
+    """
+    closed:    requests flow; `failure_threshold` failures in a row open the circuit
+    open:      no requests for `reset_timeout` seconds
+    half-open: a single probe request is let through; success closes the
+               circuit, failure opens it again
+
+    A successful call slower than `slow_call` seconds counts as a failure
+    (0 disables this).
+    """
+    __slots__ = ("failure_threshold", "reset_timeout", "slow_call", "state",
+                 "failures", "opened_at", "probing", "trips")
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_FAILURES,
+        reset_timeout: float = LLM_BREAKER_RESET,
+        slow_call: float = LLM_SLOW_CALL,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether a request may be sent now (does not change the state)."""
+        if self.state == CLOSED:
+            return True
+        if self.probing:
+            return False
+        if self.state == OPEN:
+            now = time.monotonic() if now is None else now
+            return now - self.opened_at >= self.reset_timeout
+        return True  # half-open, probe not sent yet
+
+    def on_request(self):
+        """A request was sent; an open circuit past its timeout becomes half-open with this probe."""
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self.probing = True
+
+    def abandon(self):
+        """A request was cancelled before it had an outcome (e.g. a hedge that lost)."""
+        self.probing = False
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        """Outcome of a request sent after on_request()."""
+        self.probing = False
+        if ok and not (self.slow_call and latency is not None and latency > self.slow_call):
+            self.failures = 0
+            self.state = CLOSED
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.trips += 1
@@ -0,0 +1,165 @@
+"""Long-lived, pooled LLM clients shared by every completion request."""
+import asyncio
+from typing import Dict, List, Optional
+
+from .config import (
+    PROVIDER_FILE, MODELS_FILE, LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE,
+    LLM_KEEPALIVE_EXPIRY, LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_MAX_RETRIES
+)
+from .provider_config import ConfigParseError, load_providers, load_models
+from .async_io import run_blocking
+
+# How long a client replaced by reload() may stay open for requests still using it
+RETIRED_CLIENT_GRACE = 300.0
+
+
+class ClientRegistry:
+    """
+    Parses provider.txt/models.txt once and keeps one openai.AsyncOpenAI client
+    (and therefore one HTTP connection pool) per provider.
+
+    Clients are created lazily on first use and live until aclose() is called.
+    The router checks clients out per request (checkout()/checkin()), so reload()
+    can swap in new clients and close each old one once nothing uses it.
+    """
+
+    def __init__(
+        self,
+        provider_file: str = PROVIDER_FILE,
+        models_file: str = MODELS_FILE,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_MAX_KEEPALIVE,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        timeout: float = LLM_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        retired_grace: float = RETIRED_CLIENT_GRACE,
+    ):
+        self.provider_file = provider_file
+        self.models_file = models_file
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self._providers: Optional[List[dict]] = None
+        self._models: Optional[List[dict]] = None
+        self.retired_grace = retired_grace
+        self._clients: Dict[str, object] = {}
+        self._leases: Dict[object, int] = {}  # client -> requests using it
+        self._retired: Dict[object, str] = {}  # client replaced by reload() -> provider name, until it is closed
+        self._timers = set()  # grace period tasks of retired clients
+
+    def load(self, force: bool = False):
+        """Parse the config files (only once unless force=True)."""
+        if self._providers is None or force:
+            providers = load_providers(self.provider_file)
+            models = load_models(self.models_file)
+            if not providers or not models:
+                raise ConfigParseError("No providers or models configured.")
+            self._providers, self._models = providers, models
+
+    @property
+    def providers(self) -> List[dict]:
+        self.load()
+        return self._providers
+
+    @property
+    def models(self) -> List[dict]:
+        self.load()
+        return self._models
+
+    def _build_client(self, provider: dict):
+        import httpx
+        import openai
+
+        # Handle keyless providers (when apiKey is blank/empty)
+        api_key = provider.get("apikey", "").strip()
+        timeout = openai.Timeout(self.timeout, connect=self.connect_timeout)
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=timeout,
+        )
+        return openai.AsyncOpenAI(
+            api_key=api_key or "not-required",
+            base_url=provider["baseurl"],
+            timeout=timeout,
+            max_retries=self.max_retries,
+            http_client=http_client,
+        )
+
+    def get_client(self, provider: dict):
+        """Return the shared client for a provider entry, creating it on first use."""
+        key = provider["name"].lower()
+        client = self._clients.get(key)
+        if client is None:
+            client = self._build_client(provider)
+            self._clients[key] = client
+        return client
+
+    def checkout(self, provider: dict):
+        """The provider's client, counted as in use until checkin()."""
+        client = self.get_client(provider)
+        self._leases[client] = self._leases.get(client, 0) + 1
+        return client
+
+    async def checkin(self, client):
+        """A request is done with `client`; a retired client is closed once nothing uses it."""
+        count = self._leases.get(client, 0) - 1
+        if count > 0:
+            self._leases[client] = count
+            return
+        self._leases.pop(client, None)
+        name = self._retired.pop(client, None)
+        if name is not None:
+            await self._close(name, client)
+
+    async def _close(self, name: str, client):
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"⚠️ Failed to close LLM client for provider {name}: {e}")
+
+    async def aclose(self):
+        """Close every pooled client, retired ones included (call on shutdown)."""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        clients, self._clients = self._clients, {}
+        retired, self._retired = self._retired, {}
+        self._leases.clear()
+        for name, client in list(clients.items()) + [(name, client) for client, name in retired.items()]:
+            await self._close(name, client)
+
+    async def _close_after_grace(self, client):
+        await asyncio.sleep(self.retired_grace)
+        name = self._retired.pop(client, None)
+        if name is not None:
+            print(f"⚠️ Closing replaced LLM client for provider {name} with requests still using it")
+            self._leases.pop(client, None)
+            await self._close(name, client)
+
+    async def reload(self):
+        """
+        Re-read the config files (in a worker thread) and build new clients from now on.
+        Old clients stay open for the requests still using them and are closed when the
+        last one is done, or after `retired_grace` seconds at the latest.
+        """
+        await run_blocking(self.load, force=True)
+        clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            if not self._leases.get(client):
+                await self._close(name, client)
+                continue
+            self._retired[client] = name
+            timer = asyncio.create_task(self._close_after_grace(client))
+            self._timers.add(timer)
+            timer.add_done_callback(self._timers.discard)
+
+
+registry = ClientRegistry()
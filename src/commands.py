@@ -1,11 +1,25 @@
+import contextlib
 import discord
 from discord import app_commands
-from .config import CACHE_DIR, ALLOWED_CHANNELS, ALLOWED_GUILD_IDS, ALLOWED_GUILD_NAMES, USE_GUILD_ID
+from .config import ALLOWED_CHANNELS, ALLOWED_GUILD_IDS, ALLOWED_GUILD_NAMES, USE_GUILD_ID
 from src.llm_client import request_completion
-from .cache_utils import load_channel_history, save_channel_history
-from .utils import get_error, send_error
+from .cache_utils import append_channel_history, clear_channel_histories
+from .history_records import assistant_record
+from .summarizer import summarizer
+from .retrieval import retriever
+from .utils import send_error
+
+def register_commands(tree, bot, scheduler=None):
+    """
+    Register the slash commands.
+
+    Args:
+        scheduler: The bot's ChannelScheduler; slash commands take its next free
+            LLM slot ahead of queued chat.
+    """
+    def llm_slot():
+        return scheduler.slot() if scheduler is not None else contextlib.nullcontext()
 
-def register_commands(tree, bot):
     @tree.command(name="clearcontext", description="Clear all context, cache, and bot memory for privacy or a fresh start.")
     async def clearcontext(interaction: discord.Interaction):
         try:
@@ -24,13 +38,9 @@ def register_commands(tree, bot):
                 code="INTERACTION_FAILED")
             return
 
-        cleared_files = 0
-        for f in CACHE_DIR.glob("*.lb01"):
-            try:
-                f.unlink()
-                cleared_files += 1
-            except Exception as e:
-                print(get_error(e, prefix=f"⚠️ Failed to delete cache file {f}"))
+        cleared_files = await clear_channel_histories()
+        cleared_files += await summarizer.wipe()
+        cleared_files += await retriever.wipe()
 
         try:
             await interaction.followup.send(
@@ -56,14 +66,15 @@ def register_commands(tree, bot):
             # Build prompt
             prompt = f"Tell me a joke about {about}" if about else "Tell me a joke"
 
-            # Get joke from AI
-            ai_response = await request_completion(
-                messages=[
-                    {"role": "system", "content": "You are a funny AI assistant. Tell a short, clean joke."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.8
-            )
+            # Get joke from AI (priority lane: ahead of queued chat)
+            async with llm_slot():
+                ai_response = await request_completion(
+                    messages=[
+                        {"role": "system", "content": "You are a funny AI assistant. Tell a short, clean joke."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.8
+                )
 
             # Update joke_text if AI provided a response
             if ai_response:
@@ -79,18 +90,14 @@ def register_commands(tree, bot):
             # Send the final response (either AI joke or fallback/error) ONCE
             if not response_sent and not interaction.is_expired():
                 try:
-                    await interaction.followup.send(joke_text)
+                    sent = await interaction.followup.send(joke_text)
                     response_sent = True # Mark as sent
 
                     # Save the ACTUAL sent message to history
                     try:
-                        history = load_channel_history(str(interaction.channel_id))
-                        history.append({
-                            "role": "assistant",
-                            "content": joke_text, # Save the final text that was sent
-                            "type": "joke"
-                        })
-                        save_channel_history(str(interaction.channel_id), history)
+                        await append_channel_history(str(interaction.channel_id), assistant_record(
+                            joke_text, sent, type="joke" # Save the final text that was sent
+                        ), guild_id=interaction.guild_id)
                     except Exception as hist_e:
                         print(f"⚠️ Failed to save joke to history: {hist_e}")
 
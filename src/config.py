@@ -1,9 +1,11 @@
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-from src.provider_config import load_providers, load_models
 
-# Load environment variables from .env file
+# Load environment variables from .env file. This stays an import-time step on purpose:
+# every setting below is read from the environment when this module is imported, and the
+# rest of the bot imports them as constants, so .env must be applied first. It only reads
+# one small local file (well under 1 ms); the dotenv import itself is about 12 ms.
 load_dotenv()
 
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
@@ -16,9 +18,17 @@ DISCORD_GUILD_NAMES_STR = os.getenv('DISCORD_GUILD', '')
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.7))
 DISABLE_STREAM = os.getenv('DISABLE_STREAM', 'false').lower() in ['1', 'true', 'yes']
 STREAM_CHAR = int(os.getenv('STREAM_CHAR', '50'))
+# Streamed message edits: seconds between frames (adapts up to the max) and edits per reply
+STREAM_INTERVAL = float(os.getenv('STREAM_INTERVAL', '1.0'))
+STREAM_MAX_INTERVAL = float(os.getenv('STREAM_MAX_INTERVAL', '5.0'))
+STREAM_MAX_EDITS = int(os.getenv('STREAM_MAX_EDITS', '30'))
 DEBUG = os.getenv('DEBUG', 'false').lower() in ['1', 'true', 'yes']
 
 DYNAMIC = os.getenv('DYNAMIC', 'true').lower() in ['1', 'true', 'yes']
+# DYNAMIC mode: cheap rules decide respond/skip/ask-the-model before any LLM call;
+# RELEVANCE_AUDIT_RATE of the skipped messages still go to the model to measure the rules
+RELEVANCE_GATE = os.getenv('RELEVANCE_GATE', 'true').lower() in ['1', 'true', 'yes']
+RELEVANCE_AUDIT_RATE = float(os.getenv('RELEVANCE_AUDIT_RATE', '0.05'))
 
 WELCOME_MSG = os.getenv('WELCOME_MSG', 'true').lower() in ['1', 'true', 'yes']
 
@@ -34,14 +44,117 @@ else:
 
 # MODEL_TO_USE now resolved via provider/model loader
 
-# Set up cache directory for storing chat history
+# Directory for chat history (created by the history store on its first write)
 CACHE_DIR = Path(os.getenv("CACHE_DIR", "./cache"))
-CACHE_DIR.mkdir(exist_ok=True)
 
 # Model config folder (for provider/models config files, default: ./model)
 M_CFG_FOLDER = os.getenv("M_CFG_FOLDER", "./model")
-# TODO: Pass M_CFG_FOLDER to load_providers/load_models if supporting custom locations
-MAX_HISTORY_LEN = 200
+PROVIDER_FILE = os.path.join(M_CFG_FOLDER, "provider.txt")
+MODELS_FILE = os.path.join(M_CFG_FOLDER, "models.txt")
+
+def parse_history_limits(spec):
+    """
+    Parse HISTORY_LEN_OVERRIDES: comma-separated `<channel id>=<entries>` or
+    `guild:<guild id>=<entries>` pairs. Malformed pairs are skipped.
+
+    Returns:
+        tuple: ({channel id: entries}, {guild id: entries})
+    """
+    channels, guilds = {}, {}
+    for pair in spec.split(','):
+        key, _, value = pair.partition('=')
+        key, value = key.strip(), value.strip()
+        target = channels
+        if key.lower().startswith('guild:'):
+            key, target = key[len('guild:'):].strip(), guilds
+        if key.isdigit() and value.isdigit():
+            target[int(key)] = int(value)
+        elif pair.strip():
+            print(f"⚠️ Ignoring malformed HISTORY_LEN_OVERRIDES entry '{pair.strip()}'")
+    return channels, guilds
+
+# Chat history entries kept per channel, with overrides for some channels/guilds
+# (e.g. HISTORY_LEN_OVERRIDES=123456789012345678=50,guild:876543210987654321=400)
+MAX_HISTORY_LEN = int(os.getenv("MAX_HISTORY_LEN", "200"))
+HISTORY_LEN_CHANNELS, HISTORY_LEN_GUILDS = parse_history_limits(os.getenv("HISTORY_LEN_OVERRIDES", ""))
+
+# Rolling summary (opt-in): once more than SUMMARY_TRIGGER history entries of a channel are not covered by its
+# summary, all but the newest SUMMARY_KEEP are condensed into it in the background. Prompts then carry
+# the summary (at most SUMMARY_MAX_CHARS characters) plus only the entries it doesn't cover
+SUMMARY = os.getenv("SUMMARY", "false").lower() in ['1', 'true', 'yes']
+SUMMARY_TRIGGER = int(os.getenv("SUMMARY_TRIGGER", "60"))
+SUMMARY_KEEP = int(os.getenv("SUMMARY_KEEP", "30"))
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "2000"))
+
+# Local BM25 retrieval (opt-in): entries evicted from a channel's history are archived, and prompts carry
+# the newest RETRIEVAL_TAIL entries plus the RETRIEVAL_TOP_K older ones (window or archive) that best
+# match the message being answered. At most RETRIEVAL_MAX_ENTRIES entries are archived per channel
+RETRIEVAL = os.getenv("RETRIEVAL", "false").lower() in ['1', 'true', 'yes']
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+RETRIEVAL_TAIL = int(os.getenv("RETRIEVAL_TAIL", "20"))
+RETRIEVAL_MAX_ENTRIES = int(os.getenv("RETRIEVAL_MAX_ENTRIES", "5000"))
+
+# In-memory channel history cache (write-behind to CACHE_DIR)
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "500"))  # max channels kept in memory
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "5"))  # seconds between background flushes
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "50"))  # flush early after this many changes
+HISTORY_DURABILITY = os.getenv("HISTORY_DURABILITY", "batch").lower()  # batch | immediate | fsync
+
+# Blocking file I/O runs in worker threads; warn when the event loop is blocked longer than LOOP_LAG_WARN seconds (0 = off)
+IO_THREADS = int(os.getenv("IO_THREADS", "4"))
+LOOP_LAG_WARN = float(os.getenv("LOOP_LAG_WARN", "0.25"))
+
+# Prompt token budget (system prompt + history) when a model has no `context-tokens=` in models.txt
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "8000"))
+# Token counting: auto (tiktoken if installed, else estimate) | tiktoken | heuristic
+TOKENIZER = os.getenv("TOKENIZER", "auto").lower()
+
+# Server user list in the system prompt: auto | all | recent | mentioned | active, capped at USER_LIST_MAX members
+USER_LIST_STRATEGY = os.getenv("USER_LIST_STRATEGY", "auto").lower()
+USER_LIST_MAX = int(os.getenv("USER_LIST_MAX", "100"))
+
+# HTTP connection pool for LLM clients (one long-lived pool per provider)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# How requests are spread over the models in models.txt: first | weighted | least | latency (see src/router.py)
+LLM_ROUTING = os.getenv("LLM_ROUTING", "first").lower()
+
+# Failover: circuit breaker per provider (open after N failures in a row, probe again after RESET seconds;
+# successful calls slower than LLM_SLOW_CALL seconds count as failures, 0 = off) and the total time
+# a request may spend trying providers
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_SLOW_CALL = float(os.getenv("LLM_SLOW_CALL", "0"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "120"))
+
+# Hedging (opt-in): if the first token is later than the LLM_HEDGE_PERCENTILE of recent first-token
+# times (at least LLM_HEDGE_MIN_DELAY seconds), send a duplicate request and keep whichever answers first.
+# LLM_HEDGE_BUDGET caps hedges at that fraction of requests.
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ['1', 'true', 'yes']
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+
+# Max LLM requests in flight across all channels (each channel still replies in order)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+# Coalescing: messages that arrive while a channel's request is queued or in flight join
+# its next request. A queued request waits for COALESCE_WINDOW seconds of quiet in the
+# channel, but at most COALESCE_MAX_WAIT seconds; COALESCE_MAX_BATCH=1 turns merging off
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "0.75"))
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "4.0"))
+COALESCE_MAX_BATCH = int(os.getenv("COALESCE_MAX_BATCH", "10"))
+
+# Admission limits: messages waiting for the AI overall and per channel (the oldest ambient
+# ones are shed first), and REQUEST_MAX_AGE seconds after which a waiting message is dropped (0 = never)
+QUEUE_MAX = int(os.getenv("QUEUE_MAX", "100"))
+QUEUE_MAX_PER_CHANNEL = int(os.getenv("QUEUE_MAX_PER_CHANNEL", "20"))
+REQUEST_MAX_AGE = float(os.getenv("REQUEST_MAX_AGE", "120"))
 
 # Default instructions if bot.txt is missing or empty
 DEFAULT_INSTRUCTIONS = """
@@ -57,22 +170,20 @@ You are 'LousyBot' a discord bot created by 'LousyBook01'(www.github.com/LousyBo
 - So what else do i put here? .... GO BE YOURSELF :]
 """.strip()
 
-# Load custom instructions from bot.txt, fallback to default
-CUSTOM_INSTRUCTIONS = ""
-try:
-    with open("bot.txt", "r", encoding="utf-8") as f:
-        CUSTOM_INSTRUCTIONS = f.read().strip()
-    if CUSTOM_INSTRUCTIONS:
-        print("✅ Loaded custom instructions from bot.txt")
-    else:
+def load_instructions(path="bot.txt"):
+    """Load custom instructions from bot.txt, falling back to DEFAULT_INSTRUCTIONS."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            instructions = f.read().strip()
+        if instructions:
+            print("✅ Loaded custom instructions from bot.txt")
+            return instructions
         print("⚠️ bot.txt is empty, using default instructions.")
-        CUSTOM_INSTRUCTIONS = DEFAULT_INSTRUCTIONS
-except FileNotFoundError:
-    print("ℹ️ bot.txt not found, using default instructions.")
-    CUSTOM_INSTRUCTIONS = DEFAULT_INSTRUCTIONS
-except Exception as e:
-    print(f"❌ Error reading bot.txt: {e}. Using default instructions.")
-    CUSTOM_INSTRUCTIONS = DEFAULT_INSTRUCTIONS
+    except FileNotFoundError:
+        print("ℹ️ bot.txt not found, using default instructions.")
+    except Exception as e:
+        print(f"❌ Error reading bot.txt: {e}. Using default instructions.")
+    return DEFAULT_INSTRUCTIONS
 
 
 # AI client initialization and model/provider selection handled by your app logic using load_providers() and load_models()
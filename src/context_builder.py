@@ -0,0 +1,191 @@
+"""Token-budgeted context window for LLM requests."""
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from .config import CONTEXT_TOKENS, TOKENIZER
+from .history_records import HistoryRecord
+
+# Rough per-message framing cost in chat-completion APIs (role, separators)
+MESSAGE_OVERHEAD = 4
+# Don't bother keeping a truncated oldest entry smaller than this
+MIN_TRUNCATED_TOKENS = 32
+TRUNCATION_MARKER = "…"
+
+
+def heuristic_tokenizer(text: str) -> int:
+    """~4 characters per token, which is close enough for English chat."""
+    return (len(text) + 3) // 4
+
+
+def load_tokenizer(name: str = TOKENIZER) -> Callable[[str], int]:
+    """
+    Return a `text -> token count` function.
+
+    "tiktoken" uses tiktoken's cl100k_base encoding (optional dependency),
+    "heuristic" uses a chars/4 estimate, "auto" picks tiktoken when installed.
+    """
+    if name in ("auto", "tiktoken"):
+        try:
+            import tiktoken
+            encoding = tiktoken.get_encoding("cl100k_base")
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            if name == "tiktoken":
+                print(f"⚠️ tiktoken unavailable ({e}), estimating tokens instead.")
+    return heuristic_tokenizer
+
+
+class TokenCounter:
+    """
+    Counts tokens with a pluggable tokenizer and caches the count per text.
+    The default tokenizer is loaded on first use, not at import (tiktoken is
+    slow to import and may download its encoding); the bot loads it in a worker
+    thread during startup (bot.on_ready).
+    """
+
+    def __init__(self, tokenizer: Optional[Callable[[str], int]] = None, cache_size: int = 20000):
+        self._tokenizer = tokenizer
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+
+    @property
+    def tokenizer(self) -> Callable[[str], int]:
+        if self._tokenizer is None:
+            self._tokenizer = load_tokenizer()
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+        tokens = self.tokenizer(text)
+        self._cache[text] = tokens
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        return self.count(message["content"]) + MESSAGE_OVERHEAD
+
+    def truncate_head(self, text: str, max_tokens: int) -> str:
+        """Drop the start of `text` so the rest fits in max_tokens (binary search on length)."""
+        if self.tokenizer(text) <= max_tokens:
+            return text
+        lo, hi = 0, len(text)
+        while lo < hi:
+            keep = (lo + hi + 1) // 2
+            if self.tokenizer(TRUNCATION_MARKER + text[-keep:]) <= max_tokens:
+                lo = keep
+            else:
+                hi = keep - 1
+        return TRUNCATION_MARKER + text[-lo:] if lo else ""
+
+
+class ContextReport:
+    """What build_context() sent and how long it took."""
+    __slots__ = ("tokens", "budget", "included", "dropped", "truncated", "build_ms")
+
+    def __init__(self, tokens, budget, included, dropped, truncated, build_ms):
+        self.tokens = tokens
+        self.budget = budget
+        self.included = included
+        self.dropped = dropped
+        self.truncated = truncated
+        self.build_ms = build_ms
+
+    def __str__(self):
+        return (
+            f"🧮 Prompt: {self.tokens}/{self.budget} tokens, {self.included} history entries "
+            f"({self.dropped} dropped{', oldest truncated' if self.truncated else ''}), "
+            f"built in {self.build_ms:.2f} ms"
+        )
+
+
+def render_entry(entry: dict) -> Dict[str, str]:
+    """Turn a stored history entry into an API message."""
+    if isinstance(entry, HistoryRecord):
+        return entry.api_message()
+    if entry["role"] == "user":
+        content = (
+            f'{entry.get("name", "")}#{entry.get("discriminator", "????")} '
+            f'({entry.get("user_id", "unknown")}) says: {entry["content"]}'
+        )
+    else:
+        content = entry["content"]
+    return {"role": entry["role"], "content": content}
+
+
+def render_transcript(entries) -> str:
+    """History entries as plain text, one per line ("name#discriminator (id) says: ..." for users)."""
+    lines = []
+    for entry in entries:
+        content = render_entry(entry)["content"]
+        lines.append(content if entry.get("role") == "user" else f"You (the bot): {content}")
+    return "\n".join(lines)
+
+
+def build_context(
+    system_prompt: Optional[str],
+    history: List[dict],
+    budget: int,
+    counter: Optional["TokenCounter"] = None,
+):
+    """
+    Build the message list for one request: the system prompt, then as many
+    history entries as fit in `budget` tokens, filled newest-first. The oldest
+    entry that does not fit is truncated (its start dropped) if enough room
+    is left, and everything older is dropped.
+
+    Returns:
+        tuple: (messages, ContextReport)
+    """
+    counter = counter or token_counter
+    start = time.perf_counter()
+    used = 0
+    head = []
+    if system_prompt:
+        head.append({"role": "system", "content": system_prompt})
+        used += counter.message_tokens(head[0])
+
+    selected = []
+    truncated = False
+    for entry in reversed(history):
+        message = render_entry(entry)
+        tokens = counter.message_tokens(message)
+        if used + tokens <= budget:
+            selected.append(message)
+            used += tokens
+            continue
+        room = budget - used - MESSAGE_OVERHEAD
+        if room >= MIN_TRUNCATED_TOKENS or not selected:
+            content = counter.truncate_head(message["content"], max(room, 0))
+            if content:
+                selected.append({"role": message["role"], "content": content})
+                used += counter.message_tokens(selected[-1])
+                truncated = True
+        break
+
+    selected.reverse()
+    report = ContextReport(
+        tokens=used,
+        budget=budget,
+        included=len(selected),
+        dropped=len(history) - len(selected),
+        truncated=truncated,
+        build_ms=(time.perf_counter() - start) * 1000,
+    )
+    return head + selected, report
+
+
+def context_budget(model: Optional[dict]) -> int:
+    """Prompt token budget for a models.txt entry (`context-tokens=`), else CONTEXT_TOKENS."""
+    if model:
+        value = model.get("context-tokens", "").strip()
+        if value.isdigit():
+            return int(value)
+    return CONTEXT_TOKENS
+
+
+token_counter = TokenCounter()
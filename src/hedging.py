@@ -0,0 +1,93 @@
+"""Hedged LLM requests: when and how often the router may duplicate a slow request."""
+from collections import deque
+from typing import Optional
+
+from .config import LLM_HEDGE, LLM_HEDGE_PERCENTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_BUDGET
+
+MIN_SAMPLES = 20  # Below this many first-token samples the delay is LLM_HEDGE_MIN_DELAY
+
+
+class HedgePolicy:
+    """
+    Decides when a request whose first token is late gets a duplicate (hedge).
+
+    - delay(): the `percentile` of recent time-to-first-token samples (never
+      below `min_delay`), so only the slowest few percent of requests hedge
+    - budget: every request earns `budget` tokens and a hedge costs one, so
+      hedges add at most that fraction of extra load (with a small burst)
+    """
+    __slots__ = ("enabled", "percentile", "min_delay", "budget", "max_tokens", "tokens",
+                 "_samples", "requests", "fired", "won", "denied")
+
+    def __init__(
+        self,
+        enabled: bool = LLM_HEDGE,
+        percentile: float = LLM_HEDGE_PERCENTILE,
+        min_delay: float = LLM_HEDGE_MIN_DELAY,
+        budget: float = LLM_HEDGE_BUDGET,
+        window: int = 200,
+        max_tokens: float = 3.0,
+    ):
+        self.enabled = enabled
+        self.percentile = min(max(percentile, 0.0), 100.0)
+        self.min_delay = min_delay
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self._samples = deque(maxlen=window)
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.denied = 0
+
+    def observe(self, first_token_seconds: float):
+        """Record how long a request took to produce its first token."""
+        self._samples.append(first_token_seconds)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait for the first token before hedging (None = hedging off)."""
+        if not self.enabled:
+            return None
+        if len(self._samples) < MIN_SAMPLES:
+            return self.min_delay
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    def on_request(self):
+        """A new (primary) request started: it earns hedge budget."""
+        self.requests += 1
+        self.tokens = min(self.max_tokens, self.tokens + self.budget)
+
+    def allow(self) -> bool:
+        """Whether there is budget for one more hedge (counted as denied if not)."""
+        if self.tokens >= 1.0:
+            return True
+        self.denied += 1
+        return False
+
+    def spend(self):
+        """A hedge was sent."""
+        self.tokens -= 1.0
+        self.fired += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "fired": self.fired,
+            "won": self.won,
+            "denied": self.denied,
+            "fire_rate": self.fired / self.requests if self.requests else 0.0,
+            "win_rate": self.won / self.fired if self.fired else 0.0,
+            "delay_ms": (self.delay() or 0.0) * 1000,
+        }
+
+    def format_stats(self) -> str:
+        s = self.stats()
+        if not s["enabled"]:
+            return "🪁 Hedging: off"
+        return (
+            f"🪁 Hedging: fired {s['fired']} ({s['fire_rate']:.1%} of {s['requests']} requests), "
+            f"won {s['won']} ({s['win_rate']:.0%}), {s['denied']} over budget, delay {s['delay_ms']:.0f} ms"
+        )
@@ -0,0 +1,98 @@
+"""
+Fixed-capacity history of one channel.
+
+A ChannelHistory is a ring buffer (a deque with maxlen) of HistoryRecords, oldest
+first. Appending to a full history evicts the oldest entry in O(1) instead of
+copying the list to trim it. It also tracks the message ids it holds, so the
+store can drop a message it already has without scanning the history.
+"""
+from collections import deque
+from itertools import islice
+from typing import Iterable, List, Optional
+
+from .history_records import HistoryRecord
+
+
+class ChannelHistory:
+    __slots__ = ("_entries", "_ids")
+
+    def __init__(self, entries: Iterable = (), capacity: Optional[int] = None):
+        """
+        Args:
+            entries: Initial entries, oldest first (dicts or HistoryRecords);
+                only the newest `capacity` are kept.
+            capacity: Max entries kept (None = unbounded).
+        """
+        self._entries = deque(map(HistoryRecord.from_dict, entries), maxlen=capacity)
+        self._ids = {entry.id for entry in self._entries if entry.id is not None}
+
+    @property
+    def capacity(self) -> Optional[int]:
+        return self._entries.maxlen
+
+    def resize(self, capacity: Optional[int]):
+        """Change the capacity; shrinking drops the oldest entries."""
+        if capacity == self._entries.maxlen:
+            return
+        self._entries = deque(self._entries, maxlen=capacity)
+        self._ids = {entry.id for entry in self._entries if entry.id is not None}
+
+    def __contains__(self, message_id) -> bool:
+        """Whether the entry for this message id is in the history."""
+        return message_id in self._ids
+
+    def append(self, entry) -> Optional[HistoryRecord]:
+        """
+        Add an entry as the newest one.
+
+        Returns:
+            The entry evicted to make room, if the history was full.
+        """
+        if type(entry) is not HistoryRecord:
+            entry = HistoryRecord.from_dict(entry)
+        entries = self._entries
+        evicted = None
+        if len(entries) == entries.maxlen:
+            if not entries:
+                return entry  # Capacity 0 keeps nothing
+            evicted = entries[0]
+            if evicted.id is not None:
+                self._ids.discard(evicted.id)
+        entries.append(entry)
+        if entry.id is not None:
+            self._ids.add(entry.id)
+        return evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __reversed__(self):
+        return reversed(self._entries)
+
+    def __getitem__(self, index):
+        """An entry, or a list of entries for a slice (only the sliced part is walked)."""
+        if not isinstance(index, slice):
+            return self._entries[index]
+        start, stop, step = index.indices(len(self._entries))
+        if step < 0:
+            return list(self._entries)[index]
+        if start > len(self._entries) // 2:
+            # Walk from the newest end, e.g. history[-20:]
+            newest = list(islice(reversed(self._entries), len(self._entries) - start))
+            newest.reverse()
+            return newest[:max(stop - start, 0):step]
+        return list(islice(self._entries, start, stop, step))
+
+    def tail(self, n: int) -> List[HistoryRecord]:
+        """The newest n entries, oldest first (the candidates for a context window)."""
+        return self[-n:] if n > 0 else []
+
+    def to_records(self) -> List[dict]:
+        """The entries as plain dicts, oldest first, in the canonical key order (what goes on disk)."""
+        return [entry.to_dict() for entry in self._entries]
+
+    def __repr__(self):
+        return f"ChannelHistory({len(self._entries)}/{self._entries.maxlen} entries)"
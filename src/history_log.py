@@ -0,0 +1,96 @@
+"""
+Append-only on-disk format for channel history.
+
+Each channel has one `<channel_id>.lb02` segment holding one JSON record per line.
+Adding a message appends a single line (O(1) no matter how long the history is);
+compact() atomically rewrites the segment down to the retained window.
+
+A crash in the middle of an append leaves at most one torn (newline-less) last
+record. read_log() skips it and repair() truncates it, so the tail is recovered.
+Legacy `<channel_id>.lb01` files (one JSON array) are still readable and are
+migrated to the log format the first time the channel is written.
+"""
+import json
+import os
+from pathlib import Path
+
+LOG_SUFFIX = ".lb02"
+LEGACY_SUFFIX = ".lb01"
+
+def log_path(cache_dir, channel_id):
+    return Path(cache_dir) / f"{channel_id}{LOG_SUFFIX}"
+
+def legacy_path(cache_dir, channel_id):
+    return Path(cache_dir) / f"{channel_id}{LEGACY_SUFFIX}"
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+def read_log(file_path):
+    """
+    Read every intact record of a log segment.
+
+    Returns:
+        tuple: (records, good_size) where good_size is the byte length of the
+        intact prefix. good_size is smaller than the file when the last record is torn.
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return [], 0
+    data = file_path.read_bytes()
+    records = []
+    good_size = 0
+    start = 0
+    while True:
+        end = data.find(b"\n", start)
+        if end == -1:
+            break  # no trailing newline: torn last record (or EOF)
+        line = data[start:end]
+        start = end + 1
+        good_size = start
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            print(f"⚠️ Skipping corrupt history record in {file_path.name}")
+    if good_size < len(data):
+        print(f"⚠️ Skipping torn last history record in {file_path.name} ({len(data) - good_size} bytes)")
+    return records, good_size
+
+def repair(file_path, good_size):
+    """Truncate a torn last record so the next append starts on a clean line."""
+    with open(file_path, "r+b") as f:
+        f.truncate(good_size)
+
+def append_records(file_path, records, fsync=False):
+    """Append records to a log segment, one line each."""
+    if not records:
+        return
+    with open(file_path, "a", encoding="utf-8") as f:
+        f.write("".join(_encode(r) for r in records))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+def compact(file_path, records, fsync=False):
+    """
+    Atomically replace a log segment with exactly `records`
+    (write to a temp file, then rename).
+    """
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(file_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("".join(_encode(r) for r in records))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def read_legacy(file_path):
+    """Read a legacy .lb01 history file (a single JSON array)."""
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return []
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
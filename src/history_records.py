@@ -0,0 +1,205 @@
+"""
+Canonical channel history records, and migration of older ones.
+
+    {"id": "<message id>", "role": "user", "name": ..., "discriminator": ..., "user_id": ..., "content": ...}
+    {"id": "<message id>", "role": "assistant", "content": ..., "type": "joke"}  # type is optional
+
+`id` is the Discord message the record stands for. The history store keeps one
+record per id, so a message that arrives twice (gateway replay after a
+reconnect, a retried request) is only stored once. Records without an id
+(written before ids existed, or whose Discord message is unknown) are kept as is.
+
+On disk a record is a JSON object. In memory it is a HistoryRecord: a slotted,
+read-only mapping with the same keys. Records share one interned Author per
+(name, discriminator, user_id), and each record renders its prompt text only
+once. At the 200-entry cap a channel takes a third to a half of the memory it
+did as dicts, and assembling its prompt about half the time
+(benchmarks/bench_history_records.py).
+
+Older histories hold every user message twice: on_message stored
+{"author": "name#discriminator", ...} and the AI worker then stored
+{"name", "discriminator", "user_id", ...} again. migrate() merges those pairs.
+"""
+import sys
+import threading
+import weakref
+from collections.abc import Mapping
+from typing import Dict, List, Optional, Tuple
+
+_AUTHOR_FIELDS = ("name", "discriminator", "user_id")
+_FIELDS = frozenset(("id", "role", "content") + _AUTHOR_FIELDS)
+
+
+class Author:
+    """Who wrote a user message. One shared instance per identity, see intern_author()."""
+    __slots__ = ("name", "discriminator", "user_id", "prefix", "__weakref__")
+
+    def __init__(self, name: Optional[str], discriminator: Optional[str], user_id: Optional[str]):
+        self.name = name
+        self.discriminator = discriminator
+        self.user_id = user_id
+        shown = (name if name is not None else "",
+                 discriminator if discriminator is not None else "????",
+                 user_id if user_id is not None else "unknown")
+        self.prefix = "%s#%s (%s) says: " % shown  # How a user turn starts in the prompt
+
+
+_authors: "weakref.WeakValueDictionary[tuple, Author]" = weakref.WeakValueDictionary()
+_authors_lock = threading.Lock()  # Records are also built on the history I/O thread
+
+
+def intern_author(name: Optional[str], discriminator: Optional[str], user_id: Optional[str]) -> Author:
+    """The interned Author for this identity (dropped once no record refers to it)."""
+    key = (name, discriminator, user_id)
+    with _authors_lock:
+        found = _authors.get(key)
+        if found is None:
+            found = _authors[key] = Author(*(sys.intern(v) if v is not None else None for v in key))
+        return found
+
+
+class HistoryRecord(Mapping):
+    """
+    One channel history entry, read-only. It behaves like the dict it is stored
+    as (record["content"], record.get("user_id"), record == {...}), but its
+    author fields live in a shared Author and the rendered API message is cached.
+    """
+    __slots__ = ("id", "role", "author", "content", "extra", "_rendered")
+
+    def __init__(self, role: str, content, record_id: Optional[str] = None,
+                 author: Optional[Author] = None, extra: Optional[Dict] = None):
+        self.id = record_id
+        self.role = sys.intern(role)
+        self.author = author
+        self.content = content
+        self.extra = extra or None  # Other fields, e.g. {"type": "joke"}
+        self._rendered = None
+
+    @classmethod
+    def from_dict(cls, record) -> "HistoryRecord":
+        if isinstance(record, HistoryRecord):
+            return record
+        who = None
+        if any(field in record for field in _AUTHOR_FIELDS):
+            who = intern_author(*(record.get(field) for field in _AUTHOR_FIELDS))
+        extra = {key: value for key, value in record.items() if key not in _FIELDS}
+        return cls(record.get("role", "user"), record.get("content"), record_id=record.get("id"), author=who, extra=extra)
+
+    def api_message(self) -> Dict[str, str]:
+        """The message sent to the model for this entry (its content is rendered once)."""
+        if self._rendered is None:
+            if self.role == "user":
+                prefix = self.author.prefix if self.author is not None else "#???? (unknown) says: "
+                self._rendered = prefix + self.content
+            else:
+                self._rendered = self.content
+        return {"role": self.role, "content": self._rendered}
+
+    def __getitem__(self, key):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        if key == "id":
+            if self.id is not None:
+                return self.id
+        elif key in _AUTHOR_FIELDS:
+            value = getattr(self.author, key, None)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        if self.id is not None:
+            yield "id"
+        yield "role"
+        if self.author is not None:
+            for field in _AUTHOR_FIELDS:
+                if getattr(self.author, field) is not None:
+                    yield field
+        yield "content"
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> dict:
+        """The JSON object stored on disk."""
+        return {key: self[key] for key in self}
+
+    def __repr__(self):
+        return f"HistoryRecord({self.to_dict()!r})"
+
+
+def _message_id(message) -> Optional[str]:
+    """The Discord snowflake of `message`, if it has one."""
+    message_id = getattr(message, "id", None)
+    return str(message_id) if isinstance(message_id, int) else None
+
+
+def user_record(message) -> HistoryRecord:
+    """History record for a user's message (its content as it should appear in prompts)."""
+    who = message.author
+    return HistoryRecord("user", message.content, record_id=_message_id(message),
+                         author=intern_author(str(who.name), str(who.discriminator), str(who.id)))
+
+
+def assistant_record(content: str, sent=None, **extra) -> HistoryRecord:
+    """
+    History record for something the bot said.
+
+    Args:
+        sent: The Discord message it was sent as (its id becomes the record id), if known.
+        extra: Additional fields, e.g. type="joke".
+    """
+    return HistoryRecord("assistant", content, record_id=_message_id(sent), extra=extra)
+
+
+def _from_author(record: dict) -> dict:
+    """Convert an old on_message record ("author": "name#discriminator") to the canonical fields."""
+    name, _, discriminator = record["author"].rpartition("#")
+    if not name:
+        name, discriminator = discriminator, "0"
+    converted = {key: value for key, value in record.items() if key != "author"}
+    converted.update(name=name, discriminator=discriminator)
+    return converted
+
+
+def migrate(records: List[dict]) -> Tuple[List[dict], bool]:
+    """
+    Bring older records to the canonical schema and drop duplicates.
+
+    - Records with an id: only the first record per id is kept.
+    - Old user messages stored twice: the on_message copy keeps its place in
+      the history (it was written first) and gains the AI worker copy's
+      fields (user_id); the worker copy is dropped.
+
+    Returns:
+        (records, changed) where changed tells whether the log should be rewritten.
+    """
+    result = []
+    changed = False
+    seen = set()
+    unmatched = {}  # (name, discriminator, content) -> index of an on_message copy awaiting its worker copy
+    for record in records:
+        record_id = record.get("id")
+        if record_id is not None:
+            if record_id in seen:
+                changed = True
+                continue
+            seen.add(record_id)
+        elif record.get("role") == "user" and "author" in record:
+            record = _from_author(record)
+            changed = True
+            unmatched[record["name"], record["discriminator"], record.get("content")] = len(result)
+        elif record.get("role") == "user" and "user_id" in record:
+            index = unmatched.pop((record.get("name"), record.get("discriminator"), record.get("content")), None)
+            if index is not None:
+                result[index] = {**result[index], **record}
+                changed = True
+                continue
+        result.append(record)
+    return result, changed
@@ -0,0 +1,160 @@
+"""
+Per-guild member/role index for O(1) mention resolution.
+
+Built lazily from guild.members/guild.roles the first time a guild is looked up,
+then kept current from member/role/user events (see the handlers in bot.py).
+"""
+import itertools
+from typing import Dict, Optional
+
+# Shared counter so versions never repeat, even when an index is rebuilt from scratch
+_versions = itertools.count(1)
+
+
+class GuildIndex:
+    """
+    Lookup tables for one guild:
+    - (name, discriminator) -> member
+    - id -> member
+    - role name -> role
+
+    `version` goes up on every change, so callers can cache anything derived
+    from the member or role list (user lists, prompts) and notice when it is stale.
+    `roles_version` only goes up on role changes.
+    """
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.version = next(_versions)
+        self.roles_version = self.version
+        self.by_id: Dict[int, object] = {}
+        self._names: Dict[int, tuple] = {}  # id -> (name, discriminator) the member is indexed under
+        self.by_name_disc: Dict[tuple, object] = {}
+        self.roles_by_name: Dict[str, object] = {}
+        for member in getattr(guild, "members", None) or []:
+            self._add_member(member)
+        for role in getattr(guild, "roles", None) or []:
+            self.roles_by_name.setdefault(role.name, role)
+
+    # --- members ---
+    def _add_member(self, member):
+        key = (member.name, str(member.discriminator))
+        self.by_id[member.id] = member
+        self._names[member.id] = key
+        self.by_name_disc[key] = member
+
+    def _remove_member(self, member):
+        old = self.by_id.pop(member.id, None)
+        key = self._names.pop(member.id, None)
+        if old is None or key is None:
+            return
+        if self.by_name_disc.get(key) is old:
+            del self.by_name_disc[key]
+
+    def add_member(self, member):
+        self._remove_member(member)
+        self._add_member(member)
+        self.version = next(_versions)
+
+    def remove_member(self, member):
+        self._remove_member(member)
+        self.version = next(_versions)
+
+    def find_member(self, name: str, discriminator: str):
+        return self.by_name_disc.get((name, discriminator))
+
+    def get_member(self, member_id: int):
+        return self.by_id.get(member_id)
+
+    def members(self):
+        return self.by_id.values()
+
+    # --- roles ---
+    def add_role(self, role):
+        self.roles_by_name.setdefault(role.name, role)
+        self.version = self.roles_version = next(_versions)
+
+    def remove_role(self, role):
+        if getattr(self.roles_by_name.get(role.name), "id", None) == role.id:
+            del self.roles_by_name[role.name]
+            # Another role may share the name
+            for other in getattr(self.guild, "roles", None) or []:
+                if other.name == role.name and other.id != role.id:
+                    self.roles_by_name[role.name] = other
+                    break
+        self.version = self.roles_version = next(_versions)
+
+    def update_role(self, before, after):
+        self.remove_role(before)
+        self.add_role(after)
+
+    def find_role(self, name: str):
+        return self.roles_by_name.get(name)
+
+
+class MemberDirectory:
+    """All guild indexes, keyed by guild id."""
+
+    def __init__(self):
+        self._guilds: Dict[object, GuildIndex] = {}
+
+    def get(self, guild) -> Optional[GuildIndex]:
+        if guild is None:
+            return None
+        index = self._guilds.get(guild.id)
+        if index is None or index.guild is not guild:
+            index = GuildIndex(guild)
+            self._guilds[guild.id] = index
+        return index
+
+    def forget(self, guild):
+        """Drop a guild's index (left the guild, or it must be rebuilt from the cache)."""
+        self._guilds.pop(guild.id, None)
+
+    def version(self, guild) -> int:
+        index = self._guilds.get(getattr(guild, "id", None))
+        return index.version if index else 0
+
+    # --- event hooks (wired up in bot.py) ---
+    def on_member_join(self, member):
+        index = self._guilds.get(member.guild.id)
+        if index:
+            index.add_member(member)
+
+    def on_member_remove(self, member):
+        index = self._guilds.get(member.guild.id)
+        if index:
+            index.remove_member(member)
+
+    def on_member_update(self, before, after):
+        if (before.name, before.discriminator) != (after.name, after.discriminator):
+            self.on_member_join(after)
+
+    def on_user_update(self, before, after):
+        """A username change applies to the user's member entry in every guild."""
+        if (before.name, before.discriminator) == (after.name, after.discriminator):
+            return
+        for index in self._guilds.values():
+            member = index.get_member(after.id)
+            if member is not None:
+                # Members proxy their user, so the cached member already has the new name;
+                # re-adding moves it from the old (name, discriminator) keys to the new ones.
+                index.add_member(member)
+
+    def on_role_create(self, role):
+        index = self._guilds.get(role.guild.id)
+        if index:
+            index.add_role(role)
+
+    def on_role_delete(self, role):
+        index = self._guilds.get(role.guild.id)
+        if index:
+            index.remove_role(role)
+
+    def on_role_update(self, before, after):
+        index = self._guilds.get(after.guild.id)
+        if index and before.name != after.name:
+            index.update_role(before, after)
+
+
+member_directory = MemberDirectory()
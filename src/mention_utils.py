@@ -1,10 +1,15 @@
 import re
 import discord
 import logging # Optional: for logging lookup failures
-from functools import partial
+from functools import lru_cache, partial
 
 import os
 
+from .member_index import member_directory
+
+# Any content enclosed in <@...>: the full mention in group 1, the inner content in group 2
+MENTION_PATTERN = re.compile(r"(<@([^>]+)>)")
+
 def load_admins(file_path="admin.txt"):
     """
     Parses admin.txt, validates each line, and returns (valid_admins, error_lines, admin_list_str).
@@ -35,7 +40,10 @@ def load_admins(file_path="admin.txt"):
         admin_list_str += "\n❗ Invalid lines in admin.txt (ignored):\n" + "\n".join(f"  - {err}" for err in error_lines)
     return valid_admins, error_lines, admin_list_str
 
-_, _, ADMIN_LIST_FOR_INSTRUCTIONS = load_admins()
+@lru_cache(maxsize=1)
+def admin_list_for_instructions():
+    """The admin list section of the ping help (admin.txt is read once, on first use)."""
+    return load_admins()[2]
 
 def get_ping_help(guild=None):
     """
@@ -50,7 +58,7 @@ def get_ping_help(guild=None):
         "✅ If you need to ping the sender of a message, their username, discriminator, and user ID are always included in the message context, so you can construct a valid ping for them!\n"
         "👥 To ping everyone, use <@everyone>. To ping a role, use <@roleName> (e.g. <@owner> or <@here>). Only user pings require the #discriminator — everyone/role pings do NOT.\n"
         "⚠️ Only users listed in 'admin.txt' (one per line, as user#1234 or user_id) are allowed to ask the bot to perform @everyone or @here pings. If you are not in this list, your request for @everyone/@here will be ignored, but you can still ping individuals and roles! 😎\n"
-        f"{ADMIN_LIST_FOR_INSTRUCTIONS}\n"
+        f"{admin_list_for_instructions()}\n"
         "📋 Available roles you can mention:\n"
         f"{roles_list}\n"
         "⭐ TL;DR: <@username#discriminator> or <@user_id> for user pings, <@everyone>/<@roleName> for groups/roles, all must be in angle brackets and start with @! Only admin-listed users can trigger @everyone/@here."
@@ -100,14 +108,14 @@ def _mention_replacer(match: re.Match, guild: discord.Guild | None) -> str:
         if len(parts) == 2:
             name_part, disc_part = parts
             if disc_part.isdigit() and 1 <= len(disc_part) <= 4:
-                member = discord.utils.get(guild.members, name=name_part, discriminator=disc_part)
+                member = member_directory.get(guild).find_member(name_part, disc_part)
                 if member:
                     return f"<@{member.id}>"
                 else:
                     return original_mention
 
     # 4. Handle <@roleName> - output as @roleName (no brackets) if role exists
-    role = discord.utils.get(guild.roles, name=content)
+    role = member_directory.get(guild).find_role(content)
     if role:
         return f"@{content}"
 
@@ -137,16 +145,98 @@ def replace_mentions(text: str, guild: discord.Guild | None) -> str:
     if not text:
         return ""
 
-    # Regex to find any content enclosed in <@...>
-    # It captures the full mention in group 0 and the inner content in group 2
-    mention_pattern = r"(<@([^>]+)>)"
-
     replacer_with_guild = partial(_mention_replacer, guild=guild)
 
-    resolved_text = re.sub(mention_pattern, replacer_with_guild, text)
+    resolved_text = MENTION_PATTERN.sub(replacer_with_guild, text)
 
     return resolved_text
 
+class StreamingMentionRewriter:
+    """
+    Incremental replace_mentions() for streamed responses.
+
+    Each feed() only looks at the new text plus a small carry-over buffer holding
+    a "<@..." token that was cut across chunks, so rewriting a whole response is
+    O(n) instead of re-running replace_mentions() on the accumulated text for
+    every Discord edit. finish() returns exactly replace_mentions(full_text, guild).
+
+    Usage:
+        mentions = StreamingMentionRewriter(guild)
+        for chunk in stream:
+            mentions.feed(chunk)
+            await msg.edit(content=mentions.preview)
+        final = mentions.finish()
+    """
+
+    def __init__(self, guild: discord.Guild | None):
+        self.guild = guild
+        self.text = ""     # Rewritten output that can no longer change
+        self._held = []    # Carry-over: raw text that may still become part of a mention
+        self._scanned = 0  # How far into the held "<@..." token we already looked for ">"
+
+    @property
+    def pending(self) -> str:
+        """Raw text held back until we know whether it is part of a mention."""
+        return "".join(self._held)
+
+    @property
+    def preview(self) -> str:
+        """Rewritten text so far followed by the (raw) carry-over, for display."""
+        return self.text + self.pending
+
+    def _waiting_for_close(self) -> bool:
+        head = self._held[0] if self._held else ""
+        return head.startswith("<@") and len(head) > 2 and head[2] != ">"
+
+    def feed(self, chunk: str) -> str:
+        """Consume the next piece of raw text and return the newly finalized output."""
+        if not chunk:
+            return ""
+        if self._waiting_for_close() and ">" not in chunk:
+            # Still inside an unterminated "<@...": don't rescan what we already held
+            self._held.append(chunk)
+            return ""
+        self._held.append(chunk)
+        buf = "".join(self._held)
+        out = []
+        pos = 0
+        while True:
+            start = buf.find("<@", pos)
+            if start < 0:
+                # A trailing "<" may turn into "<@" with the next chunk
+                end = len(buf) - 1 if buf.endswith("<") else len(buf)
+                out.append(buf[pos:end])
+                pos = max(pos, end)
+                break
+            out.append(buf[pos:start])
+            pos = start
+            if start + 2 >= len(buf):
+                break  # "<@" at the very end, need more text
+            if buf[start + 2] == ">":
+                # "<@>" is never a mention; the ">" may still close nothing
+                out.append("<@")
+                pos = start + 2
+                continue
+            close = buf.find(">", start + max(3, self._scanned))
+            if close < 0:
+                self._scanned = len(buf) - start
+                break
+            match = MENTION_PATTERN.fullmatch(buf, start, close + 1)
+            out.append(_mention_replacer(match, self.guild))
+            pos = close + 1
+            self._scanned = 0
+        self._held = [buf[pos:]] if pos < len(buf) else []
+        finalized = "".join(out)
+        self.text += finalized
+        return finalized
+
+    def finish(self) -> str:
+        """End of stream: anything still held was not a mention. Returns the full text."""
+        self.text += self.pending
+        self._held = []
+        self._scanned = 0
+        return self.text
+
 def get_all_roles_string(guild):
     """
     Returns a string listing all available roles in the guild for the model.
@@ -0,0 +1,155 @@
+"""
+Per-guild system prompt cache.
+
+The system prompt is laid out as a stable prefix followed by the volatile part,
+so identical prefixes are sent byte-for-byte and provider-side prefix caching
+can hit:
+
+    custom instructions | bot commands | dynamic-response rules | ping help + roles
+    --------------------------------------------------------------------------------
+    server user list (changes with who is talking)
+
+The prefix is cached per (guild, dynamic) and rebuilt only when its version
+changes: the guild's role version (src/member_index.py) or the config version,
+which invalidate() bumps on instruction reloads and config changes.
+"""
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from .async_io import run_blocking
+from .config import load_instructions
+from .member_index import member_directory
+from .mention_utils import get_ping_help
+from .user_list import render_user_list
+
+COMMANDS_LIST = (
+    "Available Bot Commands:\n"
+    "• /clearcontext — Clear all context, cache, and bot memory for privacy or a fresh start.\n"
+    "• /joke — Tells you a joke!\n"
+    "You can use these slash commands anytime for special actions.\n"
+)
+
+DYNAMIC_INSTRUCTION = (
+    "--- Dynamic Response Control ---\n"
+    "If you determine that a response is not necessary or appropriate for the current message "
+    "(e.g., it's casual chat not directed at you, or doesn't require an answer), "
+    "your *entire* response should consist *only* of the special marker `///noresponse`. "
+    "Do NOT include any other text, formatting, or emojis if you use `///noresponse`. "
+    "If you *do* want to respond, provide your response normally without including the `///noresponse` marker at all."
+)
+
+
+class PromptCache:
+    """Caches the stable system prompt prefix per guild and tracks hit rate/build time."""
+
+    def __init__(self, instructions: Optional[str] = None, max_guilds: int = 1024):
+        """
+        Args:
+            instructions: Custom instructions; None reads bot.txt on first use.
+        """
+        self._instructions = instructions
+        self.max_guilds = max_guilds
+        self.config_version = 0
+        self._prefixes: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.prefix_build_seconds = 0.0
+        self.total_build_seconds = 0.0
+        self.builds = 0
+
+    @property
+    def instructions(self) -> str:
+        if self._instructions is None:
+            self._instructions = load_instructions()
+        return self._instructions
+
+    @instructions.setter
+    def instructions(self, value: str):
+        self._instructions = value
+
+    def invalidate(self):
+        """Drop every cached prefix (config changed)."""
+        self.config_version += 1
+        self._prefixes.clear()
+
+    async def reload_instructions(self):
+        """Re-read bot.txt (in a worker thread) and invalidate the cache."""
+        self.instructions = await run_blocking(load_instructions)
+        self.invalidate()
+
+    def _build_prefix(self, guild, dynamic: bool) -> str:
+        parts = [self.instructions, COMMANDS_LIST]
+        if dynamic:
+            parts.append(DYNAMIC_INSTRUCTION)
+        parts.append(get_ping_help(guild))
+        return "\n\n".join(parts)
+
+    def prefix(self, guild, dynamic: bool) -> str:
+        index = member_directory.get(guild)
+        version = (self.config_version, index.roles_version if index else 0)
+        key = (getattr(guild, "id", None), dynamic)
+        cached = self._prefixes.get(key)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            self._prefixes.move_to_end(key)
+            return cached[1]
+        self.misses += 1
+        start = time.perf_counter()
+        text = self._build_prefix(guild, dynamic)
+        self.prefix_build_seconds += time.perf_counter() - start
+        self._prefixes[key] = (version, text)
+        self._prefixes.move_to_end(key)
+        if len(self._prefixes) > self.max_guilds:
+            self._prefixes.popitem(last=False)
+        return text
+
+    def build(self, guild, bot_user_id=None, history: Optional[List[dict]] = None, dynamic: bool = False,
+              summary: Optional[str] = None, recalled: Optional[str] = None) -> Optional[str]:
+        """
+        Full system prompt for one request, or None if there are no instructions.
+
+        Args:
+            guild: The discord.Guild the message came from.
+            bot_user_id: The bot's own user id (marked in the user list).
+            history: Channel history in the context window (drives the user list).
+            dynamic: Include the ///noresponse rules.
+            summary: Rolling summary of the channel's older messages (src/summarizer.py).
+                It changes rarely, so it goes right after the cached prefix.
+            recalled: Older messages retrieved for this request (src/retrieval.py).
+        """
+        if not self.instructions:
+            return None
+        start = time.perf_counter()
+        prompt = self.prefix(guild, dynamic) + "\n\n"
+        if summary:
+            prompt += f"Summary of earlier messages in this channel:\n{summary}\n\n"
+        if recalled:
+            prompt += f"Earlier messages in this channel that may be relevant:\n{recalled}\n\n"
+        prompt += render_user_list(guild, bot_user_id=bot_user_id, history=history)
+        self.total_build_seconds += time.perf_counter() - start
+        self.builds += 1
+        return prompt
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_prefix_build_ms": self.prefix_build_seconds * 1000 / self.misses if self.misses else 0.0,
+            "avg_build_ms": self.total_build_seconds * 1000 / self.builds if self.builds else 0.0,
+            "cached_guilds": len(self._prefixes),
+        }
+
+    def format_stats(self) -> str:
+        """Human-readable stats for the !prompt admin command."""
+        s = self.stats()
+        return (
+            f"🧠 Prompt cache: {s['hit_rate']:.0%} hit rate ({s['hits']} hits / {s['misses']} misses), "
+            f"{s['cached_guilds']} guilds cached\n"
+            f"• prefix build {s['avg_prefix_build_ms']:.2f} ms avg | full prompt {s['avg_build_ms']:.2f} ms avg"
+        )
+
+
+prompt_cache = PromptCache()
@@ -90,25 +90,3 @@ def load_providers(filepath="model/provider.txt"):
 def load_models(filepath="model/models.txt"):
     required = ["provider", "model-id"]
     return parse_entries(filepath, required, "model-id", "model")
-
-def get_llm_client():
-    """
-    Returns a tuple: (openai.AsyncOpenAI client, model_id) using the first provider/model entry.
-    Raises ConfigParseError if not found.
-    """
-    import openai
-    providers = load_providers()
-    models = load_models()
-    if not providers or not models:
-        raise ConfigParseError("No providers or models configured.")
-    provider = providers[0]
-    model = models[0]
-    # Handle keyless providers (when apiKey is blank/empty)
-    api_key = provider.get("apikey", "").strip()
-    requires_key = bool(api_key)  # Providers need key only if apiKey is non-empty
-    
-    client = openai.AsyncOpenAI(
-        api_key=api_key if requires_key else "not-required",
-        base_url=provider["baseurl"],
-    )
-    return client, model["model-id"]
\ No newline at end of file
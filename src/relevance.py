@@ -0,0 +1,206 @@
+"""
+Cheap relevance gate in front of the LLM for DYNAMIC mode.
+
+Every message in an allowed channel used to cost a full completion, mostly to
+get `///noresponse` back. The gate runs a few microsecond-cheap rules first:
+
+- RESPOND: the bot is mentioned, named, or replied to; the model is called
+  without the `///noresponse` option
+- SKIP:    chatter that never needs an answer (emoji/ack-only, link-only,
+  addressed to someone else); the message still goes into the history
+- ASK:     everything else, the model decides with `///noresponse` as before
+
+Rules are plain functions `rule(message, bot_user) -> Optional[Decision]`,
+tried in order; the first that returns a Decision wins. A small share of SKIP
+and RESPOND decisions (`audit_rate`) is left to the model instead, so the log
+and stats show how often each rule agrees with it.
+"""
+import random
+import re
+from collections import Counter, OrderedDict
+from typing import Callable, List, NamedTuple, Optional
+
+from .config import RELEVANCE_GATE, RELEVANCE_AUDIT_RATE
+
+RESPOND, SKIP, ASK = "respond", "skip", "ask"
+
+
+class Decision(NamedTuple):
+    verdict: str
+    reason: str
+    audit: bool = False  # Left to the model anyway, to measure the rule
+
+
+Rule = Callable[[object, object], Optional[Decision]]
+
+ACKNOWLEDGEMENTS = frozenset((
+    "k", "kk", "ok", "okay", "okk", "lol", "lmao", "lmfao", "rofl", "haha", "hahaha", "xd",
+    "ty", "thx", "thanks", "np", "yw", "gg", "ggs", "nice", "cool", "same", "true", "fr",
+    "yep", "yup", "nah", "nope", "ye", "yea", "yeah", "mhm", "hm", "hmm", "oof", "rip",
+    "brb", "gn", "gm", "ikr", "bet", "w", "l",
+))
+_WORDS = re.compile(r"[a-z']+")
+_NO_TEXT = re.compile(r"^(?:<a?:\w+:\d+>|[\W_])*$")  # Custom emoji, unicode emoji, punctuation
+_LINK_ONLY = re.compile(r"^<?https?://\S+>?$")
+_name_patterns = {}
+
+
+def _name_pattern(name: str):
+    pattern = _name_patterns.get(name)
+    if pattern is None:
+        pattern = _name_patterns[name] = re.compile(rf"(?<!\w){re.escape(name.lower())}(?!\w)")
+    return pattern
+
+
+def mentions_bot(message, bot_user) -> Optional[Decision]:
+    if any(user.id == bot_user.id for user in getattr(message, "mentions", ())):
+        return Decision(RESPOND, "mention")
+    if f"<@{bot_user.id}>" in message.content or f"<@!{bot_user.id}>" in message.content:
+        return Decision(RESPOND, "mention")
+    return None
+
+
+def replies_to_bot(message, bot_user) -> Optional[Decision]:
+    reference = getattr(message, "reference", None)
+    replied = getattr(reference, "resolved", None)
+    author = getattr(replied, "author", None)
+    if author is not None and author.id == bot_user.id:
+        return Decision(RESPOND, "reply")
+    return None
+
+
+def names_bot(message, bot_user) -> Optional[Decision]:
+    content = message.content.lower()
+    me = getattr(getattr(message, "guild", None), "me", None)
+    for name in {bot_user.name, getattr(me, "display_name", None) or bot_user.name}:
+        if name and _name_pattern(name).search(content):
+            return Decision(RESPOND, "name")
+    return None
+
+
+def no_text(message, bot_user) -> Optional[Decision]:
+    content = message.content.strip()
+    if _NO_TEXT.match(content):
+        return Decision(SKIP, "emoji" if content else "empty")
+    if _LINK_ONLY.match(content):
+        return Decision(SKIP, "link")
+    return None
+
+
+def acknowledgement(message, bot_user) -> Optional[Decision]:
+    words = _WORDS.findall(message.content.lower())
+    if words and len(words) <= 3 and all(word in ACKNOWLEDGEMENTS for word in words):
+        return Decision(SKIP, "ack")
+    return None
+
+
+def addressed_elsewhere(message, bot_user) -> Optional[Decision]:
+    """Replies to, or mentions of, other people only (the bot rules ran first)."""
+    reference = getattr(message, "reference", None)
+    replied = getattr(reference, "resolved", None)
+    if getattr(replied, "author", None) is not None:
+        return Decision(SKIP, "reply-other")
+    if getattr(message, "mentions", None):
+        return Decision(SKIP, "mention-other")
+    return None
+
+
+DEFAULT_RULES: List[Rule] = [mentions_bot, replies_to_bot, names_bot, no_text, acknowledgement, addressed_elsewhere]
+
+
+class RelevanceGate:
+    """Runs the rules and keeps per-reason counts of decisions and of how the model answered."""
+
+    def __init__(
+        self,
+        rules: Optional[List[Rule]] = None,
+        enabled: bool = RELEVANCE_GATE,
+        audit_rate: float = RELEVANCE_AUDIT_RATE,
+        max_pending: int = 1024,
+    ):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.enabled = enabled
+        self.audit_rate = audit_rate
+        self.max_pending = max_pending
+        self.decisions = Counter()  # (verdict, reason) -> count
+        self.outcomes = Counter()  # (verdict, reason, model responded) -> count
+        self._pending: "OrderedDict[int, Decision]" = OrderedDict()  # message id -> decision awaiting the model
+
+    def decide(self, message, bot_user) -> Decision:
+        """Classify one message; anything but SKIP goes to the model."""
+        decision = Decision(ASK, "default")
+        if self.enabled:
+            for rule in self.rules:
+                result = rule(message, bot_user)
+                if result is not None:
+                    decision = result
+                    break
+        if decision.verdict != ASK and random.random() < self.audit_rate:
+            decision = decision._replace(audit=True)
+        self.decisions[decision.verdict, decision.reason] += 1
+        if decision.verdict != SKIP or decision.audit:
+            self._pending[message.id] = decision
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+        return decision
+
+    def must_respond(self, messages) -> bool:
+        """Whether a rule already decided to answer one of these messages (no `///noresponse` option)."""
+        return any(
+            decision.verdict == RESPOND and not decision.audit
+            for decision in (self._pending.get(message.id) for message in messages) if decision
+        )
+
+    def record(self, messages, responded: bool, offered: bool = True):
+        """
+        The model answered (or chose `///noresponse`) for these messages.
+
+        Args:
+            offered: Whether the model had the `///noresponse` option at all
+                (not when must_respond() was true); if not, nothing is compared.
+        """
+        for message in messages:
+            decision = self._pending.pop(message.id, None)
+            if decision is None or not offered or (decision.verdict != ASK and not decision.audit):
+                continue  # The model was not asked, nothing to compare
+            self.outcomes[decision.verdict, decision.reason, responded] += 1
+            agreed = responded if decision.verdict == RESPOND else not responded
+            if decision.verdict != ASK:
+                mark = "✅" if agreed else "❌"
+                print(f"🚪 Relevance gate audit {mark} {decision.verdict}/{decision.reason}: "
+                      f"model {'responded' if responded else 'stayed silent'}")
+
+    def stats(self) -> dict:
+        """Decisions per verdict/reason, and for each how often the model agreed."""
+        result = {}
+        for (verdict, reason), count in self.decisions.items():
+            responded = self.outcomes[verdict, reason, True]
+            silent = self.outcomes[verdict, reason, False]
+            checked = responded + silent
+            agreed = responded if verdict == RESPOND else silent
+            result[f"{verdict}/{reason}"] = {
+                "decisions": count,
+                "checked": checked,
+                "responded": responded,
+                "accuracy": agreed / checked if checked and verdict != ASK else None,
+            }
+        return result
+
+    def format_stats(self) -> str:
+        """Human-readable table for the !relevance admin command."""
+        stats = self.stats()
+        total = sum(s["decisions"] for s in stats.values())
+        skipped = sum(s["decisions"] for key, s in stats.items() if key.startswith(SKIP))
+        state = "on" if self.enabled else "off"
+        lines = [f"🚪 Relevance gate ({state}): {total} messages, {skipped} skipped without an LLM call"]
+        for key, s in sorted(stats.items()):
+            line = f"• {key}: {s['decisions']}"
+            if s["accuracy"] is not None:
+                line += f" | model agreed {s['accuracy']:.0%} of {s['checked']}"
+            elif s["checked"]:
+                line += f" | model responded to {s['responded']}/{s['checked']}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+relevance_gate = RelevanceGate()
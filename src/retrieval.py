@@ -0,0 +1,329 @@
+"""
+Local BM25 retrieval over a channel's older history (opt-in, RETRIEVAL=true).
+
+Without it, whatever falls out of a channel's MAX_HISTORY_LEN window is gone,
+and every entry inside the window is sent whether it matters or not. With it:
+
+- Entries the history store evicts are archived per channel in
+  `<channel_id>.lbidx` (one JSON record per line, appended as they arrive).
+- recall() keeps the newest RETRIEVAL_TAIL entries of the prompt as they are.
+  The older ones, together with the archive, are searched with BM25 for the
+  messages being answered. The RETRIEVAL_TOP_K best matches go into the system
+  prompt (oldest first), and the rest of the window is left out.
+
+Everything runs locally on the CPU: the index is plain inverted lists of word
+counts, rebuilt from the archive file the first time a channel is searched
+and updated in place afterwards. Build and query times are measured by
+benchmarks/bench_retrieval.py.
+"""
+import asyncio
+import math
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from heapq import nlargest
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .async_io import run_blocking
+from .cache_utils import history_store
+from .config import (
+    CACHE_DIR, HISTORY_CACHE_SIZE, RETRIEVAL, RETRIEVAL_TOP_K, RETRIEVAL_TAIL, RETRIEVAL_MAX_ENTRIES
+)
+from .context_builder import render_transcript
+from .history_log import append_records, compact, read_log
+from .history_records import HistoryRecord
+
+INDEX_SUFFIX = ".lbidx"
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+_WORD_RE = re.compile(r"\w[\w']*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from had has have he her him his how i if in is it its "
+    "just me my no not of on or our she so that the their them then there they this to too was we "
+    "were what when where which who why will with you your i'm it's don't im lol ok yes".split()
+)
+
+
+@lru_cache(maxsize=16384)
+def term_counts(text: str) -> Dict[str, int]:
+    """Lower-cased words of `text` (stopwords and single characters dropped) and how often each occurs."""
+    counts = {}
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) > 1 and word not in STOPWORDS:
+            counts[word] = counts.get(word, 0) + 1
+    return counts
+
+
+def _text(entry) -> str:
+    """What is indexed of an entry: its content, plus the author's name for user messages."""
+    content = entry.get("content") or ""
+    if not isinstance(content, str):
+        return ""
+    name = entry.get("name")
+    return f"{name} {content}" if name else content
+
+
+class ChannelIndex:
+    """Inverted index of one channel's archived entries, oldest first."""
+    __slots__ = ("entries", "lengths", "postings", "total_length")
+
+    def __init__(self, entries=()):
+        self.entries: List[HistoryRecord] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}  # term -> [(entry index, count)]
+        self.total_length = 0
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        entry = HistoryRecord.from_dict(entry)
+        counts = term_counts(_text(entry))
+        index = len(self.entries)
+        self.entries.append(entry)
+        length = sum(counts.values())
+        self.lengths.append(length)
+        self.total_length += length
+        postings = self.postings
+        for term, count in counts.items():
+            found = postings.get(term)
+            if found is None:
+                postings[term] = [(index, count)]
+            else:
+                found.append((index, count))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def search(index: ChannelIndex, candidates, query: str, top_k: int) -> List:
+    """
+    The `top_k` entries of the archive and `candidates` (newer, not yet archived
+    entries) that best match `query` under BM25, oldest first.
+    """
+    terms = term_counts(query)
+    if not terms or top_k <= 0:
+        return []
+    archived = len(index)
+    candidate_counts = [term_counts(_text(entry)) for entry in candidates]
+    candidate_lengths = [sum(counts.values()) for counts in candidate_counts]
+    documents = archived + len(candidates)
+    if not documents:
+        return []
+    average_length = max((index.total_length + sum(candidate_lengths)) / documents, 1.0)
+
+    scores: Dict[int, float] = {}  # archive positions first, then archived + candidate position
+    lengths = index.lengths
+    for term in terms:
+        archive_hits = index.postings.get(term, ())
+        candidate_hits = [(archived + i, counts[term]) for i, counts in enumerate(candidate_counts) if term in counts]
+        frequency = len(archive_hits) + len(candidate_hits)
+        if not frequency:
+            continue
+        idf = math.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+        for hits in (archive_hits, candidate_hits):
+            for position, count in hits:
+                length = lengths[position] if position < archived else candidate_lengths[position - archived]
+                norm = K1 * (1 - B + B * length / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * count * (K1 + 1) / (count + norm)
+
+    best = sorted(nlargest(top_k, scores, key=scores.__getitem__))
+    return [index.entries[p] if p < archived else candidates[p - archived] for p in best]
+
+
+class HistoryRetriever:
+    def __init__(
+        self,
+        enabled: bool = RETRIEVAL,
+        top_k: int = RETRIEVAL_TOP_K,
+        tail: int = RETRIEVAL_TAIL,
+        max_entries: int = RETRIEVAL_MAX_ENTRIES,
+        cache_dir=CACHE_DIR,
+        max_channels: int = HISTORY_CACHE_SIZE,
+    ):
+        """
+        Args:
+            top_k: Older entries recalled per request.
+            tail: Newest entries always sent as they are.
+            max_entries: Archived entries kept per channel (the oldest are dropped).
+            max_channels: Channel indexes kept in memory (LRU).
+        """
+        self.enabled = enabled
+        self.top_k = max(0, top_k)
+        self.tail = max(1, tail)
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = Path(cache_dir)
+        self.max_channels = max(1, max_channels)
+        self.searches = 0
+        self.recalled = 0
+        self.archived = 0
+        self.search_seconds = 0.0
+        self.load_seconds = 0.0
+        self.loads = 0
+        self._indexes: "OrderedDict[str, ChannelIndex]" = OrderedDict()
+        self._loading = {}  # channel -> (future, entries archived while its file is read)
+        self._pending: Dict[str, list] = {}  # channel -> entries not yet appended to its file
+        self._flusher: Optional[asyncio.Task] = None
+        self._generation = 0  # bumped by wipe(): loads started before it are dropped
+        self._lines: Dict[str, int] = {}  # channel -> records in its file (only touched on the worker thread)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval-io")  # File access stays in order
+
+    def start(self):
+        """Archive the entries the history store evicts from now on (no-op if disabled)."""
+        if self.enabled and self.evicted not in history_store.evict_listeners:
+            history_store.evict_listeners.append(self.evicted)
+
+    async def close(self):
+        if self.evicted in history_store.evict_listeners:
+            history_store.evict_listeners.remove(self.evicted)
+        await self.flush()
+
+    async def _io(self, func, *args):
+        return await run_blocking(func, *args, executor=self._executor)
+
+    def _path(self, channel_id: str) -> Path:
+        return self.cache_dir / f"{channel_id}{INDEX_SUFFIX}"
+
+    def evicted(self, channel_id, entry):
+        """History store hook: archive an entry that fell out of the channel's history."""
+        channel_id = str(channel_id)
+        self.archived += 1
+        self._pending.setdefault(channel_id, []).append(entry)
+        index = self._indexes.get(channel_id)
+        if index is not None:
+            index.add(entry)
+            if len(index) >= 2 * self.max_entries:
+                self._indexes[channel_id] = ChannelIndex(index.entries[-self.max_entries:])
+        elif channel_id in self._loading:
+            self._loading[channel_id][1].append(entry)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Append the archived entries to their channels' files."""
+        while self._pending:
+            # One channel at a time: entries leave _pending only as their write is queued,
+            # so a later read of that channel (same worker thread) sees them
+            channel_id, entries = self._pending.popitem()
+            try:
+                await self._io(self._append, channel_id, [HistoryRecord.from_dict(e).to_dict() for e in entries])
+            except Exception as e:
+                print(f"⚠️ Failed to archive history of channel {channel_id}: {e}")
+
+    def _append(self, channel_id: str, records: List[dict]):
+        """Append to a channel's archive (worker thread); past twice max_entries it is compacted."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(channel_id)
+        append_records(path, records)
+        lines = self._lines.get(channel_id)
+        lines = len(read_log(path)[0]) if lines is None else lines + len(records)
+        if lines > 2 * self.max_entries:
+            kept = read_log(path)[0][-self.max_entries:]
+            compact(path, kept)
+            lines = len(kept)
+        self._lines[channel_id] = lines
+
+    def _read(self, channel_id: str) -> ChannelIndex:
+        """Read and index one channel's archive (worker thread)."""
+        path = self._path(channel_id)
+        records, _ = read_log(path)
+        if len(records) > 2 * self.max_entries:
+            records = records[-self.max_entries:]
+            compact(path, records)
+        self._lines[channel_id] = len(records)
+        return ChannelIndex(records[-self.max_entries:])
+
+    async def index(self, channel_id) -> ChannelIndex:
+        """The channel's index (its archive is read on first use)."""
+        channel_id = str(channel_id)
+        index = self._indexes.get(channel_id)
+        if index is not None:
+            self._indexes.move_to_end(channel_id)
+            return index
+        loading = self._loading.get(channel_id)
+        if loading is not None:
+            return await asyncio.shield(loading[0])
+
+        future = asyncio.get_running_loop().create_future()
+        # Entries archived but not yet written are not in the file: they are added after the read
+        arrived = list(self._pending.get(channel_id, ()))
+        self._loading[channel_id] = (future, arrived)
+        generation = self._generation
+        started = time.perf_counter()
+        try:
+            index = await self._io(self._read, channel_id)
+        except Exception as e:
+            print(f"⚠️ Failed to load history archive of channel {channel_id}: {e}")
+            index = ChannelIndex()
+        finally:
+            self._loading.pop(channel_id, None)
+        for entry in arrived:
+            index.add(entry)
+        self.loads += 1
+        self.load_seconds += time.perf_counter() - started
+        if generation == self._generation:
+            self._indexes[channel_id] = index
+            while len(self._indexes) > self.max_channels:
+                self._indexes.popitem(last=False)
+        future.set_result(index)
+        return index
+
+    async def recall(self, channel_id, history, query: str) -> Tuple[Optional[str], List]:
+        """
+        What a request should send of this channel's history.
+
+        Args:
+            history: The entries that would be sent, oldest first.
+            query: The text being answered (the messages of this request).
+
+        Returns:
+            tuple: (older entries matching the query, as a transcript for the
+            system prompt, or None; the newest `tail` entries of `history`).
+        """
+        if not self.enabled:
+            return None, history
+        tail = history[-self.tail:]
+        older = history[:len(history) - len(tail)]
+        index = await self.index(channel_id)
+        if not older and not len(index):
+            return None, tail
+        started = time.perf_counter()
+        found = search(index, older, query, self.top_k)
+        self.search_seconds += time.perf_counter() - started
+        self.searches += 1
+        self.recalled += len(found)
+        return (render_transcript(found) if found else None), tail
+
+    def _delete_files(self) -> int:
+        self._lines.clear()
+        removed = 0
+        for f in self.cache_dir.glob(f"*{INDEX_SUFFIX}"):
+            try:
+                f.unlink()
+                removed += 1
+            except Exception as e:
+                print(f"⚠️ Failed to delete history archive {f}: {e}")
+        return removed
+
+    async def wipe(self) -> int:
+        """Forget every archive and delete the files. Returns the number of files removed."""
+        self._generation += 1
+        self._indexes.clear()
+        self._pending.clear()
+        return await self._io(self._delete_files)
+
+    def format_stats(self) -> str:
+        state = "on" if self.enabled else "off"
+        avg_search = self.search_seconds * 1000 / self.searches if self.searches else 0.0
+        avg_load = self.load_seconds * 1000 / self.loads if self.loads else 0.0
+        return (f"🔎 Retrieval ({state}): {self.searches} searches, {self.recalled} entries recalled, "
+                f"{avg_search:.2f} ms avg search, {avg_load:.1f} ms avg index load, "
+                f"{self.archived} entries archived, {len(self._indexes)} channels indexed")
+
+
+retriever = HistoryRetriever()
@@ -0,0 +1,422 @@
+"""
+Routing of LLM requests across every configured (provider, model) pair.
+
+Each entry in models.txt is a route to the provider it names. The router picks
+one per request according to LLM_ROUTING:
+
+- "first":    the first route with spare capacity (the old behaviour, others are overflow)
+- "weighted": smooth weighted round-robin over `weight=` (models.txt, default 1)
+- "least":    fewest outstanding requests relative to weight
+- "latency":  lowest latency EWMA x (outstanding + 1); untried routes go first
+
+`max-concurrency=` in provider.txt caps requests in flight per provider across
+all of its models; when every route is at its cap, acquire() waits.
+
+Each provider has a circuit breaker (src/circuit_breaker.py); routes whose
+circuit is open are skipped. open_completion() fails over to the next healthy
+route when a request errors or times out, within a total deadline. Streamed
+replies only fail over before their first token, so nothing already shown in
+Discord is ever replaced.
+
+With LLM_HEDGE on, a request whose first token is later than usual (see
+src/hedging.py) gets a duplicate on another route (or the same one if no other
+is available); the first to produce a token wins and the other is cancelled.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .config import LLM_ROUTING, LLM_DEADLINE
+from .circuit_breaker import CircuitBreaker
+from .hedging import HedgePolicy
+from .client_registry import registry as llm_clients
+from .provider_config import ConfigParseError
+
+STRATEGIES = ("first", "weighted", "least", "latency")
+LATENCY_ALPHA = 0.3  # EWMA weight of the newest latency sample
+
+
+class NoRouteAvailable(Exception):
+    """Every configured route was tried, is unhealthy or the deadline passed."""
+
+
+def is_provider_fault(error: Exception) -> bool:
+    """Whether an error is worth retrying elsewhere (not a request the API rejected as invalid)."""
+    return getattr(error, "status_code", None) not in (400, 422)
+
+
+class Route:
+    """One (provider, model) pair with its load and latency statistics."""
+    __slots__ = ("provider", "model", "weight", "outstanding", "latency",
+                 "samples", "completed", "errors", "current_weight")
+
+    def __init__(self, provider: dict, model: dict, weight: float):
+        self.provider = provider
+        self.model = model
+        self.weight = weight
+        self.outstanding = 0
+        self.latency = 0.0  # EWMA in seconds
+        self.samples = 0
+        self.completed = 0
+        self.errors = 0
+        self.current_weight = 0.0  # smooth weighted round-robin state
+
+    @property
+    def provider_name(self) -> str:
+        return self.provider["name"].lower()
+
+    @property
+    def model_id(self) -> str:
+        return self.model["model-id"]
+
+    def record_latency(self, seconds: float):
+        if self.samples:
+            self.latency += LATENCY_ALPHA * (seconds - self.latency)
+        else:
+            self.latency = seconds
+        self.samples += 1
+
+
+class Lease:
+    """A routed request: the client/model to use until Router.release() is called."""
+    __slots__ = ("route", "client", "model_id", "started", "latency")
+
+    def __init__(self, route: Route, client):
+        self.route = route
+        self.client = client
+        self.model_id = route.model_id
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def mark_first_token(self):
+        """Record time-to-first-token (used as the latency sample for streamed replies)."""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+def _number(entry: dict, key: str, default, label: str, cast=float, minimum=0):
+    value = entry.get(key)
+    if value is None or value == "":
+        return default
+    try:
+        number = cast(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ConfigParseError(f"Invalid {key} '{value}' for {label}.")
+    return number
+
+
+def build_routes(providers: List[dict], models: List[dict]):
+    """(routes, per-provider concurrency caps) from parsed provider.txt/models.txt entries."""
+    by_name = {p["name"].lower(): p for p in providers}
+    limits = {
+        name: _number(p, "max-concurrency", 0, f"provider '{p['name']}'", cast=int)
+        for name, p in by_name.items()
+    }
+    routes = []
+    for model in models:
+        provider = by_name.get(model["provider"].lower())
+        if provider is None:
+            print(f"⚠️ Model '{model['model-id']}' uses unknown provider '{model['provider']}', skipping it.")
+            continue
+        weight = _number(model, "weight", 1.0, f"model '{model['model-id']}'", minimum=1e-9)
+        routes.append(Route(provider, model, weight))
+    if not routes:
+        raise ConfigParseError("No model in models.txt is linked to a provider in provider.txt.")
+    return routes, limits
+
+
+class Router:
+    """Picks a route per request and tracks outstanding requests and latency."""
+
+    def __init__(self, clients=llm_clients, strategy: str = LLM_ROUTING,
+                 breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+                 hedging: Optional[HedgePolicy] = None):
+        self.clients = clients
+        self.breaker_factory = breaker_factory
+        self.hedging = hedging if hedging is not None else HedgePolicy()
+        if strategy not in STRATEGIES:
+            print(f"⚠️ Unknown LLM_ROUTING '{strategy}', using 'first'.")
+            strategy = "first"
+        self.strategy = strategy
+        self._routes: List[Route] = []
+        self._limits: Dict[str, int] = {}
+        self._models_seen = None
+        self._in_flight: Dict[str, int] = {}  # provider name -> requests in flight
+        self._breakers: Dict[str, CircuitBreaker] = {}  # provider name -> health
+        self._capacity = asyncio.Condition()
+
+    @property
+    def routes(self) -> List[Route]:
+        """Routes for the current config (rebuilt after the registry reloads it)."""
+        models = self.clients.models
+        if models is not self._models_seen:
+            self._routes, self._limits = build_routes(self.clients.providers, models)
+            self._models_seen = models
+        return self._routes
+
+    def breaker(self, route: Route) -> CircuitBreaker:
+        breaker = self._breakers.get(route.provider_name)
+        if breaker is None:
+            breaker = self._breakers[route.provider_name] = self.breaker_factory()
+        return breaker
+
+    def _has_capacity(self, route: Route) -> bool:
+        limit = self._limits.get(route.provider_name)
+        return not limit or self._in_flight.get(route.provider_name, 0) < limit
+
+    def _pick(self, candidates: List[Route]) -> Route:
+        if self.strategy == "weighted":
+            total = sum(r.weight for r in candidates)
+            for r in candidates:
+                r.current_weight += r.weight
+            best = max(candidates, key=lambda r: r.current_weight)
+            best.current_weight -= total
+            return best
+        if self.strategy == "least":
+            return min(candidates, key=lambda r: r.outstanding / r.weight)
+        if self.strategy == "latency":
+            return min(candidates, key=lambda r: (1, r.latency * (r.outstanding + 1)) if r.samples else (0, r.outstanding))
+        return candidates[0]
+
+    async def acquire(self, exclude=(), wait: bool = True) -> Lease:
+        """
+        Pick a healthy route, waiting while every provider is at its max-concurrency.
+
+        Args:
+            exclude: Routes not to use (e.g. ones that already failed for this request).
+            wait: If False, raise NoRouteAvailable instead of waiting for capacity.
+
+        Raises:
+            NoRouteAvailable: Every route is excluded or its circuit is open.
+        """
+        async with self._capacity:
+            while True:
+                now = time.monotonic()
+                healthy = [r for r in self.routes if r not in exclude and self.breaker(r).available(now)]
+                if not healthy:
+                    raise NoRouteAvailable("No healthy LLM provider/model left to try.")
+                candidates = [r for r in healthy if self._has_capacity(r)]
+                if candidates:
+                    break
+                if not wait:
+                    raise NoRouteAvailable("Every healthy LLM provider is at its max-concurrency.")
+                await self._capacity.wait()
+            route = self._pick(candidates)
+            route.outstanding += 1
+            self._in_flight[route.provider_name] = self._in_flight.get(route.provider_name, 0) + 1
+            self.breaker(route).on_request()
+        return Lease(route, self.clients.checkout(route.provider))
+
+    async def release(self, lease: Lease, ok: bool = True, fault: bool = True):
+        """
+        Finish a request; successful ones feed the latency EWMA.
+
+        Args:
+            ok: The request succeeded.
+            fault: For failed requests, whether the provider is to blame (counts
+                against its circuit breaker) rather than the request itself.
+        """
+        route = lease.route
+        latency = lease.latency if lease.latency is not None else time.monotonic() - lease.started
+        route.outstanding -= 1
+        self._in_flight[route.provider_name] -= 1
+        if ok:
+            route.completed += 1
+            route.record_latency(latency)
+        else:
+            route.errors += 1
+        self.breaker(route).record(ok or not fault, latency)
+        await self.clients.checkin(lease.client)
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def _abandon(self, lease: Lease):
+        """Give back a lease whose request was cancelled without an outcome (a lost hedge race)."""
+        route = lease.route
+        route.outstanding -= 1
+        self._in_flight[route.provider_name] -= 1
+        self.breaker(route).abandon()
+        await self.clients.checkin(lease.client)
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def _start(self, lease: Lease, messages: List[dict], stream: bool = False, **kwargs):
+        response = await lease.client.chat.completions.create(
+            model=lease.model_id, messages=messages, stream=stream, **kwargs
+        )
+        if stream:
+            # Wait for the first token here, while failing over is still invisible to the user
+            iterator = response.__aiter__()
+            buffered = []
+            async for chunk in iterator:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    break
+            response = _replay(buffered, iterator)
+        lease.mark_first_token()
+        return response
+
+    async def _hedge_lease(self, tried: set) -> Optional[Lease]:
+        """A lease for a hedge: another route if possible, else the same one again."""
+        for exclude in (tried, ()):
+            try:
+                return await self.acquire(exclude=exclude, wait=False)
+            except NoRouteAvailable:
+                continue
+        return None
+
+    async def _attempt(self, lease: Lease, messages, deadline_at: float, tried: set, **kwargs) -> Tuple[Lease, object]:
+        """
+        Run one request on `lease`, hedging it if its first token is late.
+
+        Every lease but the winner's is released before this returns or raises:
+        as failed if it failed or the deadline passed, else abandoned (it lost the
+        race, or the request itself was rejected) without counting against its provider.
+        """
+        def start(attempt: Lease) -> asyncio.Task:
+            payload = messages(attempt.route) if callable(messages) else messages
+            return asyncio.create_task(self._start(attempt, payload, **kwargs))
+
+        running = {start(lease): lease}
+        hedge_at = None
+        hedge_delay = self.hedging.delay()
+        if hedge_delay is not None:
+            hedge_at = lease.started + hedge_delay
+        last_error: Optional[Exception] = None
+        timed_out = False
+        try:
+            while running:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    timed_out = True
+                    raise asyncio.TimeoutError()
+                timeout = deadline_at - now
+                if hedge_at is not None:
+                    timeout = min(timeout, max(0.0, hedge_at - now))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        hedge_at = None  # at most one hedge per attempt
+                        if self.hedging.allow():
+                            hedge = await self._hedge_lease(tried)
+                            if hedge is not None:
+                                self.hedging.spend()
+                                tried.add(hedge.route)
+                                running[start(hedge)] = hedge
+                                print(f"🪁 No first token from {lease.route.provider['name']} / {lease.model_id} "
+                                      f"after {hedge_delay:.2f}s, hedging on {hedge.route.provider['name']} / {hedge.model_id}")
+                    continue
+                for task in done:
+                    attempt = running.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if attempt is not lease:
+                            self.hedging.won += 1
+                        if hedge_delay is not None:
+                            # The primary's first-token time (a lower bound if it lost)
+                            self.hedging.observe(lease.latency if lease.latency is not None
+                                                 else time.monotonic() - lease.started)
+                        return attempt, task.result()
+                    last_error = error
+                    fault = is_provider_fault(error)
+                    await self.release(attempt, ok=False, fault=fault)
+                    if not fault:
+                        raise error
+            raise last_error
+        finally:
+            for task, attempt in running.items():
+                task.cancel()
+                if timed_out:
+                    await self.release(attempt, ok=False)
+                else:
+                    await self._abandon(attempt)
+
+    async def open_completion(
+        self,
+        messages: Union[List[dict], Callable[[Route], List[dict]]],
+        deadline: float = LLM_DEADLINE,
+        **kwargs,
+    ) -> Tuple[Lease, object]:
+        """
+        Start a chat completion on the best healthy route, failing over to the
+        next one on errors and timeouts until `deadline` seconds have passed.
+
+        Args:
+            messages: The messages, or a function building them for a route
+                (e.g. to fit that model's context-tokens).
+            deadline: Total seconds for every attempt together.
+            **kwargs: Passed to chat.completions.create (temperature, stream, ...).
+                With stream=True the returned stream has already produced its
+                first token.
+
+        Returns:
+            (lease, completion or stream). The caller must release() the lease.
+        """
+        deadline_at = time.monotonic() + deadline
+        if self.hedging.delay() is not None:
+            self.hedging.on_request()  # Once per request, not per failover attempt
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            try:
+                lease = await asyncio.wait_for(self.acquire(exclude=tried), deadline_at - time.monotonic())
+            except (NoRouteAvailable, asyncio.TimeoutError):
+                break
+            tried.add(lease.route)
+            try:
+                return await self._attempt(lease, messages, deadline_at, tried, **kwargs)
+            except Exception as e:
+                last_error = e
+                if not is_provider_fault(e):
+                    raise
+                print(f"🔀 {lease.route.provider['name']} / {lease.model_id} failed ({type(e).__name__}: {e}), failing over...")
+        if last_error is not None:
+            raise last_error
+        raise NoRouteAvailable("No healthy LLM provider/model available before the deadline.")
+
+    async def complete(self, messages, deadline: float = LLM_DEADLINE, **kwargs):
+        """One whole chat completion with failover (see open_completion); returns the response."""
+        lease, response = await self.open_completion(messages, deadline, **kwargs)
+        await self.release(lease)
+        return response
+
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "provider": r.provider["name"],
+                "model": r.model_id,
+                "weight": r.weight,
+                "outstanding": r.outstanding,
+                "max_concurrency": self._limits.get(r.provider_name) or None,
+                "completed": r.completed,
+                "errors": r.errors,
+                "latency_ms": r.latency * 1000 if r.samples else None,
+                "circuit": self.breaker(r).state,
+            }
+            for r in self.routes
+        ]
+
+    def format_stats(self) -> str:
+        """Human-readable route table for the !routes admin command."""
+        lines = [f"🧭 LLM routing: {self.strategy}", self.hedging.format_stats()]
+        for s in self.stats():
+            cap = s["max_concurrency"] or "∞"
+            latency = f"{s['latency_ms']:.0f} ms" if s["latency_ms"] is not None else "n/a"
+            lines.append(
+                f"• {s['provider']} / {s['model']} | weight {s['weight']:g} | in flight {s['outstanding']}/{cap} | "
+                f"done {s['completed']} | errors {s['errors']} | latency {latency} | circuit {s['circuit']}"
+            )
+        return "\n".join(lines)
+
+
+async def _replay(buffered: list, iterator):
+    """Yield already-received stream chunks, then the rest of the stream."""
+    for chunk in buffered:
+        yield chunk
+    async for chunk in iterator:
+        yield chunk
+
+
+llm_router = Router()
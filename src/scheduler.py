@@ -0,0 +1,389 @@
+"""Per-channel concurrent scheduler for LLM requests."""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from .config import (
+    LLM_CONCURRENCY, COALESCE_WINDOW, COALESCE_MAX_WAIT, COALESCE_MAX_BATCH,
+    QUEUE_MAX, QUEUE_MAX_PER_CHANNEL, REQUEST_MAX_AGE
+)
+
+# Priority lanes: ready high-priority requests (admins) are dispatched before ambient chat.
+# PRIORITY_LOW is for background slot() users (summaries): they only get a slot nothing else wants
+PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH = -1, 0, 1
+LANES = (PRIORITY_HIGH, PRIORITY_NORMAL)
+
+# Why a message was shed (passed to `on_shed`)
+SHED_STALE, SHED_OVERLOAD = "stale", "overload"
+
+
+class ChannelStats:
+    """Counters for one channel, exposed through ChannelScheduler.stats()."""
+    __slots__ = ("processed", "failed", "total_wait", "max_wait", "in_flight", "coalesced",
+                 "shed_stale", "shed_overload")
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.in_flight = 0
+        self.coalesced = 0  # Messages merged into another message's request
+        self.shed_stale = 0  # Dropped for being older than max_age when their turn came
+        self.shed_overload = 0  # Dropped to stay within the queue limits
+
+
+class _Job:
+    """One handler call: a message, plus any later ones coalesced into it."""
+    __slots__ = ("messages", "arrivals", "priorities", "enqueued_at", "last_at")
+
+    def __init__(self, message, priority: int):
+        self.enqueued_at = time.monotonic()
+        self.last_at = self.enqueued_at
+        self.messages = [message]
+        self.arrivals = [self.enqueued_at]
+        self.priorities = [priority]
+
+    def add(self, message, priority: int):
+        self.last_at = time.monotonic()
+        self.messages.append(message)
+        self.arrivals.append(self.last_at)
+        self.priorities.append(priority)
+
+    def remove(self, index: int):
+        del self.messages[index], self.arrivals[index], self.priorities[index]
+
+    @property
+    def priority(self) -> int:
+        return max(self.priorities, default=PRIORITY_NORMAL)
+
+
+class ChannelScheduler:
+    """
+    Runs queued messages through `handler` with:
+    - at most `max_concurrency` requests in flight across all channels,
+    - strict ordering inside a channel (one in-flight request per channel),
+    - round-robin between channels, so a busy channel cannot starve the others,
+    - coalescing: messages that arrive while a channel's request is queued or in
+      flight are merged into its next request (up to `max_batch` messages), so
+      a burst costs one LLM call. A queued request waits until the channel has
+      been quiet for `quiet_window` seconds, but never more than `max_wait`
+      seconds after its first message.
+    - bounded admission: at most `max_queued` waiting messages overall and
+      `max_per_channel` per channel. Over a limit the oldest waiting message of
+      the lowest priority is shed (the message itself is still in the channel
+      history, it just doesn't get its own reply).
+    - deadlines: messages that waited longer than `max_age` seconds are shed
+      when their turn comes instead of being answered minutes late.
+    - priority lanes: ready PRIORITY_HIGH requests go before ambient chat, and
+      slot() lets work outside the queue (slash commands) run ahead of it, or
+      (PRIORITY_LOW) behind it, for background work.
+
+    Shed messages are reported to `on_shed(message, reason)` (e.g. to react).
+
+    Drop-in for the old asyncio.Queue: callers just `await scheduler.put(message)`.
+    The handler is called with every message of a request, oldest first:
+    `handler(message)` or `handler(first, ..., latest)`.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[object], Awaitable[None]],
+        max_concurrency: int = LLM_CONCURRENCY,
+        key: Callable[[object], object] = lambda message: message.channel.id,
+        quiet_window: float = COALESCE_WINDOW,
+        max_wait: float = COALESCE_MAX_WAIT,
+        max_batch: int = COALESCE_MAX_BATCH,
+        max_queued: int = QUEUE_MAX,
+        max_per_channel: int = QUEUE_MAX_PER_CHANNEL,
+        max_age: float = REQUEST_MAX_AGE,
+        on_shed: Optional[Callable[[object, str], Optional[Awaitable[None]]]] = None,
+    ):
+        self.handler = handler
+        self.max_concurrency = max(1, max_concurrency)
+        self.key = key
+        self.quiet_window = max(0.0, quiet_window)
+        self.max_wait = max(0.0, max_wait)
+        self.max_batch = max(1, max_batch)
+        self.max_queued = max(1, max_queued)
+        self.max_per_channel = max(1, max_per_channel)
+        self.max_age = max(0.0, max_age)
+        self.on_shed = on_shed
+        self._queues: Dict[object, Deque[_Job]] = {}
+        # channels with queued work and nothing in flight, one lane per priority
+        self._ready: Dict[int, Deque[object]] = {lane: deque() for lane in LANES}
+        self._running = set()
+        self._settling = set()  # channels waiting for their quiet window
+        self._callers: Deque[asyncio.Future] = deque()  # slot() callers waiting for a slot
+        self._idle_callers: Deque[asyncio.Future] = deque()  # PRIORITY_LOW slot() callers
+        self._queued = 0  # messages waiting (not in flight) across all channels
+        self._tasks = set()
+        self._stats: Dict[object, ChannelStats] = {}
+        self._free = self.max_concurrency
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _ensure_primitives(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._dispatcher is not None and not self._dispatcher.done()
+
+    def start(self):
+        """Start the dispatcher task (no-op if it is already running)."""
+        if self.running:
+            return
+        self._ensure_primitives()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        print(f"⚙️ AI scheduler started (max {self.max_concurrency} concurrent requests).")
+
+    async def stop(self):
+        """Cancel the dispatcher and every in-flight request."""
+        tasks = list(self._tasks)
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+            self._dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def put(self, message, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Queue a message behind any earlier ones from the same channel.
+
+        Returns:
+            False if the message was shed right away (every waiting message has
+            a higher priority and the queue is full).
+        """
+        self._ensure_primitives()
+        channel = self.key(message)
+        stats = self._stats.setdefault(channel, ChannelStats())
+        # Make room first: the channel limit, then the global one
+        if sum(len(job.messages) for job in self._queues.get(channel, ())) >= self.max_per_channel:
+            if not self._shed_oldest([channel], priority):
+                self._shed(channel, message, SHED_OVERLOAD)
+                return False
+        if self._queued >= self.max_queued:
+            if not self._shed_oldest(list(self._queues), priority):
+                self._shed(channel, message, SHED_OVERLOAD)
+                return False
+        self._queued += 1
+        queue = self._queues.setdefault(channel, deque())
+        if queue and len(queue[-1].messages) < self.max_batch:
+            queue[-1].add(message, priority)  # Not started yet: this message joins the same request
+            stats.coalesced += 1
+            return True
+        queue.append(_Job(message, priority))
+        if len(queue) == 1 and channel not in self._running:
+            self._schedule(channel)
+        return True
+
+    def _shed_oldest(self, channels, priority: int) -> bool:
+        """Shed the oldest waiting message with the lowest priority (not above `priority`)."""
+        victim = None  # (priority, arrival, channel, job, index)
+        for channel in channels:
+            for job in self._queues.get(channel, ()):
+                for index, (arrival, job_priority) in enumerate(zip(job.arrivals, job.priorities)):
+                    if job_priority <= priority and (victim is None or (job_priority, arrival) < victim[:2]):
+                        victim = (job_priority, arrival, channel, job, index)
+        if victim is None:
+            return False
+        _, _, channel, job, index = victim
+        message = job.messages[index]
+        job.remove(index)  # An emptied job is skipped when its turn comes
+        self._queued -= 1
+        self._shed(channel, message, SHED_OVERLOAD)
+        return True
+
+    def _shed(self, channel, message, reason: str):
+        stats = self._stats[channel]
+        if reason == SHED_STALE:
+            stats.shed_stale += 1
+        else:
+            stats.shed_overload += 1
+        print(f"🚦 Shed a message in channel {channel} ({reason})")
+        if self.on_shed is None:
+            return
+        try:
+            result = self.on_shed(message, reason)
+            if asyncio.iscoroutine(result):
+                task = asyncio.create_task(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except Exception as e:
+            print(f"⚠️ on_shed failed: {e}")
+
+    def _schedule(self, channel):
+        """Make the channel's next request ready, once its burst has settled."""
+        if not self.quiet_window:
+            self._make_ready(channel)
+        elif channel not in self._settling:
+            self._settling.add(channel)
+            task = asyncio.create_task(self._settle(channel))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _make_ready(self, channel):
+        self._ready[self._queues[channel][0].priority].append(channel)
+        self._wakeup.set()
+
+    async def _settle(self, channel):
+        job = self._queues[channel][0]
+        try:
+            while True:
+                # Every coalesced message pushes last_at (and the deadline) back
+                deadline = min(job.last_at + self.quiet_window, job.enqueued_at + self.max_wait)
+                delay = deadline - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self._settling.discard(channel)
+        self._make_ready(channel)
+
+    def _next_ready(self):
+        for lane in LANES:
+            if self._ready[lane]:
+                return self._ready[lane].popleft()
+        return None
+
+    async def _dispatch(self):
+        while True:
+            while not (self._free and (self._callers or self._idle_callers or any(self._ready.values()))):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            self._free -= 1
+            ready = any(self._ready.values())
+            if self._callers or not ready:
+                caller = (self._callers or self._idle_callers).popleft()
+                if caller.done():  # Cancelled while waiting
+                    self._free += 1
+                else:
+                    caller.set_result(None)
+                continue
+            channel = self._next_ready()
+            job = self._queues[channel].popleft()
+            self._queued -= len(job.messages)
+            self._running.add(channel)
+            task = asyncio.create_task(self._run(channel, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _release(self):
+        self._free += 1
+        self._wakeup.set()
+
+    def _fresh(self, channel, job: _Job) -> List[object]:
+        """The job's messages that are still worth answering; stale ones are shed."""
+        if not self.max_age:
+            return job.messages
+        now = time.monotonic()
+        fresh = []
+        for message, arrival in zip(job.messages, job.arrivals):
+            if now - arrival > self.max_age:
+                self._shed(channel, message, SHED_STALE)
+            else:
+                fresh.append(message)
+        return fresh
+
+    async def _run(self, channel, job: _Job):
+        stats = self._stats[channel]
+        messages = self._fresh(channel, job)
+        try:
+            if messages:
+                wait = time.monotonic() - job.enqueued_at
+                stats.total_wait += wait
+                stats.max_wait = max(stats.max_wait, wait)
+                stats.in_flight += 1
+                try:
+                    await self.handler(*messages)
+                    stats.processed += 1
+                except Exception as e:
+                    stats.failed += 1
+                    print(f"❌ Critical error while processing request in channel {channel}: {e}")
+                finally:
+                    stats.in_flight -= 1
+        finally:
+            self._running.discard(channel)
+            if self._queues[channel]:
+                # Back of the line: other waiting channels get their turn first
+                self._schedule(channel)
+            else:
+                del self._queues[channel]
+            self._release()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_HIGH):
+        """
+        Hold one of the `max_concurrency` slots for work outside the channel
+        queues (e.g. a slash command's LLM call). Waiting callers get the next
+        free slot before any queued chat; PRIORITY_LOW callers only once no
+        chat is ready. Without a running dispatcher (tests, scripts) it does not wait.
+        """
+        if not self.running:
+            yield
+            return
+        caller = asyncio.get_running_loop().create_future()
+        (self._idle_callers if priority <= PRIORITY_LOW else self._callers).append(caller)
+        self._wakeup.set()
+        try:
+            await caller
+        except asyncio.CancelledError:
+            if caller.done() and not caller.cancelled():
+                self._release()  # The slot was granted just as we were cancelled
+            raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def join(self):
+        """Wait until every queued and in-flight request has finished."""
+        while self._queues or self._running:
+            await asyncio.sleep(0.01)
+
+    def stats(self) -> Dict[object, dict]:
+        """Per-channel queue depth (in messages), wait times, in-flight, coalesced and shed counts."""
+        now = time.monotonic()
+        result = {}
+        for channel, stats in self._stats.items():
+            queue = self._queues.get(channel) or ()
+            arrivals = [arrival for job in queue for arrival in job.arrivals]
+            started = stats.processed + stats.failed + stats.in_flight
+            result[channel] = {
+                "queued": len(arrivals),
+                "in_flight": stats.in_flight,
+                "processed": stats.processed,
+                "failed": stats.failed,
+                "oldest_wait": (now - min(arrivals)) if arrivals else 0.0,
+                "avg_wait": stats.total_wait / started if started else 0.0,
+                "max_wait": stats.max_wait,
+                "coalesced": stats.coalesced,
+                "shed_stale": stats.shed_stale,
+                "shed_overload": stats.shed_overload,
+            }
+        return result
+
+    def format_stats(self) -> str:
+        """Human-readable stats table for the !queue admin command."""
+        stats = self.stats()
+        in_flight = sum(s["in_flight"] for s in stats.values())
+        queued = sum(s["queued"] for s in stats.values())
+        coalesced = sum(s["coalesced"] for s in stats.values())
+        shed = sum(s["shed_stale"] + s["shed_overload"] for s in stats.values())
+        lines = [f"📊 AI queue: {in_flight}/{self.max_concurrency} in flight, {queued}/{self.max_queued} queued, "
+                 f"{coalesced} messages coalesced, {shed} shed"]
+        for channel, s in stats.items():
+            if not (s["queued"] or s["in_flight"] or s["processed"] or s["failed"]):
+                continue
+            lines.append(
+                f"• <#{channel}> queued {s['queued']} | in flight {s['in_flight']} | "
+                f"done {s['processed']} | failed {s['failed']} | coalesced {s['coalesced']} | "
+                f"shed {s['shed_stale']} stale, {s['shed_overload']} overload | "
+                f"wait avg {s['avg_wait']:.1f}s max {s['max_wait']:.1f}s oldest {s['oldest_wait']:.1f}s"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,77 @@
+"""
+Idempotent startup pipeline for on_ready.
+
+discord.py fires on_ready again after a reconnect. Each named phase runs until
+it has succeeded once; later on_ready calls skip it. Independent phases run
+concurrently, slow ones (the LLM "back online" message) are deferred to the
+background so readiness never waits on them, and every phase is timed.
+"""
+import asyncio
+import inspect
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+Step = Callable[[], Union[None, Awaitable[None]]]
+
+
+class Startup:
+    def __init__(self):
+        self.runs = 0  # on_ready calls seen
+        self.timings: Dict[str, float] = {}  # phase -> ms of its last run
+        self._done = set()
+        self._background: Dict[str, asyncio.Task] = {}
+        self._started: Optional[float] = None
+
+    def begin(self) -> bool:
+        """Start an on_ready run. Returns True for the first one."""
+        self.runs += 1
+        self.timings = {}
+        self._started = time.perf_counter()
+        return self.runs == 1
+
+    def done(self, name: str) -> bool:
+        return name in self._done
+
+    async def phase(self, name: str, step: Step):
+        """Run one step unless it already succeeded; failures are logged and retried next time."""
+        if name in self._done:
+            return
+        start = time.perf_counter()
+        try:
+            result = step()
+            if inspect.isawaitable(result):
+                await result
+            self._done.add(name)
+        except Exception as e:
+            print(f"⚠️ Startup phase '{name}' failed: {e}")
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    async def run(self, *phases: Tuple[str, Step]):
+        """Run independent phases concurrently."""
+        await asyncio.gather(*(self.phase(name, step) for name, step in phases))
+
+    def defer(self, name: str, step: Step):
+        """Run a phase in the background (once at a time, until it has succeeded)."""
+        task = self._background.get(name)
+        if name in self._done or (task is not None and not task.done()):
+            return
+        task = self._background[name] = asyncio.create_task(self.phase(name, step))
+        task.add_done_callback(lambda _: print(f"⏱️ Startup phase '{name}': {self.timings.get(name, 0):.0f} ms"))
+
+    def report(self) -> str:
+        """Timing of every phase of this on_ready run (deferred ones report when they finish)."""
+        total = (time.perf_counter() - self._started) * 1000 if self._started is not None else 0.0
+        phases = " | ".join(f"{name} {ms:.0f} ms" for name, ms in self.timings.items())
+        run = "ready" if self.runs <= 1 else f"ready again (#{self.runs}, done phases skipped)"
+        return f"⏱️ Startup {run} in {total:.0f} ms: {phases or 'nothing to do'}"
+
+    async def close(self):
+        """Cancel deferred phases still running (on shutdown)."""
+        tasks = [task for task in self._background.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+startup = Startup()
@@ -0,0 +1,241 @@
+"""
+Rate-limit-aware rendering of streamed replies into Discord message edits.
+
+The streaming loop calls update() as often as it likes; a background task turns
+those updates into frames:
+
+- at most one edit per `interval` seconds, always with the *latest* content
+  (intermediate frames that were superseded are skipped, never sent late)
+- the interval adapts: it doubles when an edit is rate limited (HTTP 429) or
+  takes longer than the interval (discord.py waited on a rate-limit bucket),
+  and decays back towards STREAM_INTERVAL while edits are fast
+- Retry-After on a 429 puts the whole channel on cooldown, shared by every
+  reply in that channel
+- at most `max_edits` intermediate frames per reply; finish() always sends
+  the final content
+- replies longer than Discord's 2000 character limit roll over to a new
+  message at a good boundary (see utils.split_point); finished messages are
+  frozen and never edited again, only the newest message is
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+import discord
+
+from .config import STREAM_INTERVAL, STREAM_MAX_INTERVAL, STREAM_MAX_EDITS
+from .utils import DISCORD_MESSAGE_LIMIT, split_message, split_point
+
+# channel id -> time.monotonic() before which no edit should be sent
+_channel_cooldowns: Dict[int, float] = {}
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait after a rate-limited request, or None if `error` is not a rate limit."""
+    if isinstance(getattr(error, "retry_after", None), (int, float)):
+        return float(error.retry_after)  # discord.RateLimited
+    if getattr(error, "status", None) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+class StreamRenderer:
+    """Sends the latest streamed content to the reply's Discord message(s) at an adaptive cadence."""
+
+    def __init__(
+        self,
+        channel,
+        message=None,
+        suffix: str = "",
+        min_interval: float = STREAM_INTERVAL,
+        max_interval: float = STREAM_MAX_INTERVAL,
+        max_edits: int = STREAM_MAX_EDITS,
+        limit: int = DISCORD_MESSAGE_LIMIT,
+    ):
+        """
+        Args:
+            channel: Channel to send the reply in (used if `message` is None).
+            message: Existing message to edit (e.g. the "Thinking..." placeholder).
+            suffix: Appended to intermediate frames only (e.g. a "still typing" marker).
+            min_interval: Seconds between edits when Discord is keeping up.
+            max_interval: Upper bound for the adaptive interval.
+            max_edits: Intermediate frames allowed per reply.
+            limit: Maximum length of one message.
+        """
+        self.channel = channel
+        self.message = message
+        self.suffix = suffix
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.max_edits = max_edits
+        self.limit = limit
+        self.interval = min_interval
+        self.frames = 0
+        self.skipped = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.frozen = []  # Finished messages of a multi-message reply, never edited again
+        self._offset = 0  # Where the live message starts in the content
+        self._reopen = ""  # Code fence reopened at the top of the live message
+        self._latest: Optional[str] = None
+        self._stable = 0
+        self._shown: Optional[str] = None
+        self._last_edit = 0.0
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def channel_id(self):
+        return getattr(self.channel, "id", None)
+
+    @property
+    def messages(self):
+        """Every message of the reply so far, oldest first."""
+        return self.frozen + ([self.message] if self.message is not None else [])
+
+    def update(self, content: str, stable: Optional[int] = None):
+        """
+        Offer new content; only the latest is rendered at the next frame.
+
+        Args:
+            content: The whole reply so far.
+            stable: Length of the prefix of `content` that will not change any
+                more (e.g. text after it may still be rewritten); messages are
+                only frozen inside it. Defaults to all of `content`.
+        """
+        if self._closing.is_set() or not content:
+            return
+        if self._latest is not None and self._latest != self._shown:
+            self.skipped += 1
+        self._latest = content
+        self._stable = len(content) if stable is None else stable
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _ready_at(self) -> float:
+        return max(self._last_edit + self.interval, _channel_cooldowns.get(self.channel_id, 0.0))
+
+    async def _run(self):
+        while (not self._closing.is_set() and self._latest != self._shown
+               and self.frames < self.max_edits):
+            delay = self._ready_at() - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._closing.wait(), delay)
+                    break  # finish() takes over
+                except asyncio.TimeoutError:
+                    pass
+            self.frames += 1
+            content = self._latest
+            if await self._frame(content, self._stable):
+                self._shown = content
+
+    def _freeze(self, cut: int, reopen: str):
+        """The live message is finished; continue the reply in a new one."""
+        self.frozen.append(self.message)
+        self.message = None
+        self._offset += cut - len(self._reopen)
+        self._reopen = reopen
+
+    async def _frame(self, content: str, stable: int) -> bool:
+        """Render `content`, rolling over to new messages when the live one is full."""
+        live = self._reopen + content[self._offset:]
+        while len(live) + len(self.suffix) > self.limit:
+            split = split_point(live, self.limit, max_cut=stable - self._offset + len(self._reopen))
+            if split is None:
+                # Nothing we can freeze yet: show as much as fits for now
+                live = live[:self.limit - len(self.suffix)]
+                break
+            cut, closing, reopen = split
+            if not await self._send(live[:cut] + closing):
+                return False
+            self._freeze(cut, reopen)
+            live = self._reopen + content[self._offset:]
+        return await self._send(live + self.suffix)
+
+    async def _send(self, text: str) -> bool:
+        """One edit (or the first send). Adapts the interval; returns False on failure."""
+        start = time.monotonic()
+        try:
+            if self.message is None:
+                self.message = await self.channel.send(text)
+            else:
+                await self.message.edit(content=text)
+        except discord.HTTPException as e:
+            self._last_edit = time.monotonic()
+            wait = retry_after(e)
+            if wait is not None:
+                self.rate_limited += 1
+                _channel_cooldowns[self.channel_id] = self._last_edit + wait
+                self.interval = min(self.max_interval, self.interval * 2)
+                print(f"🐢 Rate limited editing in channel {self.channel_id}, backing off {wait:.2f}s")
+            else:
+                self.failed += 1
+                print(f"⚠️ Failed to edit/send message chunk: {e}")
+            return False
+        self._last_edit = time.monotonic()
+        if self._last_edit - start > self.interval:
+            self.interval = min(self.max_interval, self.interval * 2)
+        else:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+        return True
+
+    async def finish(self, content: str):
+        """
+        Stop rendering frames and send the final content.
+
+        Returns:
+            The last message of the reply (None if it could not be sent).
+        """
+        self._closing.set()
+        if self._task is not None:
+            await self._task
+        delay = _channel_cooldowns.get(self.channel_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for piece in split_message(self._reopen + content[self._offset:], self.limit):
+            await self._deliver(piece)
+            self.frozen.append(self.message)
+            self.message = None
+        self._offset, self._reopen = len(content), ""
+        return self.frozen[-1] if self.frozen else None
+
+    async def _deliver(self, text: str):
+        """Final edit of the live message (or a new message), falling back to sending."""
+        try:
+            if self.message is not None:
+                await self.message.edit(content=text)
+            else:
+                self.message = await self.channel.send(text)
+        except discord.HTTPException as e:
+            print(f"⚠️ Failed to edit final message: {e}")
+            try:
+                self.message = await self.channel.send(text)
+            except discord.HTTPException as final_send_e:
+                print(f"❌ Failed to send final message: {final_send_e}")
+
+    def cancel(self):
+        """Stop rendering without sending anything else."""
+        self._closing.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def fail(self, content: str):
+        """
+        Stop rendering and show `content` instead of the unfinished reply: on the
+        live message, or as a new message if there is none. Frozen messages keep their text.
+        """
+        self.cancel()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)  # No frame lands after the error
+        await self._deliver(content)
+
+    def __str__(self):
+        return (f"🎞️ Stream render: {len(self.frozen)} messages, {self.frames} edits, {self.skipped} frames skipped, "
+                f"{self.rate_limited} rate limited, interval {self.interval:.2f}s")
@@ -0,0 +1,328 @@
+"""
+Rolling per-channel summary of older chat history.
+
+Prompts used to carry a channel's whole raw history (up to MAX_HISTORY_LEN
+entries), and whatever was evicted from it was simply gone. Now:
+
+- split() gives a request the channel's summary (for the system prompt) and
+  only the history entries the summary does not cover yet.
+- Once more than `trigger` entries are uncovered, a background worker folds
+  the oldest of them (all but the newest `keep`) into the summary with one
+  request_completion() call. It waits for a PRIORITY_LOW scheduler slot, so
+  it never delays a reply.
+- Entries the history store evicts before they were summarized (a burst
+  faster than the worker) are kept in a small backlog and folded in with the
+  next batch.
+
+A summary remembers the last entry it covers (its message id, or role and
+content for entries without one) and is saved next to the history as
+`<channel_id>.lbsum`, together with the evicted backlog on shutdown, so both
+survive restarts.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .async_io import run_blocking
+from .cache_utils import history_store, load_channel_history
+from .config import (
+    CACHE_DIR, HISTORY_CACHE_SIZE, SUMMARY, SUMMARY_TRIGGER, SUMMARY_KEEP, SUMMARY_MAX_CHARS
+)
+from .context_builder import render_transcript
+from .history_records import HistoryRecord
+from .scheduler import PRIORITY_LOW
+
+SUMMARY_SUFFIX = ".lbsum"
+
+SUMMARY_INSTRUCTIONS = (
+    "You keep a running summary of a Discord channel for a chat bot that takes part in it. "
+    "Merge the new messages into the current summary. Keep who said what (name#discriminator), "
+    "open questions, decisions, facts people shared about themselves and anything the bot promised; "
+    "drop greetings and small talk. Reply with the updated summary only, at most {max_chars} characters."
+)
+
+
+async def _complete(messages) -> Optional[str]:
+    from .llm_client import request_completion  # llm_client imports this module
+    return await request_completion(messages, temperature=0.2)
+
+
+def entry_key(entry) -> str:
+    """How a summary remembers the last entry it covers."""
+    entry_id = entry.get("id")
+    return entry_id if entry_id is not None else f"{entry.get('role')}:{entry.get('content')}"
+
+
+def _uncovered_start(timeline, covered: Optional[str], history_start: int) -> int:
+    """
+    Index of the first entry newer than the covered one. If that entry is no
+    longer in `timeline` it fell out of the history a while ago: everything
+    before the history (at `history_start`) is taken as covered.
+    """
+    if covered is None:
+        return 0
+    for index in range(len(timeline) - 1, -1, -1):
+        if entry_key(timeline[index]) == covered:
+            return index + 1
+    return history_start
+
+
+class Summary:
+    __slots__ = ("text", "covered", "updated")
+
+    def __init__(self, text: str = "", covered: Optional[str] = None, updated: float = 0.0):
+        self.text = text
+        self.covered = covered  # entry_key() of the newest entry folded into text
+        self.updated = updated
+
+
+class HistorySummarizer:
+    def __init__(
+        self,
+        enabled: bool = SUMMARY,
+        trigger: int = SUMMARY_TRIGGER,
+        keep: int = SUMMARY_KEEP,
+        max_chars: int = SUMMARY_MAX_CHARS,
+        cache_dir=CACHE_DIR,
+        max_channels: int = HISTORY_CACHE_SIZE,
+        scheduler=None,
+        complete=None,
+    ):
+        """
+        Args:
+            trigger: Uncovered entries that start a summarization.
+            keep: Newest entries always left out of it (sent verbatim).
+            scheduler: ChannelScheduler whose PRIORITY_LOW slot() the worker waits for.
+            complete: `async (messages) -> Optional[str]` (default: request_completion).
+        """
+        self.enabled = enabled
+        self.keep = max(0, keep)
+        self.trigger = max(trigger, self.keep + 1)
+        self.max_chars = max_chars
+        self.cache_dir = Path(cache_dir)
+        self.max_channels = max(1, max_channels)
+        self.scheduler = scheduler
+        self.complete = complete or _complete
+        self.runs = 0
+        self.failures = 0
+        self.summarized = 0  # entries folded into summaries
+        self._summaries: "OrderedDict[str, Summary]" = OrderedDict()
+        self._evicted = {}  # channel -> deque of entries evicted from the history store
+        self._queue: "OrderedDict[str, object]" = OrderedDict()  # channel -> guild id, waiting to be summarized
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._generation = 0  # bumped by wipe(): loads and runs started before it are dropped
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary-io")  # File access stays in order
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self):
+        """Start the background worker and watch the history store's evictions (no-op if running or disabled)."""
+        if self.running or not self.enabled:
+            return
+        if self.evicted not in history_store.evict_listeners:
+            history_store.evict_listeners.append(self.evicted)
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._work())
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self.evicted in history_store.evict_listeners:
+            history_store.evict_listeners.remove(self.evicted)
+        # Entries evicted but not summarized yet would be lost on restart
+        for channel_id, backlog in list(self._evicted.items()):
+            if backlog:
+                await self._save(channel_id, await self.summary(channel_id))
+
+    async def _io(self, func, *args):
+        return await run_blocking(func, *args, executor=self._executor)
+
+    def _path(self, channel_id: str) -> Path:
+        return self.cache_dir / f"{channel_id}{SUMMARY_SUFFIX}"
+
+    def _read(self, channel_id: str) -> Tuple[Summary, list]:
+        """(summary, evicted backlog) of one channel (worker thread)."""
+        path = self._path(channel_id)
+        if not path.exists():
+            return Summary(), []
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return Summary(data.get("text", ""), data.get("covered"), data.get("updated", 0.0)), data.get("evicted", [])
+
+    def _write(self, channel_id: str, summary: Summary, evicted: list):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(channel_id)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(json.dumps({"text": summary.text, "covered": summary.covered,
+                                        "updated": summary.updated, "evicted": evicted}, ensure_ascii=False),
+                            encoding="utf-8")
+        tmp_path.replace(path)
+
+    async def _save(self, channel_id: str, summary: Summary):
+        evicted = [HistoryRecord.from_dict(entry).to_dict() for entry in self._evicted.get(channel_id, ())]
+        try:
+            await self._io(self._write, channel_id, summary, evicted)
+        except Exception as e:
+            print(f"⚠️ Failed to save summary for channel {channel_id}: {e}")
+
+    async def summary(self, channel_id) -> Summary:
+        """The channel's summary (read from disk on first use)."""
+        channel_id = str(channel_id)
+        summary = self._summaries.get(channel_id)
+        if summary is None:
+            generation = self._generation
+            try:
+                summary, evicted = await self._io(self._read, channel_id)
+            except Exception as e:
+                print(f"⚠️ Failed to load summary for channel {channel_id}: {e}")
+                summary, evicted = Summary(), []
+            if generation != self._generation:
+                return Summary()  # Wiped while loading
+            if channel_id in self._summaries:
+                summary = self._summaries[channel_id]  # Another caller loaded it meanwhile
+            else:
+                self._summaries[channel_id] = summary
+                self._restore_backlog(channel_id, evicted)
+            while len(self._summaries) > self.max_channels:
+                oldest, _ = self._summaries.popitem(last=False)
+                self._evicted.pop(oldest, None)
+        self._summaries.move_to_end(channel_id)
+        return summary
+
+    def _restore_backlog(self, channel_id: str, saved: list):
+        """Put the backlog saved on shutdown before the entries evicted since."""
+        if not saved:
+            return
+        current = self._evicted.get(channel_id, ())
+        seen = {entry_key(entry) for entry in current}
+        backlog = deque((HistoryRecord.from_dict(e) for e in saved if entry_key(e) not in seen), maxlen=self.trigger)
+        backlog.extend(current)
+        self._evicted[channel_id] = backlog
+
+    def evicted(self, channel_id, entry):
+        """History store hook: `entry` fell out of the channel's history."""
+        backlog = self._evicted.get(channel_id)
+        if backlog is None:
+            backlog = self._evicted[channel_id] = deque(maxlen=self.trigger)
+            if len(self._evicted) > self.max_channels:
+                del self._evicted[next(iter(self._evicted))]
+        backlog.append(entry)
+
+    def _timeline(self, channel_id: str, history) -> Tuple[list, int]:
+        """Evicted backlog + history, and where the history starts in it."""
+        backlog = list(self._evicted.get(channel_id, ()))
+        return backlog + list(history), len(backlog)
+
+    async def split(self, channel_id, history, guild_id=None) -> Tuple[Optional[str], List]:
+        """
+        What a request should send for this channel.
+
+        Returns:
+            tuple: (summary text or None, the history entries it does not cover).
+            Queues a summarization when too many entries are uncovered.
+        """
+        if not self.enabled:
+            return None, history
+        channel_id = str(channel_id)
+        summary = await self.summary(channel_id)
+        timeline, history_start = self._timeline(channel_id, history)
+        start = _uncovered_start(timeline, summary.covered, history_start)
+        if len(timeline) - start > self.trigger:
+            self.request(channel_id, guild_id)
+        return summary.text or None, timeline[max(start, history_start):]
+
+    def request(self, channel_id, guild_id=None):
+        """Queue a channel for summarization (no-op without a running worker)."""
+        if self.running:
+            self._queue[str(channel_id)] = guild_id
+            self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            channel_id, guild_id = self._queue.popitem(last=False)
+            slot = self.scheduler.slot(priority=PRIORITY_LOW) if self.scheduler is not None else None
+            try:
+                if slot is None:
+                    await self.summarize(channel_id, guild_id)
+                else:
+                    async with slot:
+                        await self.summarize(channel_id, guild_id)
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Summarizing channel {channel_id} failed: {e}")
+
+    async def summarize(self, channel_id, guild_id=None) -> bool:
+        """Fold the channel's uncovered entries, except the newest `keep`, into its summary."""
+        channel_id = str(channel_id)
+        generation = self._generation
+        summary = await self.summary(channel_id)
+        timeline, history_start = self._timeline(channel_id, await load_channel_history(channel_id, guild_id=guild_id))
+        start = _uncovered_start(timeline, summary.covered, history_start)
+        batch = timeline[start:len(timeline) - self.keep]
+        if not batch:
+            return False
+        self.runs += 1
+        started = time.perf_counter()
+        text = await self.complete([
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(max_chars=self.max_chars)},
+            {"role": "user", "content": f"Current summary:\n{summary.text or '(none yet)'}\n\n"
+                                        f"New messages (oldest first):\n{render_transcript(batch)}"},
+        ])
+        if generation != self._generation:
+            return False  # The history was cleared meanwhile: this summary is of nothing
+        if not text or not text.strip():
+            self.failures += 1
+            print(f"⚠️ No summary came back for channel {channel_id}, will retry with the next batch")
+            return False
+        summary.text = text.strip()[:self.max_chars]
+        summary.covered = entry_key(batch[-1])
+        summary.updated = time.time()
+        self.summarized += len(batch)
+        backlog = self._evicted.get(channel_id)
+        if backlog is not None:
+            # Everything evicted so far is older than the newest kept entries, so it is covered now
+            backlog.clear()
+        print(f"📝 Summarized {len(batch)} history entries of channel {channel_id} "
+              f"in {time.perf_counter() - started:.1f}s ({len(summary.text)} chars)")
+        await self._save(channel_id, summary)
+        return True
+
+    def _delete_files(self) -> int:
+        removed = 0
+        for f in self.cache_dir.glob(f"*{SUMMARY_SUFFIX}"):
+            try:
+                f.unlink()
+                removed += 1
+            except Exception as e:
+                print(f"⚠️ Failed to delete summary file {f}: {e}")
+        return removed
+
+    async def wipe(self) -> int:
+        """Forget every summary and delete the files. Returns the number of files removed."""
+        self._generation += 1
+        self._summaries.clear()
+        self._evicted.clear()
+        self._queue.clear()
+        return await self._io(self._delete_files)  # After any write still queued
+
+    def format_stats(self) -> str:
+        state = "on" if self.enabled else "off"
+        return (f"📝 Summaries ({state}): {self.runs} runs, {self.summarized} entries summarized, "
+                f"{self.failures} failed, {len(self._queue)} channels waiting")
+
+
+summarizer = HistorySummarizer()
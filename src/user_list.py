@@ -0,0 +1,172 @@
+"""
+The "Server User List" section of the system prompt.
+
+Listing every member costs O(n log n) per message and blows up the prompt on big
+guilds, so the section is built by a strategy (USER_LIST_STRATEGY) and capped at
+USER_LIST_MAX members:
+
+- "all":       every member (alphabetical), capped
+- "recent":    people who recently spoke in the channel (newest first)
+- "mentioned": people who spoke or were mentioned in the context window
+- "active":    the most active members of the guild
+- "auto":      "all" for small guilds, otherwise mentioned + active up to the cap
+
+Rendered sections are cached per guild and only rebuilt when the selection or
+the guild's member index version (src/member_index.py) changes.
+"""
+import re
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Optional
+
+from .config import USER_LIST_STRATEGY, USER_LIST_MAX
+from .member_index import member_directory
+
+STRATEGIES = ("all", "recent", "mentioned", "active", "auto")
+
+_ID_MENTION = re.compile(r"<@!?(\d{15,21})>")
+_NAME_MENTION = re.compile(r"@([^\s#@<>]{2,32})#(\d{1,4})")
+
+
+class UserActivity:
+    """Per-guild message counts, pruned so memory stays bounded."""
+
+    def __init__(self, max_tracked: int = 2000):
+        self.max_tracked = max_tracked
+        self._counts = {}
+
+    def record(self, guild_id, user_id):
+        counts = self._counts.setdefault(guild_id, Counter())
+        counts[user_id] += 1
+        if len(counts) > self.max_tracked:
+            # Keep the busiest half
+            self._counts[guild_id] = Counter(dict(counts.most_common(self.max_tracked // 2)))
+
+    def top(self, guild_id, n: int) -> List[int]:
+        counts = self._counts.get(guild_id)
+        return [user_id for user_id, _ in counts.most_common(n)] if counts else []
+
+
+user_activity = UserActivity()
+_render_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_RENDER_CACHE_SIZE = 256
+
+
+def _speaker(entry, index):
+    user_id = entry.get("user_id")
+    if user_id and str(user_id).isdigit():
+        return index.get_member(int(user_id))
+    author = entry.get("author")
+    if author and "#" in author:
+        name, disc = author.rsplit("#", 1)
+        return index.find_member(name, disc)
+    return None
+
+
+def recent_speakers(history: Iterable[dict], index) -> List[object]:
+    """Distinct members who spoke in `history`, newest first."""
+    seen, members = set(), []
+    for entry in reversed(list(history or [])):
+        if entry.get("role") != "user":
+            continue
+        member = _speaker(entry, index)
+        if member is not None and member.id not in seen:
+            seen.add(member.id)
+            members.append(member)
+    return members
+
+
+def mentioned_members(history: Iterable[dict], index) -> List[object]:
+    """Members mentioned (<@id> or @name#discriminator) anywhere in `history`."""
+    seen, members = set(), []
+    for entry in reversed(list(history or [])):
+        content = entry.get("content") or ""
+        if "@" not in content:
+            continue
+        found = [index.get_member(int(m)) for m in _ID_MENTION.findall(content)]
+        found += [index.find_member(name, disc) for name, disc in _NAME_MENTION.findall(content)]
+        for member in found:
+            if member is not None and member.id not in seen:
+                seen.add(member.id)
+                members.append(member)
+    return members
+
+
+def _select(strategy, index, guild, history, limit):
+    """Member ids to list, or None for everyone."""
+    if strategy == "all" or (strategy == "auto" and (limit is None or len(index.by_id) <= limit)):
+        return None
+    if strategy == "recent":
+        candidates = recent_speakers(history, index)
+    elif strategy == "active":
+        candidates = [index.get_member(uid) for uid in user_activity.top(guild.id, limit)]
+    else:  # mentioned / auto
+        candidates = recent_speakers(history, index) + mentioned_members(history, index)
+        if strategy == "auto":
+            candidates += [index.get_member(uid) for uid in user_activity.top(guild.id, limit)]
+    ids = []
+    for member in candidates:
+        if member is not None and member.id not in ids:
+            ids.append(member.id)
+            if limit is not None and len(ids) >= limit:
+                break
+    return tuple(sorted(ids))
+
+
+def _render(members, total, bot_user_id, limit):
+    user_lines = []
+    for m in members:
+        line = f"- {m.name}#{m.discriminator} | {m.id}"
+        if bot_user_id is not None and m.id == bot_user_id:
+            line += " | (Your Account)"
+        user_lines.append(line)
+    user_lines = sorted(set(user_lines))
+    if limit is not None and len(user_lines) > limit:
+        user_lines = user_lines[:limit]
+    text = "Server User List:\n" + "\n".join(user_lines)
+    hidden = total - len(user_lines)
+    if hidden > 0:
+        text += f"\n(… {hidden} more members not listed; ping them only if you know their name#discriminator)"
+    return text
+
+
+def render_user_list(
+    guild,
+    bot_user_id=None,
+    history: Optional[List[dict]] = None,
+    strategy: str = USER_LIST_STRATEGY,
+    limit: Optional[int] = USER_LIST_MAX,
+) -> str:
+    """
+    Build (or fetch from cache) the server user list section for the system prompt.
+
+    Args:
+        guild: The discord.Guild, or None.
+        bot_user_id: The bot's own id, marked as "(Your Account)".
+        history: The channel history in the context window (for recent/mentioned).
+        strategy: One of STRATEGIES.
+        limit: Max members listed (None = no cap).
+    """
+    if not guild or not hasattr(guild, "members"):
+        return "Server User List:\n(No user list available)"
+    if strategy not in STRATEGIES:
+        strategy = "auto"
+    index = member_directory.get(guild)
+    selection = _select(strategy, index, guild, history, limit)
+    key = (guild.id, index.version, bot_user_id, limit, selection)
+    cached = _render_cache.get(key)
+    if cached is not None:
+        _render_cache.move_to_end(key)
+        return cached
+
+    if selection is None:
+        members = list(index.members())
+    else:
+        members = [index.get_member(uid) for uid in selection]
+        if bot_user_id is not None and bot_user_id not in selection and index.get_member(bot_user_id):
+            members.append(index.get_member(bot_user_id))
+    text = _render(members, len(index.by_id), bot_user_id, limit if selection is None else None)
+
+    _render_cache[key] = text
+    if len(_render_cache) > _RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+    return text
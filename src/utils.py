@@ -1,7 +1,14 @@
 """Utility functions for error handling and other common operations."""
-from typing import Optional, Union
+import re
+from typing import Iterator, List, Optional, Tuple, Union
 import discord
 
+DISCORD_MESSAGE_LIMIT = 2000
+
+_FENCE = re.compile(r"```([^\s`]*)")
+# Preferred places to end a message, best first; the cut goes after the separator
+_BOUNDARIES = ("\n\n", "\n", ". ", "! ", "? ", " ")
+
 def get_error(
     error: Union[Exception, str],
     prefix: str = "⚠️ Oops an error occurred!",
@@ -62,4 +69,83 @@ def log_error(
     error_msg = get_error(error, **kwargs)
     if context:
         error_msg = f"{context}\n{error_msg}"
-    print(error_msg)
\ No newline at end of file
+    print(error_msg)
+
+def _open_fence(fences: List[re.Match], pos: int) -> Optional[re.Match]:
+    """The code fence still open at `pos`, or None if `pos` is outside code blocks."""
+    opened = None
+    for fence in fences:
+        if fence.start() >= pos:
+            break
+        if pos < fence.end():
+            return fence  # cutting through the ``` itself counts as inside
+        opened = None if opened else fence
+    return opened
+
+def split_point(
+    text: str,
+    limit: int = DISCORD_MESSAGE_LIMIT,
+    max_cut: Optional[int] = None,
+) -> Optional[Tuple[int, str, str]]:
+    """Find where to end a message so that text[:cut] fits in `limit`.
+
+    Prefers paragraph, line, sentence and word boundaries (in that order)
+    outside code blocks, looking no further back than half the limit. If
+    the only way to split is inside a code block, the block is closed at the
+    end of this message and reopened (same language) at the start of the next.
+
+    Args:
+        text: The text that does not fit in one message.
+        limit: Maximum message length.
+        max_cut: Don't cut after this position (e.g. text that may still change).
+
+    Returns:
+        (cut, closing, reopen): send text[:cut] + closing, then continue with
+        reopen + text[cut:]. None if there is no acceptable cut before max_cut.
+    """
+    hard = min(limit, len(text) if max_cut is None else max_cut)
+    floor = limit // 2
+    if hard <= floor:
+        return None
+    fences = list(_FENCE.finditer(text, 0, limit + 3))
+    for sep in _BOUNDARIES:
+        end = hard
+        while True:
+            idx = text.rfind(sep, floor, end)
+            if idx < 0:
+                break
+            cut = idx + len(sep)
+            if cut <= hard and _open_fence(fences, cut) is None:
+                return cut, "", ""
+            end = idx + len(sep) - 1
+    fence = _open_fence(fences, hard)
+    if fence is None:
+        return hard, "", ""
+    if fence.start() < hard < fence.end():
+        # Don't cut through the ``` marker itself; end the message before it
+        if fence.start() <= floor:
+            return hard, "", ""
+        hard = fence.start()
+        fence = _open_fence(fences, hard)
+        if fence is None:
+            return (hard, "", "") if hard > 0 else (limit, "", "")
+    # Inside a code block: close it here and reopen it in the next message
+    reopen = f"```{fence.group(1)}\n"
+    if len(reopen) > limit // 4:
+        return hard, "", ""  # not a real language tag; don't carry it over
+    idx = text.rfind("\n", max(floor, fence.end()), hard - 3)
+    if idx >= 0:
+        return idx + 1, "```", reopen
+    if fence.end() <= hard - 4:
+        return hard - 4, "\n```", reopen
+    # The block opens right at the end: start it in the next message instead
+    return (fence.start(), "", "") if fence.start() > 0 else (limit, "", "")
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> Iterator[str]:
+    """Split text into Discord-sized messages at good boundaries (see split_point)."""
+    while len(text) > limit:
+        cut, closing, reopen = split_point(text, limit)
+        yield text[:cut] + closing
+        text = reopen + text[cut:]
+    if text:
+        yield text
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+from src.async_io import LoopLagMonitor, run_blocking
+import pytest
+
+@pytest.mark.asyncio
+async def test_run_blocking_uses_a_worker_thread():
+    loop_thread = threading.get_ident()
+    thread = await run_blocking(threading.get_ident)
+    assert thread != loop_thread
+    assert await run_blocking(sorted, [3, 1, 2], reverse=True) == [3, 2, 1]
+
+def blocking_call():
+    time.sleep(0.2)
+
+@pytest.mark.asyncio
+async def test_monitor_reports_blocking_callback(capsys):
+    monitor = LoopLagMonitor(threshold=0.05, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.03)
+    blocking_call()  # blocks the loop
+    await asyncio.sleep(0.03)
+    await monitor.stop()
+
+    assert monitor.stalls == 1
+    assert monitor.max_lag >= 0.15
+    assert "blocking_call" in monitor.last_culprit
+    assert "Event loop was blocked" in capsys.readouterr().out
+    assert "1 stalls" in monitor.format_stats()
+
+@pytest.mark.asyncio
+async def test_monitor_is_quiet_when_loop_is_responsive():
+    monitor = LoopLagMonitor(threshold=0.1, interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    await monitor.stop()
+    assert monitor.stalls == 0
+    assert not monitor.running
+
+def test_monitor_disabled_with_zero_threshold():
+    monitor = LoopLagMonitor(threshold=0)
+    monitor.start()  # no running loop needed: nothing starts
+    assert not monitor.running
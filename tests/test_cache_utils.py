@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+import json
+from unittest.mock import MagicMock, patch
+from src.cache_utils import HistoryStore
+from src import history_log
+import pytest
+
+def read_file(tmp_path, channel_id):
+    records, _ = history_log.read_log(tmp_path / f"{channel_id}.lb02")
+    return records
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_memory(tmp_path):
+    history_log.compact(tmp_path / "1.lb02", [{"role": "user", "content": "hi"}])
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+
+    assert await store.get("1") == [{"role": "user", "content": "hi"}]
+    (tmp_path / "1.lb02").unlink()
+    assert await store.get("1") == [{"role": "user", "content": "hi"}]
+
+@pytest.mark.asyncio
+async def test_get_returns_a_copy(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    history = await store.get("1")
+    history.append({"role": "user", "content": "not saved"})
+    assert await store.get("1") == []
+
+@pytest.mark.asyncio
+async def test_without_flush_task_changes_are_written_immediately(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="batch")
+    await store.append("1", {"role": "user", "content": "hi"})
+    assert read_file(tmp_path, "1") == [{"role": "user", "content": "hi"}]
+    assert not list(tmp_path.glob("*.tmp"))
+
+@pytest.mark.asyncio
+async def test_append_trims_to_max_len(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    for i in range(5):
+        await store.append("1", {"role": "user", "content": str(i)}, max_len=3)
+    assert [e["content"] for e in await store.get("1")] == ["2", "3", "4"]
+
+@pytest.mark.asyncio
+async def test_lru_eviction_flushes_dirty_channels(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, max_channels=2, durability="batch")
+    store._flusher = MagicMock(**{'done.return_value': False})  # pretend the flush task is running
+    await store.append("1", {"role": "user", "content": "one"})
+    await store.append("2", {"role": "user", "content": "two"})
+    assert not (tmp_path / "1.lb02").exists()
+
+    await store.append("3", {"role": "user", "content": "three"})
+
+    assert len(store._cache) == 2
+    assert read_file(tmp_path, "1") == [{"role": "user", "content": "one"}]
+    assert not (tmp_path / "2.lb02").exists()
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_in_background(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, flush_interval=0.05, flush_batch=100, durability="batch")
+    store.start()
+    await store.append("1", {"role": "user", "content": "hi"})
+    assert not (tmp_path / "1.lb02").exists()
+
+    await asyncio.sleep(0.15)
+    assert read_file(tmp_path, "1") == [{"role": "user", "content": "hi"}]
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_write_behind_flushes_after_batch_size(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, flush_interval=60, flush_batch=3, durability="batch")
+    store.start()
+    for i in range(3):
+        await store.append("1", {"role": "user", "content": str(i)})
+    await asyncio.sleep(0.01)
+
+    assert len(read_file(tmp_path, "1")) == 3
+    await store.close()
+
+@pytest.mark.asyncio
+async def test_close_flushes_dirty_channels(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, flush_interval=60, flush_batch=100, durability="batch")
+    store.start()
+    await store.set("1", [{"role": "assistant", "content": "bye"}])
+    await store.close()
+    assert read_file(tmp_path, "1") == [{"role": "assistant", "content": "bye"}]
+
+@pytest.mark.asyncio
+async def test_clear_drops_unsaved_changes(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    await store.append("1", {"role": "user", "content": "hi"})
+    store.clear()
+    (tmp_path / "1.lb02").unlink()
+    assert await store.get("1") == []
+
+@pytest.mark.asyncio
+async def test_append_only_writes_new_records(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=10)
+    await store.append("1", {"role": "user", "content": "a"})
+    size = (tmp_path / "1.lb02").stat().st_size
+
+    with patch.object(history_log, 'compact') as mock_compact:
+        await store.append("1", {"role": "user", "content": "b"})
+
+    mock_compact.assert_not_called()
+    assert (tmp_path / "1.lb02").read_bytes().count(b"\n") == 2
+    assert (tmp_path / "1.lb02").stat().st_size < 2 * size + 1
+
+@pytest.mark.asyncio
+async def test_log_is_compacted_to_retained_window(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=3, compact_factor=2)
+    for i in range(7):
+        await store.append("1", {"role": "user", "content": str(i)})
+
+    assert [e["content"] for e in read_file(tmp_path, "1")] == ["4", "5", "6"]
+    fresh = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=3)
+    assert [e["content"] for e in await fresh.get("1")] == ["4", "5", "6"]
+
+@pytest.mark.asyncio
+async def test_torn_last_record_is_skipped_and_repaired(tmp_path):
+    path = tmp_path / "1.lb02"
+    history_log.compact(path, [{"role": "user", "content": "ok"}])
+    with open(path, "ab") as f:
+        f.write(b'{"role":"user","cont')  # crash mid-append
+
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    assert await store.get("1") == [{"role": "user", "content": "ok"}]
+
+    await store.append("1", {"role": "user", "content": "after crash"})
+    assert [e["content"] for e in read_file(tmp_path, "1")] == ["ok", "after crash"]
+
+@pytest.mark.asyncio
+async def test_legacy_file_is_migrated_lazily(tmp_path):
+    legacy = tmp_path / "1.lb01"
+    legacy.write_text(json.dumps([{"role": "user", "content": "old"}]), encoding="utf-8")
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+
+    assert await store.get("1") == [{"role": "user", "content": "old"}]
+    assert legacy.exists()  # reading alone does not migrate
+
+    await store.append("1", {"role": "assistant", "content": "new"})
+    assert not legacy.exists()
+    assert [e["content"] for e in read_file(tmp_path, "1")] == ["old", "new"]
+
+@pytest.mark.asyncio
+async def test_disk_io_runs_off_the_event_loop(tmp_path):
+    history_log.compact(tmp_path / "1.lb02", [{"role": "user", "content": "hi"}])
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    loop_thread = threading.get_ident()
+    threads = []
+    read_log = history_log.read_log
+
+    def slow_read(path):
+        threads.append(threading.get_ident())
+        time.sleep(0.05)
+        return read_log(path)
+
+    ticks = 0
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    task = asyncio.create_task(ticker())
+    with patch.object(history_log, 'read_log', side_effect=slow_read):
+        first, second = await asyncio.gather(store.get("1"), store.get("1"))
+    task.cancel()
+
+    assert first == second == [{"role": "user", "content": "hi"}]
+    assert len(threads) == 1 and threads[0] != loop_thread  # one read, shared, in a worker thread
+    assert ticks > 3  # the loop kept running during the read
+
+@pytest.mark.asyncio
+async def test_wipe_deletes_files_after_queued_writes(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+    await store.append("1", {"role": "user", "content": "hi"})
+    await store.append("2", {"role": "user", "content": "hi"})
+
+    assert await store.wipe() == 2
+    assert not list(tmp_path.glob("*.lb02"))
+    assert await store.get("1") == []
+
+@pytest.mark.asyncio
+async def test_append_is_idempotent_per_message_id(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=2)
+    assert await store.append("1", {"id": "10", "role": "user", "content": "a"})
+    assert not await store.append("1", {"id": "10", "role": "user", "content": "a"})  # replayed
+    assert [e["id"] for e in await store.get("1")] == ["10"]
+    assert len(read_file(tmp_path, "1")) == 1
+
+    await store.append("1", {"id": "11", "role": "user", "content": "b"})
+    await store.append("1", {"id": "12", "role": "user", "content": "c"})  # trims "10"
+    fresh = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=2)
+    assert not await fresh.append("1", {"id": "12", "role": "user", "content": "c"})
+
+@pytest.mark.asyncio
+async def test_double_stored_legacy_history_is_deduplicated(tmp_path):
+    legacy = tmp_path / "1.lb01"
+    legacy.write_text(json.dumps([
+        {"role": "user", "content": "hi", "author": "alice#0"},
+        {"role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ]), encoding="utf-8")
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate")
+
+    history = await store.get("1")
+    assert [e["role"] for e in history] == ["user", "assistant"]
+    assert history[0]["user_id"] == "42" and "author" not in history[0]
+
+    await store.append("1", {"role": "user", "content": "new"})
+    assert not legacy.exists()
+    assert [e["content"] for e in read_file(tmp_path, "1")] == ["hi", "hello", "new"]
+
+def test_parse_history_limits():
+    from src.config import parse_history_limits
+    assert parse_history_limits("") == ({}, {})
+    assert parse_history_limits(" 111=50, guild:222=400,bad,333=x") == ({111: 50}, {222: 400})
+
+@pytest.mark.asyncio
+async def test_history_length_per_channel_and_guild(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=5,
+                         channel_limits={1: 2}, guild_limits={9: 3})
+    for i in range(6):
+        await store.append("1", {"role": "user", "content": str(i)}, guild_id=9)  # channel override wins
+        await store.append("2", {"role": "user", "content": str(i)}, guild_id=9)
+        await store.append("3", {"role": "user", "content": str(i)})
+
+    assert [e["content"] for e in await store.get("1")] == ["4", "5"]
+    assert [e["content"] for e in await store.get("2")] == ["3", "4", "5"]
+    assert [e["content"] for e in await store.get("3")] == ["1", "2", "3", "4", "5"]
+    assert [e["content"] for e in await store.get("3", last=2)] == ["4", "5"]
+
+@pytest.mark.asyncio
+async def test_learning_the_guild_resizes_a_cached_channel(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="immediate", max_len=5, guild_limits={9: 2})
+    for i in range(4):
+        await store.append("1", {"role": "user", "content": str(i)})
+
+    await store.append("1", {"role": "user", "content": "4"}, guild_id=9)
+
+    assert [e["content"] for e in await store.get("1")] == ["3", "4"]
+    assert [e["content"] for e in read_file(tmp_path, "1")] == ["3", "4"]
+
+@pytest.mark.asyncio
+async def test_wipe_during_flush_leaves_no_history_behind(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, durability="batch", flush_interval=60, flush_batch=1000)
+    store.start()
+    for channel_id in ("1", "2", "3"):
+        await store.append(channel_id, {"role": "user", "content": f"secret {channel_id}"})
+    append = store._append
+
+    def slow_append(channel_id, records):
+        time.sleep(0.05)
+        append(channel_id, records)
+
+    with patch.object(store, "_append", slow_append):
+        flushing = asyncio.create_task(store.flush())
+        await asyncio.sleep(0.01)  # The first write is in progress, two more are taken and waiting
+        await store.wipe()
+        await flushing
+
+    assert not list(tmp_path.glob("*.lb02"))
+    assert await store.get("1") == []
+    await store.close()
@@ -0,0 +1,87 @@
+import asyncio
+from unittest.mock import patch
+from src.client_registry import ClientRegistry
+import src.client_registry
+import pytest
+
+@pytest.fixture
+def config_files(tmp_path):
+    provider_file = tmp_path / "provider.txt"
+    provider_file.write_text(
+        "name=First\napiKey=\nbaseUrl=http://127.0.0.1:1/v1\n====\n"
+        "name=Second\napiKey=sk-test\nbaseUrl=http://127.0.0.1:2/v1\n"
+    )
+    models_file = tmp_path / "models.txt"
+    models_file.write_text("provider=First\nmodel-id=model-a\n")
+    return str(provider_file), str(models_file)
+
+@pytest.mark.asyncio
+async def test_config_parsed_once_and_client_reused(config_files):
+    provider_file, models_file = config_files
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file)
+
+    with patch.object(src.client_registry, 'load_providers', wraps=src.client_registry.load_providers) as mock_load:
+        client1 = registry.checkout(registry.providers[0])
+        client2 = registry.checkout(registry.providers[0])
+
+    assert mock_load.call_count == 1
+    assert client1 is client2
+    assert registry.models[0]["model-id"] == "model-a"
+    await registry.checkin(client1)
+    await registry.checkin(client2)
+    assert not client1.is_closed()  # Checked-in clients stay pooled
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_one_client_per_provider(config_files):
+    provider_file, models_file = config_files
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file)
+
+    first, second = registry.providers
+    assert registry.get_client(first) is not registry.get_client(second)
+    assert registry.get_client(second).api_key == "sk-test"
+    assert registry.get_client(first).api_key == "not-required"
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_aclose_closes_and_forgets_clients(config_files):
+    provider_file, models_file = config_files
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file)
+
+    client = registry.get_client(registry.providers[0])
+    await registry.aclose()
+
+    assert client.is_closed()
+    new_client = registry.get_client(registry.providers[0])
+    assert new_client is not client
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_reload_keeps_clients_in_use_open_until_checked_in(config_files):
+    provider_file, models_file = config_files
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file)
+    first, second = registry.providers
+    busy = registry.checkout(first)
+    idle = registry.get_client(second)
+
+    await registry.reload()
+
+    assert idle.is_closed()
+    assert not busy.is_closed()  # a request is still using it
+    assert registry.get_client(first) is not busy  # new requests get a new client
+    await registry.checkin(busy)
+    assert busy.is_closed()
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_retired_client_closed_after_grace_period(config_files):
+    provider_file, models_file = config_files
+    registry = ClientRegistry(provider_file=provider_file, models_file=models_file, retired_grace=0.01)
+    busy = registry.checkout(registry.providers[0])
+
+    await registry.reload()
+    await asyncio.sleep(0.05)
+
+    assert busy.is_closed()
+    await registry.checkin(busy)  # the late check-in is harmless
+    await registry.aclose()
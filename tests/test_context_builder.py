@@ -0,0 +1,87 @@
+from unittest.mock import patch
+from src.context_builder import (
+    TokenCounter, build_context, context_budget, heuristic_tokenizer, MESSAGE_OVERHEAD
+)
+
+def word_tokenizer(text):
+    return len(text.split())
+
+def user_entry(content, name="TestUser"):
+    return {"role": "user", "name": name, "discriminator": "1234", "user_id": "1", "content": content}
+
+def test_everything_fits():
+    counter = TokenCounter(word_tokenizer)
+    history = [user_entry("hello"), {"role": "assistant", "content": "hi there"}]
+    messages, report = build_context("be nice", history, budget=1000, counter=counter)
+
+    assert messages[0] == {"role": "system", "content": "be nice"}
+    assert messages[1]["content"] == "TestUser#1234 (1) says: hello"
+    assert messages[2] == {"role": "assistant", "content": "hi there"}
+    assert report.included == 2
+    assert report.dropped == 0
+    assert report.tokens <= 1000
+
+def test_oldest_entries_dropped_newest_first():
+    counter = TokenCounter(word_tokenizer)
+    history = [{"role": "assistant", "content": "word " * 10} for _ in range(10)]
+    history.append({"role": "assistant", "content": "newest"})
+    per_entry = 10 + MESSAGE_OVERHEAD
+    budget = 2 * (1 + MESSAGE_OVERHEAD) + 2 * per_entry + 5  # newest + 2 full entries, too little left to truncate
+
+    messages, report = build_context("sys", history, budget=budget, counter=counter)
+
+    assert messages[-1]["content"] == "newest"
+    assert report.included == 3
+    assert report.dropped == 8
+    assert not report.truncated
+    assert report.tokens <= budget
+
+def test_oldest_fitting_entry_is_truncated():
+    counter = TokenCounter(word_tokenizer)
+    history = [{"role": "assistant", "content": " ".join(f"w{i}" for i in range(100))},
+               {"role": "assistant", "content": "newest"}]
+    budget = 1 + MESSAGE_OVERHEAD + (1 + MESSAGE_OVERHEAD) + MESSAGE_OVERHEAD + 40
+
+    messages, report = build_context("sys", history, budget=budget, counter=counter)
+
+    assert report.truncated
+    assert messages[1]["content"].endswith("w99")
+    assert "w0 " not in messages[1]["content"]
+    assert report.tokens <= budget
+
+def test_newest_entry_is_always_kept():
+    counter = TokenCounter(heuristic_tokenizer)
+    history = [user_entry("x" * 4000)]
+    messages, report = build_context(None, history, budget=100, counter=counter)
+
+    assert len(messages) == 1
+    assert report.tokens <= 100
+    assert messages[0]["content"].endswith("xxxx")
+
+def test_token_counts_are_cached():
+    calls = []
+
+    def counting_tokenizer(text):
+        calls.append(text)
+        return len(text)
+
+    counter = TokenCounter(counting_tokenizer)
+    history = [{"role": "assistant", "content": "same"}] * 5
+    build_context("sys", history, budget=1000, counter=counter)
+    build_context("sys", history, budget=1000, counter=counter)
+
+    assert calls.count("same") == 1
+    assert calls.count("sys") == 1
+
+def test_context_budget_from_model_entry():
+    assert context_budget({"model-id": "m", "context-tokens": "1234"}) == 1234
+    assert context_budget({"model-id": "m"}) > 0
+    assert context_budget(None) > 0
+
+def test_default_tokenizer_loads_on_first_count():
+    with patch('src.context_builder.load_tokenizer', return_value=word_tokenizer) as load:
+        counter = TokenCounter()
+        load.assert_not_called()
+        assert counter.count("two words") == 2
+        counter.count("three more words")
+    load.assert_called_once()
@@ -0,0 +1,225 @@
+import asyncio
+from benchmarks.openai_stub import OpenAIStub
+from src.circuit_breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from src.client_registry import ClientRegistry
+from src.hedging import HedgePolicy
+from src.router import Router
+import pytest
+import pytest_asyncio
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+@pytest_asyncio.fixture
+async def stubs(tmp_path):
+    """Two local providers: `primary` (first in the config) and `backup`."""
+    primary = await OpenAIStub(reply="from primary").start()
+    backup = await OpenAIStub(reply="from backup").start()
+    (tmp_path / "provider.txt").write_text(
+        f"name=Primary\napiKey=\nbaseUrl={primary.base_url}\n====\n"
+        f"name=Backup\napiKey=\nbaseUrl={backup.base_url}\n"
+    )
+    (tmp_path / "models.txt").write_text("provider=Primary\nmodel-id=p\n====\nprovider=Backup\nmodel-id=b\n")
+    registry = ClientRegistry(str(tmp_path / "provider.txt"), str(tmp_path / "models.txt"), max_retries=0)
+    yield primary, backup, registry
+    await registry.aclose()
+    await primary.stop()
+    await backup.stop()
+
+def make_router(registry, failures=2, reset=30.0, hedging=None):
+    return Router(registry, strategy="first",
+                  breaker_factory=lambda: CircuitBreaker(failure_threshold=failures, reset_timeout=reset, slow_call=0),
+                  hedging=hedging or HedgePolicy(enabled=False))
+
+def hedge_policy(budget=1.0):
+    return HedgePolicy(enabled=True, min_delay=0.05, budget=budget)
+
+async def read_stream(stream):
+    return "".join([chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices])
+
+@pytest.mark.asyncio
+async def test_fails_over_to_next_provider(stubs):
+    primary, backup, registry = stubs
+    primary.fail_status = 503
+    router = make_router(registry)
+
+    completion = await router.complete(MESSAGES)
+
+    assert completion.choices[0].message.content == "from backup"
+    assert primary.requests == 1
+    primary_route, backup_route = router.routes
+    assert router.breaker(primary_route).failures == 1
+    assert (primary_route.errors, backup_route.completed) == (1, 1)
+
+@pytest.mark.asyncio
+async def test_circuit_opens_then_half_open_probe_closes_it(stubs):
+    primary, backup, registry = stubs
+    primary.fail_status, primary.fail_times = 500, 2
+    router = make_router(registry, failures=2, reset=0.1)
+    primary_route = router.routes[0]
+
+    for _ in range(3):
+        await router.complete(MESSAGES)
+    assert router.breaker(primary_route).state == OPEN
+    assert primary.requests == 2  # the third request skipped the open circuit
+
+    await asyncio.sleep(0.12)
+    completion = await router.complete(MESSAGES)  # half-open probe succeeds
+    assert completion.choices[0].message.content == "from primary"
+    assert router.breaker(primary_route).state == CLOSED
+
+@pytest.mark.asyncio
+async def test_streaming_fails_over_before_first_token(stubs):
+    primary, backup, registry = stubs
+    primary.break_after = 0  # connection drops before any token
+    router = make_router(registry)
+
+    lease, stream = await router.open_completion(MESSAGES, stream=True)
+    assert lease.model_id == "b"
+    assert await read_stream(stream) == "from backup"
+    await router.release(lease)
+
+@pytest.mark.asyncio
+async def test_streaming_never_fails_over_after_first_token(stubs):
+    primary, backup, registry = stubs
+    primary.break_after = 1
+    router = make_router(registry)
+
+    lease, stream = await router.open_completion(MESSAGES, stream=True)
+    assert lease.model_id == "p"
+    with pytest.raises(Exception):
+        await read_stream(stream)
+    await router.release(lease, ok=False)
+    assert backup.requests == 0
+    assert router.breaker(lease.route).failures == 1
+
+@pytest.mark.asyncio
+async def test_invalid_requests_are_not_failed_over(stubs):
+    primary, backup, registry = stubs
+    primary.fail_status = 400
+    router = make_router(registry)
+
+    import openai  # Only where needed: importing openai dominates test collection time
+    with pytest.raises(openai.BadRequestError):
+        await router.complete(MESSAGES)
+    assert backup.requests == 0
+    assert router.breaker(router.routes[0]).failures == 0
+
+@pytest.mark.asyncio
+async def test_total_deadline(stubs):
+    primary, backup, registry = stubs
+    primary.delay = backup.delay = 1.0
+    router = make_router(registry)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    with pytest.raises(asyncio.TimeoutError):
+        await router.complete(MESSAGES, deadline=0.2)
+    assert loop.time() - start < 0.5
+
+@pytest.mark.asyncio
+async def test_all_providers_down_raises_last_error(stubs):
+    primary, backup, registry = stubs
+    primary.fail_status = backup.fail_status = 502
+    router = make_router(registry)
+
+    import openai
+    with pytest.raises(openai.InternalServerError):
+        await router.complete(MESSAGES)
+    assert (primary.requests, backup.requests) == (1, 1)
+
+def test_breaker_counts_slow_calls_and_reopens_on_failed_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0, slow_call=1.0)
+    breaker.on_request(); breaker.record(True, latency=0.5)
+    assert breaker.state == CLOSED and breaker.failures == 0
+    breaker.on_request(); breaker.record(True, latency=2.0)
+    breaker.on_request(); breaker.record(False)
+    assert breaker.state == OPEN and breaker.trips == 1
+
+    assert breaker.available()
+    breaker.on_request()
+    assert breaker.state == HALF_OPEN and not breaker.available()  # one probe at a time
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.trips == 2
+
+# --- Hedged requests ---
+
+@pytest.mark.asyncio
+async def test_hedge_wins_when_first_token_is_late(stubs):
+    primary, backup, registry = stubs
+    primary.delay = 0.5
+    router = make_router(registry, hedging=hedge_policy())
+
+    completion = await router.complete(MESSAGES)
+
+    assert completion.choices[0].message.content == "from backup"
+    assert (router.hedging.fired, router.hedging.won) == (1, 1)
+    primary_route, backup_route = router.routes
+    assert primary_route.outstanding == 0 and primary_route.errors == 0  # the loser was cancelled, not failed
+    assert router.breaker(primary_route).failures == 0
+    assert "fired 1" in router.format_stats()
+
+@pytest.mark.asyncio
+async def test_streamed_hedge_race(stubs):
+    primary, backup, registry = stubs
+    primary.delay = 0.5
+    router = make_router(registry, hedging=hedge_policy())
+
+    lease, stream = await router.open_completion(MESSAGES, stream=True)
+    assert lease.model_id == "b"
+    assert await read_stream(stream) == "from backup"
+    await router.release(lease)
+
+@pytest.mark.asyncio
+async def test_no_hedge_for_fast_replies(stubs):
+    primary, backup, registry = stubs
+    router = make_router(registry, hedging=hedge_policy())
+
+    for _ in range(3):
+        await router.complete(MESSAGES)
+    assert router.hedging.fired == 0
+    assert backup.requests == 0
+
+@pytest.mark.asyncio
+async def test_hedge_budget(stubs):
+    primary, backup, registry = stubs
+    primary.delay = 0.15
+    router = make_router(registry, hedging=hedge_policy(budget=0.5))
+
+    for _ in range(4):
+        await router.complete(MESSAGES)
+    # Each request earns half a hedge, so only every second one may hedge
+    assert router.hedging.fired == 2
+    assert router.hedging.denied == 2
+
+@pytest.mark.asyncio
+async def test_rejected_hedge_does_not_fault_the_healthy_primary(stubs):
+    primary, backup, registry = stubs
+    primary.delay = 0.5
+    backup.fail_status = 400  # the request itself is bad, not the provider
+    router = make_router(registry, hedging=hedge_policy())
+
+    import openai
+    with pytest.raises(openai.BadRequestError):
+        await router.complete(MESSAGES)
+
+    primary_route, _ = router.routes
+    assert primary_route.outstanding == 0 and primary_route.errors == 0
+    assert router.breaker(primary_route).failures == 0
+
+@pytest.mark.asyncio
+async def test_hedge_budget_earned_once_per_request_not_per_failover(stubs):
+    primary, backup, registry = stubs
+    primary.fail_status = 503
+    router = make_router(registry, hedging=hedge_policy())
+
+    await router.complete(MESSAGES)
+
+    assert router.hedging.requests == 1
+
+def test_hedge_delay_follows_latency_percentile():
+    policy = HedgePolicy(enabled=True, percentile=95, min_delay=0.1)
+    assert policy.delay() == 0.1  # not enough samples yet
+    for ms in range(1, 101):
+        policy.observe(ms / 100)
+    assert policy.delay() == 0.96
+    assert HedgePolicy(enabled=False).delay() is None
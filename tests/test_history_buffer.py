@@ -0,0 +1,47 @@
+from src.history_buffer import ChannelHistory
+
+def entries(n, start=0):
+    return [{"id": str(i), "role": "user", "content": str(i)} for i in range(start, start + n)]
+
+def contents(items):
+    return [e["content"] for e in items]
+
+def test_append_evicts_the_oldest_entry_when_full():
+    history = ChannelHistory(entries(3), capacity=3)
+    evicted = history.append({"id": "3", "role": "user", "content": "3"})
+
+    assert evicted["content"] == "0"
+    assert contents(history) == ["1", "2", "3"]
+    assert "0" not in history and "3" in history
+
+def test_initial_entries_beyond_capacity_keep_the_newest():
+    history = ChannelHistory(entries(5), capacity=2)
+    assert contents(history) == ["3", "4"]
+    assert "2" not in history
+
+def test_unbounded_history():
+    history = ChannelHistory(entries(5))
+    assert history.append({"role": "assistant", "content": "x"}) is None
+    assert history.capacity is None and len(history) == 6
+
+def test_slicing_and_tail():
+    history = ChannelHistory(entries(10), capacity=10)
+    assert contents(history[-3:]) == ["7", "8", "9"]
+    assert contents(history[1:4]) == ["1", "2", "3"]
+    assert contents(history[::-4]) == ["9", "5", "1"]
+    assert contents(history[8:2]) == []
+    assert history[-1]["content"] == "9"
+    assert contents(history.tail(2)) == ["8", "9"]
+    assert history.tail(0) == [] and len(history.tail(50)) == 10
+
+def test_resize():
+    history = ChannelHistory(entries(5), capacity=5)
+    history.resize(2)
+    assert contents(history) == ["3", "4"] and "0" not in history
+    history.resize(4)
+    history.append({"id": "5", "role": "user", "content": "5"})
+    assert contents(history) == ["3", "4", "5"]
+
+def test_to_records_is_the_stored_form():
+    stored = entries(2) + [{"role": "assistant", "content": "hi", "type": "joke"}]
+    assert ChannelHistory(stored, capacity=10).to_records() == stored
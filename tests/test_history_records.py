@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock
+from src.context_builder import render_entry
+from src.history_records import HistoryRecord, assistant_record, migrate, user_record
+
+def make_message(message_id=111, content="hi"):
+    message = MagicMock()
+    message.id = message_id
+    message.author.name = "alice"
+    message.author.discriminator = "0"
+    message.author.id = 42
+    message.content = content
+    return message
+
+def test_user_record_is_keyed_by_message_id():
+    assert user_record(make_message()) == {
+        "id": "111", "role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "hi",
+    }
+
+def test_records_without_a_discord_id_have_no_id():
+    assert "id" not in assistant_record("hello")
+    assert "id" not in assistant_record("hello", MagicMock())  # mock id is no snowflake
+    assert assistant_record("joke", make_message(7), type="joke") == {
+        "id": "7", "role": "assistant", "content": "joke", "type": "joke",
+    }
+
+def test_migrate_merges_double_stored_user_messages():
+    records = [
+        {"role": "user", "content": "hi", "author": "alice#0"},
+        {"role": "user", "content": "yo", "author": "bob#1234"},
+        {"role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "hi"},
+        {"role": "user", "name": "bob", "discriminator": "1234", "user_id": "7", "content": "yo"},
+        {"role": "assistant", "content": "hello both"},
+    ]
+    migrated, changed = migrate(records)
+
+    assert changed
+    assert migrated == [
+        {"role": "user", "content": "hi", "name": "alice", "discriminator": "0", "user_id": "42"},
+        {"role": "user", "content": "yo", "name": "bob", "discriminator": "1234", "user_id": "7"},
+        {"role": "assistant", "content": "hello both"},
+    ]
+
+def test_migrate_keeps_unanswered_and_repeated_messages():
+    records = [
+        {"role": "user", "content": "lol", "author": "alice#0"},  # skipped by the relevance gate
+        {"role": "user", "content": "lol", "author": "alice#0"},
+        {"role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "lol"},
+    ]
+    migrated, _ = migrate(records)
+
+    assert [r.get("user_id") for r in migrated] == [None, "42"]
+    assert migrated[0] == {"role": "user", "content": "lol", "name": "alice", "discriminator": "0"}
+
+def test_migrate_drops_repeated_ids():
+    records = [{"id": "1", "role": "user", "content": "a"}, {"id": "1", "role": "user", "content": "a"},
+               {"id": "2", "role": "assistant", "content": "b"}]
+    assert migrate(records) == (records[::2], True)
+    assert migrate(records[::2]) == (records[::2], False)
+
+def test_records_read_like_the_stored_dicts():
+    stored = {"id": "5", "role": "user", "name": "alice", "discriminator": "0", "user_id": "42",
+              "content": "hi", "type": "note"}
+    record = HistoryRecord.from_dict(stored)
+
+    assert record == stored and record.to_dict() == stored
+    assert list(record) == list(stored)
+    assert record["user_id"] == "42" and record.get("author") is None and "id" in record
+    assert HistoryRecord.from_dict({"role": "assistant", "content": "x"}).to_dict() == {"role": "assistant", "content": "x"}
+
+def test_authors_are_shared_between_records():
+    first = user_record(make_message(1, "a"))
+    second = HistoryRecord.from_dict({"role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "b"})
+    assert first.author is second.author
+
+def test_api_message_matches_dict_rendering():
+    for stored in (
+        {"role": "user", "name": "alice", "discriminator": "0", "user_id": "42", "content": "hi"},
+        {"role": "user", "name": "bob", "content": "partial author"},
+        {"role": "user", "content": "no author"},
+        {"role": "assistant", "content": "hello"},
+    ):
+        assert render_entry(HistoryRecord.from_dict(stored)) == render_entry(stored)
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, PropertyMock
+import discord
+from src.member_index import GuildIndex, MemberDirectory, member_directory
+from src.mention_utils import replace_mentions
+import pytest
+
+def make_member(member_id, name, discriminator="0", guild=None):
+    return SimpleNamespace(id=member_id, name=name, discriminator=discriminator, guild=guild)
+
+def make_role(role_id, name, guild=None):
+    return SimpleNamespace(id=role_id, name=name, guild=guild)
+
+@pytest.fixture
+def guild():
+    guild = SimpleNamespace(id=42)
+    guild.members = [
+        make_member(111111111111111111, "TestUser", "1234", guild),
+        make_member(222222222222222222, "another", "0", guild),
+    ]
+    guild.roles = [make_role(1, "@everyone", guild), make_role(2, "Admin", guild)]
+    return guild
+
+def test_lookups(guild):
+    index = GuildIndex(guild)
+    assert index.find_member("TestUser", "1234").id == 111111111111111111
+    assert index.find_member("TestUser", "9999") is None
+    assert index.get_member(222222222222222222).name == "another"
+    assert index.find_role("Admin").id == 2
+
+def test_member_events_update_index(guild):
+    directory = MemberDirectory()
+    index = directory.get(guild)
+    version = index.version
+
+    newcomer = make_member(333333333333333333, "Newbie", "0", guild)
+    directory.on_member_join(newcomer)
+    assert index.find_member("Newbie", "0") is newcomer
+
+    renamed = make_member(333333333333333333, "Veteran", "0", guild)
+    directory.on_member_update(newcomer, renamed)
+    assert index.find_member("Newbie", "0") is None
+    assert index.find_member("Veteran", "0") is renamed
+
+    directory.on_member_remove(renamed)
+    assert index.get_member(333333333333333333) is None
+    assert index.version > version
+
+def test_user_rename_reindexes_cached_member(guild):
+    directory = MemberDirectory()
+    index = directory.get(guild)
+    member = guild.members[0]
+    before = make_member(member.id, "TestUser", "1234")
+    member.name = "Renamed"  # members proxy their user object
+
+    directory.on_user_update(before, make_member(member.id, "Renamed", "1234"))
+
+    assert index.find_member("TestUser", "1234") is None
+    assert index.find_member("Renamed", "1234") is member
+
+def test_role_events_update_index(guild):
+    directory = MemberDirectory()
+    index = directory.get(guild)
+
+    mods = make_role(3, "Mods", guild)
+    directory.on_role_create(mods)
+    assert index.find_role("Mods") is mods
+
+    renamed = make_role(3, "Moderators", guild)
+    directory.on_role_update(mods, renamed)
+    assert index.find_role("Mods") is None
+    assert index.find_role("Moderators") is renamed
+
+    directory.on_role_delete(renamed)
+    assert index.find_role("Moderators") is None
+
+def test_replace_mentions_does_not_rescan_members():
+    guild = MagicMock(spec=discord.Guild)
+    members = PropertyMock(return_value=[make_member(123456789012345678, "TestUser", "1234")])
+    type(guild).members = members
+    guild.roles = []
+
+    for _ in range(5):
+        assert replace_mentions("Hi <@TestUser#1234>", guild) == "Hi <@123456789012345678>"
+    assert members.call_count == 1
+    member_directory.forget(guild)
@@ -1,6 +1,7 @@
 from unittest.mock import MagicMock
 import discord
-from src.mention_utils import replace_mentions, load_admins
+from src.mention_utils import replace_mentions, load_admins, StreamingMentionRewriter
+import random
 import pytest
 
 @pytest.fixture
@@ -72,4 +73,46 @@ def test_parse_admin_file():
     assert len(errors) == 1
     assert "TestUser#1234" in valid_admins
     assert "123456789012345678" in valid_admins
-    assert "InvalidLine" in errors[0]
\ No newline at end of file
+    assert "InvalidLine" in errors[0]
+# --- Streaming rewriter: chunked output must equal replace_mentions on the full text ---
+
+FRAGMENTS = ["<@", "<", "@", ">", "#", "TestUser", "AnotherUser", "1234", "5678", "Admin", "everyone",
+             "123456789012345678", "Invalid", " ", "\n", "hi ", ":white_circle:", "<@>", "<@<@"]
+
+def rewrite_in_chunks(text, guild, cuts):
+    rewriter = StreamingMentionRewriter(guild)
+    finalized, last = "", 0
+    for cut in sorted(cuts) + [len(text)]:
+        finalized += rewriter.feed(text[last:cut])
+        last = cut
+        assert rewriter.preview == finalized + rewriter.pending
+    return rewriter.finish()
+
+def test_streaming_rewriter_matches_whole_text_at_every_split(mock_guild):
+    text = "Hey <@TestUser#1234>, <@Admin> and <@everyone>: ask <@Invalid> or <@987654321098765432>."
+    for cut in range(len(text) + 1):
+        assert rewrite_in_chunks(text, mock_guild, [cut]) == replace_mentions(text, mock_guild)
+    assert rewrite_in_chunks(text, mock_guild, range(len(text))) == replace_mentions(text, mock_guild)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_streaming_rewriter_matches_random_text(mock_guild, seed):
+    rng = random.Random(seed)
+    text = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 40)))
+    cuts = rng.sample(range(len(text) + 1), k=min(len(text), rng.randint(0, 12)))
+    assert rewrite_in_chunks(text, mock_guild, cuts) == replace_mentions(text, mock_guild)
+    assert rewrite_in_chunks(text, None, cuts) == replace_mentions(text, None)
+
+def test_streaming_rewriter_holds_only_the_open_mention(mock_guild):
+    rewriter = StreamingMentionRewriter(mock_guild)
+    assert rewriter.feed("Hello <@Test") == "Hello "
+    assert rewriter.pending == "<@Test"
+    assert rewriter.feed("User#1234> bye") == "<@123456789012345678> bye"
+    assert rewriter.pending == ""
+    assert rewriter.finish() == "Hello <@123456789012345678> bye"
+
+def test_streaming_rewriter_unclosed_mention_is_left_as_is(mock_guild):
+    rewriter = StreamingMentionRewriter(mock_guild)
+    for chunk in ["a <@TestUser#1234", " never", " closed"] * 50:
+        rewriter.feed(chunk)
+    text = "a <@TestUser#1234 never closed" * 50
+    assert rewriter.finish() == replace_mentions(text, mock_guild) == text
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from src.member_index import member_directory
+from src.prompt_cache import PromptCache, DYNAMIC_INSTRUCTION
+import pytest
+
+@pytest.fixture
+def guild():
+    guild = SimpleNamespace(id=4242)
+    guild.members = [SimpleNamespace(id=100000000000000001, name="alice", discriminator="0", guild=guild)]
+    guild.roles = [SimpleNamespace(id=1, name="Admin", guild=guild)]
+    yield guild
+    member_directory.forget(guild)
+
+def test_prefix_is_cached(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    first = cache.build(guild, history=[])
+    second = cache.build(guild, history=[])
+
+    assert first == second
+    assert first.startswith("Be LousyBot.")
+    assert "• Admin" in first
+    assert first.rstrip().endswith("alice#0 | 100000000000000001")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_prefix_is_stable_across_user_list_changes(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    before = cache.build(guild, history=[])
+    member_directory.on_member_join(
+        SimpleNamespace(id=100000000000000002, name="bob", discriminator="0", guild=guild)
+    )
+    after = cache.build(guild, history=[])
+
+    assert "bob#0" in after
+    prefix = cache.prefix(guild, dynamic=False)
+    assert before.startswith(prefix) and after.startswith(prefix)
+    assert cache.stats()["misses"] == 1
+
+def test_role_change_rebuilds_prefix(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    cache.build(guild, history=[])
+    member_directory.on_role_create(SimpleNamespace(id=2, name="Mods", guild=guild))
+    guild.roles.append(SimpleNamespace(id=2, name="Mods", guild=guild))
+
+    assert "• Mods" in cache.build(guild, history=[])
+    assert cache.stats()["misses"] == 2
+
+def test_invalidate_and_dynamic_variant(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    plain = cache.build(guild, history=[])
+    dynamic = cache.build(guild, history=[], dynamic=True)
+    assert DYNAMIC_INSTRUCTION not in plain
+    assert DYNAMIC_INSTRUCTION in dynamic
+
+    cache.instructions = "Be nicer."
+    assert cache.build(guild, history=[]) == plain  # still cached
+    cache.invalidate()
+    assert cache.build(guild, history=[]).startswith("Be nicer.")
+
+def test_no_instructions_means_no_system_prompt(guild):
+    assert PromptCache(instructions="").build(guild, history=[]) is None
+
+def test_summary_goes_between_prefix_and_user_list(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    prompt = cache.build(guild, history=[], summary="alice#0 asked about pizza.")
+    prefix = cache.prefix(guild, dynamic=False)
+
+    assert prompt.startswith(prefix + "\n\nSummary of earlier messages in this channel:\nalice#0 asked about pizza.")
+    assert prompt.index("pizza") < prompt.index("alice#0 | 100000000000000001")
+
+def test_recalled_entries_follow_the_summary(guild):
+    cache = PromptCache(instructions="Be LousyBot.")
+    prompt = cache.build(guild, history=[], summary="Talked about pizza.", recalled="alice#0 (1) says: pineapple")
+
+    assert prompt.index("Talked about pizza.") < prompt.index(
+        "Earlier messages in this channel that may be relevant:\nalice#0 (1) says: pineapple"
+    ) < prompt.index("alice#0 | 100000000000000001")
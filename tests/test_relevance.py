@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+from src.relevance import RelevanceGate, Decision, RESPOND, SKIP, ASK
+import pytest
+
+BOT = SimpleNamespace(id=999, name="LousyBot")
+
+def make_message(content, mentions=(), reply_to=None, message_id=1):
+    guild = SimpleNamespace(me=SimpleNamespace(display_name="Lousy"))
+    reference = SimpleNamespace(resolved=SimpleNamespace(author=reply_to)) if reply_to else None
+    return SimpleNamespace(id=message_id, content=content, mentions=list(mentions),
+                           reference=reference, guild=guild)
+
+@pytest.mark.parametrize("message, verdict, reason", [
+    (make_message("hey <@999> what's up", mentions=[BOT]), RESPOND, "mention"),
+    (make_message("sure", reply_to=BOT), RESPOND, "reply"),
+    (make_message("what does lousybot think?"), RESPOND, "name"),
+    (make_message("ask Lousy, it knows"), RESPOND, "name"),
+    (make_message("lol"), SKIP, "ack"),
+    (make_message("ok thx"), SKIP, "ack"),
+    (make_message("😂😂 <:pepe:123456>"), SKIP, "emoji"),
+    (make_message(""), SKIP, "empty"),
+    (make_message("https://example.com/cat.gif"), SKIP, "link"),
+    (make_message("<@5> did you see that", mentions=[SimpleNamespace(id=5)]), SKIP, "mention-other"),
+    (make_message("yes it works", reply_to=SimpleNamespace(id=5)), SKIP, "reply-other"),
+    (make_message("anyone know how to fix a segfault?"), ASK, "default"),
+    (make_message("blousy weather today"), ASK, "default"),
+])
+def test_default_rules(message, verdict, reason):
+    decision = RelevanceGate(audit_rate=0).decide(message, BOT)
+    assert (decision.verdict, decision.reason) == (verdict, reason)
+
+def test_disabled_gate_asks_the_model():
+    gate = RelevanceGate(enabled=False, audit_rate=0)
+    assert gate.decide(make_message("lol"), BOT).verdict == ASK
+
+def test_custom_rules_run_first_match_wins():
+    def shouting(message, bot_user):
+        return Decision(SKIP, "shouting") if message.content.isupper() else None
+
+    gate = RelevanceGate(rules=[shouting], audit_rate=0)
+    assert gate.decide(make_message("HELLO LOUSYBOT"), BOT) == Decision(SKIP, "shouting")
+    assert gate.decide(make_message("hello"), BOT).verdict == ASK
+
+def test_respond_removes_noresponse_option_unless_audited():
+    gate = RelevanceGate(audit_rate=0)
+    mentioned = make_message("<@999> hi", mentions=[BOT], message_id=1)
+    chatter = make_message("anyway", message_id=2)
+    gate.decide(mentioned, BOT)
+    gate.decide(chatter, BOT)
+
+    assert gate.must_respond([chatter, mentioned])
+    assert not gate.must_respond([chatter])
+
+    audited = RelevanceGate(audit_rate=1.0)
+    audited.decide(mentioned, BOT)
+    assert not audited.must_respond([mentioned])
+
+def test_audits_measure_accuracy():
+    gate = RelevanceGate(audit_rate=1.0)
+    for i in range(4):
+        message = make_message("lol", message_id=i)
+        decision = gate.decide(message, BOT)
+        assert decision.verdict == SKIP and decision.audit
+        gate.record([message], responded=(i == 0))
+    asked = make_message("thoughts on rust?", message_id=10)
+    gate.decide(asked, BOT)
+    gate.record([asked], responded=True)
+
+    stats = gate.stats()
+    assert stats["skip/ack"]["accuracy"] == 0.75
+    assert stats["ask/default"]["accuracy"] is None
+    assert stats["ask/default"]["responded"] == 1
+    assert "model agreed 75% of 4" in gate.format_stats()
+
+def test_unaudited_decisions_are_not_compared():
+    gate = RelevanceGate(audit_rate=0)
+    skipped = make_message("lol", message_id=1)
+    mentioned = make_message("<@999> hi", mentions=[BOT], message_id=2)
+    gate.decide(skipped, BOT)
+    gate.decide(mentioned, BOT)
+    gate.record([skipped, mentioned], responded=True, offered=False)
+
+    assert all(s["checked"] == 0 for s in gate.stats().values())
+    assert gate.stats()["skip/ack"]["decisions"] == 1
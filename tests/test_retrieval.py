@@ -0,0 +1,89 @@
+from src.cache_utils import HistoryStore
+from src.history_records import HistoryRecord
+from src.retrieval import ChannelIndex, HistoryRetriever, INDEX_SUFFIX, search, term_counts
+import pytest
+
+def user(i, content, name="alice"):
+    return HistoryRecord.from_dict({"id": str(i), "role": "user", "name": name, "discriminator": "0",
+                                    "user_id": "42", "content": content})
+
+CHATTER = ["hey how is everyone", "good morning", "anyone up for games tonight", "brb coffee", "lol nice"]
+
+def test_term_counts_drop_stopwords_and_case():
+    assert term_counts("The Pizza place, the PIZZA oven!") == {"pizza": 2, "place": 1, "oven": 1}
+    assert term_counts("it is a") == {}
+
+def test_search_ranks_matches_and_returns_them_oldest_first():
+    archive = ChannelIndex([user(0, "my cat is called Miso"), user(1, "good morning")])
+    candidates = [user(2, CHATTER[2]), user(3, "Miso the cat knocked over a plant"), user(4, "nice plant")]
+
+    found = search(archive, candidates, "what is my cat's name? the cat", top_k=2)
+    assert [entry["id"] for entry in found] == ["0", "3"]
+    assert search(archive, candidates, "the", top_k=2) == []
+    assert search(archive, candidates, "volcano", top_k=2) == []
+
+@pytest.mark.asyncio
+async def test_recall_keeps_the_tail_and_recalls_matching_older_entries(tmp_path):
+    retriever = HistoryRetriever(enabled=True, top_k=2, tail=3, cache_dir=tmp_path)
+    history = [user(i, CHATTER[i % len(CHATTER)]) for i in range(10)]
+    history[1] = user(1, "my birthday is on the 12th of March", name="bob")
+
+    recalled, recent = await retriever.recall("1", history, "when is bob's birthday?")
+    assert recent == history[-3:]
+    assert recalled == "bob#0 (42) says: my birthday is on the 12th of March"
+    assert retriever.searches == 1 and retriever.recalled == 1
+
+@pytest.mark.asyncio
+async def test_disabled_retrieval_changes_nothing(tmp_path):
+    history = [user(i, "birthday") for i in range(50)]
+    assert await HistoryRetriever(enabled=False, cache_dir=tmp_path).recall("1", history, "birthday") == (None, history)
+
+@pytest.mark.asyncio
+async def test_evicted_entries_are_archived_and_searchable_after_restart(tmp_path):
+    store = HistoryStore(cache_dir=tmp_path, max_len=3, channel_limits={}, guild_limits={})
+    retriever = HistoryRetriever(enabled=True, top_k=1, tail=2, cache_dir=tmp_path)
+    store.evict_listeners.append(retriever.evicted)
+    await store.append("1", user(0, "the wifi password is hunter2"))
+    for i in range(1, 6):
+        await store.append("1", user(i, CHATTER[i % len(CHATTER)]))
+    await retriever.flush()
+
+    assert len((await retriever.index("1")).entries) == 3
+    assert len((tmp_path / f"1{INDEX_SUFFIX}").read_text().splitlines()) == 3
+
+    fresh = HistoryRetriever(enabled=True, top_k=1, tail=2, cache_dir=tmp_path)
+    recalled, recent = await fresh.recall("1", await store.get("1"), "what's the wifi password")
+    assert "hunter2" in recalled
+    assert recent == (await store.get("1"))[-2:]
+
+@pytest.mark.asyncio
+async def test_entries_archived_while_the_index_loads_are_not_lost(tmp_path):
+    retriever = HistoryRetriever(enabled=True, cache_dir=tmp_path)
+    retriever.evicted("1", user(0, "first"))  # Pending, not written yet
+    index = await retriever.index("1")
+    retriever.evicted("1", user(1, "second"))
+    await retriever.flush()
+
+    assert [entry["content"] for entry in index.entries] == ["first", "second"]
+    fresh = HistoryRetriever(enabled=True, cache_dir=tmp_path)
+    assert [entry["content"] for entry in (await fresh.index("1")).entries] == ["first", "second"]
+
+@pytest.mark.asyncio
+async def test_archive_is_capped(tmp_path):
+    retriever = HistoryRetriever(enabled=True, max_entries=5, cache_dir=tmp_path)
+    for i in range(12):
+        retriever.evicted("1", user(i, f"message number {i}"))
+        await retriever.flush()
+
+    assert len((tmp_path / f"1{INDEX_SUFFIX}").read_text().splitlines()) <= 10
+    fresh = HistoryRetriever(enabled=True, max_entries=5, cache_dir=tmp_path)
+    assert [entry["id"] for entry in (await fresh.index("1")).entries] == ["7", "8", "9", "10", "11"]
+
+@pytest.mark.asyncio
+async def test_wipe_deletes_archives(tmp_path):
+    retriever = HistoryRetriever(enabled=True, cache_dir=tmp_path)
+    retriever.evicted("1", user(0, "secret plans"))
+    await retriever.flush()
+
+    assert await retriever.wipe() == 1
+    assert len(await retriever.index("1")) == 0
@@ -0,0 +1,105 @@
+from collections import Counter
+import asyncio
+from src.client_registry import ClientRegistry
+from src.provider_config import ConfigParseError
+from src.router import Router
+import pytest
+import pytest_asyncio
+
+PROVIDERS = (
+    "name=Fast\napiKey=\nbaseUrl=http://127.0.0.1:1/v1\nmax-concurrency=1\n====\n"
+    "name=Slow\napiKey=\nbaseUrl=http://127.0.0.1:2/v1\n"
+)
+MODELS = (
+    "provider=Fast\nmodel-id=fast-model\nweight=2\n====\n"
+    "provider=slow\nmodel-id=slow-model\n====\n"
+    "provider=Missing\nmodel-id=orphan\n"
+)
+
+@pytest_asyncio.fixture
+async def registry(tmp_path):
+    provider_file = tmp_path / "provider.txt"
+    provider_file.write_text(PROVIDERS)
+    models_file = tmp_path / "models.txt"
+    models_file.write_text(MODELS)
+    registry = ClientRegistry(provider_file=str(provider_file), models_file=str(models_file))
+    yield registry
+    await registry.aclose()
+
+@pytest.mark.asyncio
+async def test_routes_follow_model_provider_links(registry):
+    router = Router(registry)
+    assert [(r.provider["name"], r.model_id, r.weight) for r in router.routes] == [
+        ("Fast", "fast-model", 2.0), ("Slow", "slow-model", 1.0)
+    ]
+
+@pytest.mark.asyncio
+async def test_weighted_round_robin(registry):
+    router = Router(registry, strategy="weighted")
+    picks = []
+    for _ in range(30):
+        lease = await router.acquire()
+        picks.append(lease.model_id)
+        await router.release(lease)
+    assert picks[:3] == ["fast-model", "slow-model", "fast-model"]
+    assert Counter(picks) == {"fast-model": 20, "slow-model": 10}
+
+@pytest.mark.asyncio
+async def test_max_concurrency_overflows_then_waits(registry, tmp_path):
+    (tmp_path / "provider.txt").write_text(PROVIDERS.replace("baseUrl=http://127.0.0.1:2/v1\n", "baseUrl=http://127.0.0.1:2/v1\nmax-concurrency=1\n"))
+    router = Router(registry, strategy="first")
+    first = await router.acquire()
+    second = await router.acquire()
+    assert (first.model_id, second.model_id) == ("fast-model", "slow-model")
+    assert first.client is registry.get_client(first.route.provider)
+
+    third = asyncio.create_task(router.acquire())
+    await asyncio.sleep(0.01)
+    assert not third.done()  # both providers are at their cap
+    await router.release(first)
+    assert (await asyncio.wait_for(third, 1)).model_id == "fast-model"
+
+@pytest.mark.asyncio
+async def test_least_outstanding(registry):
+    router = Router(registry, strategy="least")
+    # Fast has the higher weight but is capped at 1 in flight, so the rest go to Slow
+    leases = [await router.acquire() for _ in range(3)]
+    assert [l.model_id for l in leases] == ["fast-model", "slow-model", "slow-model"]
+    for lease in leases:
+        await router.release(lease)
+    stats = {s["model"]: s for s in router.stats()}
+    assert stats["slow-model"]["completed"] == 2
+    assert stats["fast-model"]["max_concurrency"] == 1
+
+@pytest.mark.asyncio
+async def test_latency_aware_prefers_fast_routes(registry):
+    router = Router(registry, strategy="latency")
+    fast, slow = router.routes
+    first = await router.acquire()
+    assert first.route is fast  # untried routes are tried first
+    second = await router.acquire()
+    assert second.route is slow
+    first.latency, second.latency = 0.1, 2.0
+    await router.release(first)
+    await router.release(second)
+
+    lease = await router.acquire()
+    assert lease.route is fast
+    await router.release(lease)
+    failed = await router.acquire()
+    await router.release(failed, ok=False)
+    assert fast.errors == 1 and fast.samples == 2
+
+@pytest.mark.asyncio
+async def test_invalid_weight_is_a_config_error(registry, tmp_path):
+    (tmp_path / "models.txt").write_text("provider=Fast\nmodel-id=m\nweight=heavy\n")
+    with pytest.raises(ConfigParseError):
+        Router(registry).routes
+
+@pytest.mark.asyncio
+async def test_routes_rebuilt_after_reload(registry, tmp_path):
+    router = Router(registry)
+    assert len(router.routes) == 2
+    (tmp_path / "models.txt").write_text("provider=Slow\nmodel-id=only\n")
+    registry.load(force=True)
+    assert [r.model_id for r in router.routes] == ["only"]
@@ -0,0 +1,352 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from src.scheduler import ChannelScheduler, PRIORITY_HIGH, PRIORITY_LOW
+import pytest
+
+NO_COALESCE = dict(quiet_window=0, max_batch=1)
+
+def make_message(channel_id, text):
+    return SimpleNamespace(channel=SimpleNamespace(id=channel_id), content=text)
+
+@pytest.mark.asyncio
+async def test_channel_order_is_preserved():
+    handled = []
+
+    async def handler(message):
+        await asyncio.sleep(0.001)
+        handled.append(message.content)
+
+    scheduler = ChannelScheduler(handler, max_concurrency=4, **NO_COALESCE)
+    scheduler.start()
+    for i in range(5):
+        await scheduler.put(make_message(1, f"a{i}"))
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert handled == [f"a{i}" for i in range(5)]
+
+@pytest.mark.asyncio
+async def test_slow_channel_does_not_block_others():
+    release_slow = asyncio.Event()
+    handled = []
+
+    async def handler(message):
+        if message.content == "slow":
+            await release_slow.wait()
+        handled.append(message.content)
+
+    scheduler = ChannelScheduler(handler, max_concurrency=2, **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "slow"))
+    await scheduler.put(make_message(2, "fast"))
+    await asyncio.sleep(0.05)
+
+    assert handled == ["fast"]
+    release_slow.set()
+    await scheduler.join()
+    await scheduler.stop()
+    assert handled == ["fast", "slow"]
+
+@pytest.mark.asyncio
+async def test_global_concurrency_limit():
+    active = 0
+    peak = 0
+
+    async def handler(message):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    scheduler = ChannelScheduler(handler, max_concurrency=3, **NO_COALESCE)
+    scheduler.start()
+    for channel in range(10):
+        await scheduler.put(make_message(channel, "hi"))
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert peak == 3
+
+@pytest.mark.asyncio
+async def test_round_robin_between_channels():
+    handled = []
+
+    async def handler(message):
+        handled.append(message.channel.id)
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, **NO_COALESCE)
+    for _ in range(3):
+        await scheduler.put(make_message("busy", "x"))
+    await scheduler.put(make_message("quiet", "x"))
+    scheduler.start()
+    await scheduler.join()
+    await scheduler.stop()
+
+    # The quiet channel is served right after the busy channel's first request
+    assert handled == ["busy", "quiet", "busy", "busy"]
+
+@pytest.mark.asyncio
+async def test_stats_per_channel():
+    gate = asyncio.Event()
+
+    async def handler(message):
+        await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "a"))
+    await scheduler.put(make_message(1, "b"))
+    await asyncio.sleep(0.01)
+
+    stats = scheduler.stats()[1]
+    assert stats["in_flight"] == 1
+    assert stats["queued"] == 1
+    assert stats["oldest_wait"] > 0
+
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+    stats = scheduler.stats()[1]
+    assert stats["processed"] == 2
+    assert stats["queued"] == 0
+    assert stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_burst_while_in_flight_is_coalesced():
+    gate = asyncio.Event()
+    calls = []
+
+    async def handler(*messages):
+        calls.append([m.content for m in messages])
+        if len(calls) == 1:
+            await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=4, quiet_window=0, max_batch=10)
+    scheduler.start()
+    await scheduler.put(make_message(1, "a"))
+    await asyncio.sleep(0.01)
+    for text in "bcd":
+        await scheduler.put(make_message(1, text))
+    assert scheduler.stats()[1]["queued"] == 3
+
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert calls == [["a"], ["b", "c", "d"]]
+    assert scheduler.stats()[1]["coalesced"] == 2
+    assert scheduler.stats()[1]["processed"] == 2
+
+@pytest.mark.asyncio
+async def test_quiet_window_merges_burst():
+    calls = []
+
+    async def handler(*messages):
+        calls.append([m.content for m in messages])
+
+    scheduler = ChannelScheduler(handler, max_concurrency=4, quiet_window=0.05, max_wait=1.0)
+    scheduler.start()
+    for text in "abc":
+        await scheduler.put(make_message(1, text))
+        await asyncio.sleep(0.01)
+    await scheduler.put(make_message(2, "other"))
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert sorted(calls) == [["a", "b", "c"], ["other"]]
+
+@pytest.mark.asyncio
+async def test_max_wait_bounds_the_quiet_window():
+    calls = []
+
+    async def handler(*messages):
+        calls.append((time.monotonic(), [m.content for m in messages]))
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, quiet_window=0.05, max_wait=0.1)
+    scheduler.start()
+    start = time.monotonic()
+    # A message every 20 ms never leaves 50 ms of quiet
+    for i in range(15):
+        await scheduler.put(make_message(1, str(i)))
+        await asyncio.sleep(0.02)
+    await scheduler.join()
+    await scheduler.stop()
+
+    first_at, first_batch = calls[0]
+    assert first_at - start < 0.2
+    assert 1 < len(first_batch) < 15
+    assert [c for _, batch in calls for c in batch] == [str(i) for i in range(15)]
+
+@pytest.mark.asyncio
+async def test_max_batch_starts_a_new_request():
+    gate = asyncio.Event()
+    calls = []
+
+    async def handler(*messages):
+        calls.append(len(messages))
+        await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, quiet_window=0, max_batch=2)
+    scheduler.start()
+    for i in range(5):
+        await scheduler.put(make_message(1, str(i)))
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert calls == [2, 2, 1]
+
+@pytest.mark.asyncio
+async def test_stale_messages_are_shed_when_their_turn_comes():
+    gate = asyncio.Event()
+    handled, shed = [], []
+
+    async def handler(*messages):
+        handled.append([m.content for m in messages])
+        await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, max_age=0.05,
+                                 on_shed=lambda m, reason: shed.append((m.content, reason)), **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "first"))
+    await scheduler.put(make_message(1, "old"))
+    await asyncio.sleep(0.1)
+    await scheduler.put(make_message(2, "new"))
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert handled == [["first"], ["new"]]
+    assert shed == [("old", "stale")]
+    assert scheduler.stats()[1]["shed_stale"] == 1
+
+@pytest.mark.asyncio
+async def test_overload_sheds_oldest_ambient_message():
+    gate = asyncio.Event()
+    handled, shed = [], []
+
+    async def handler(*messages):
+        handled.extend(m.content for m in messages)
+        await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, max_queued=2, max_per_channel=10,
+                                 on_shed=lambda m, reason: shed.append(m.content), **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "running"))
+    await asyncio.sleep(0.01)
+    await scheduler.put(make_message(2, "a"))
+    await scheduler.put(make_message(3, "b"))
+    assert await scheduler.put(make_message(4, "c"))
+    assert shed == ["a"]
+
+    # A full queue of admin messages is never shed for ambient chat
+    await scheduler.put(make_message(5, "admin1"), priority=PRIORITY_HIGH)
+    await scheduler.put(make_message(6, "admin2"), priority=PRIORITY_HIGH)
+    assert not await scheduler.put(make_message(7, "chat"))
+    assert shed == ["a", "b", "c", "chat"]
+
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+    assert handled == ["running", "admin1", "admin2"]
+
+@pytest.mark.asyncio
+async def test_per_channel_limit_keeps_newest_messages():
+    gate = asyncio.Event()
+    handled, shed = [], []
+
+    async def handler(*messages):
+        handled.append([m.content for m in messages])
+        await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, quiet_window=0, max_batch=10, max_per_channel=2,
+                                 on_shed=lambda m, reason: shed.append(m.content))
+    scheduler.start()
+    await scheduler.put(make_message(1, "running"))
+    await asyncio.sleep(0.01)
+    for text in "abcd":
+        await scheduler.put(make_message(1, text))
+    gate.set()
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert shed == ["a", "b"]
+    assert handled == [["running"], ["c", "d"]]
+
+@pytest.mark.asyncio
+async def test_priority_lane_goes_first():
+    handled = []
+
+    async def handler(message):
+        handled.append(message.content)
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, **NO_COALESCE)
+    await scheduler.put(make_message(1, "chat1"))
+    await scheduler.put(make_message(2, "chat2"))
+    await scheduler.put(make_message(3, "admin"), priority=PRIORITY_HIGH)
+    scheduler.start()
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert handled == ["admin", "chat1", "chat2"]
+
+@pytest.mark.asyncio
+async def test_low_priority_slot_waits_for_queued_chat():
+    gate = asyncio.Event()
+    order = []
+
+    async def handler(message):
+        order.append(message.content)
+        if message.content == "running":
+            await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "running"))
+    await asyncio.sleep(0.01)
+
+    async def background():
+        async with scheduler.slot(priority=PRIORITY_LOW):
+            order.append("background")
+
+    task = asyncio.create_task(background())
+    await asyncio.sleep(0.01)
+    await scheduler.put(make_message(2, "chat"))
+    gate.set()
+    await task
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert order == ["running", "chat", "background"]
+
+@pytest.mark.asyncio
+async def test_slot_jumps_ahead_of_queued_chat():
+    gate = asyncio.Event()
+    order = []
+
+    async def handler(message):
+        order.append(message.content)
+        if message.content == "running":
+            await gate.wait()
+
+    scheduler = ChannelScheduler(handler, max_concurrency=1, **NO_COALESCE)
+    scheduler.start()
+    await scheduler.put(make_message(1, "running"))
+    await asyncio.sleep(0.01)
+    await scheduler.put(make_message(2, "chat"))
+
+    async def slash_command():
+        async with scheduler.slot():
+            order.append("slash")
+
+    command = asyncio.create_task(slash_command())
+    await asyncio.sleep(0.01)
+    assert order == ["running"]  # all slots busy
+    gate.set()
+    await command
+    await scheduler.join()
+    await scheduler.stop()
+
+    assert order == ["running", "slash", "chat"]
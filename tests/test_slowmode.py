@@ -1,6 +1,8 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 import discord
 from bot import bot
+from src.cache_utils import history_store
+from src.scheduler import PRIORITY_NORMAL
 import pytest
 
 @pytest.mark.asyncio
@@ -26,7 +28,7 @@ async def test_slowmode_detection():
             "⏳ Please wait 5 seconds between messages (slowmode active)")
 
 @pytest.mark.asyncio
-async def test_normal_message_processing():
+async def test_normal_message_processing(tmp_path):
     # Create mock message without slowmode
     message = AsyncMock(spec=discord.Message)
     message.channel.slowmode_delay = 0
@@ -38,12 +40,39 @@ async def test_normal_message_processing():
     message.author.name = "TestUser"
     message.channel.name = "test-channel"
     
-    # Mock queue and setup
-    with patch('bot.request_queue.put', new_callable=AsyncMock) as mock_put:
+    # Mock queue and setup (the message is stored in a throwaway history)
+    with patch('bot.request_queue.put', new_callable=AsyncMock) as mock_put, \
+         patch.object(history_store, 'cache_dir', tmp_path):
+        history_store.clear()
         # Set ALLOWED_CHANNELS to include this channel
         with patch('bot.ALLOWED_CHANNELS', [message.channel.id]):
             await bot.on_message(message)
-            mock_put.assert_awaited_once_with(message)
+            mock_put.assert_awaited_once_with(message, priority=PRIORITY_NORMAL)
+        history_store.clear()
+
+@pytest.mark.asyncio
+async def test_replayed_message_is_stored_and_queued_once(tmp_path):
+    message = AsyncMock(spec=discord.Message)
+    message.id = 1234567890
+    message.channel.id = 555
+    message.channel.slowmode_delay = 0
+    message.guild = None
+    message.content = "test message"
+    message.author = MagicMock(id=12345, bot=False, discriminator="0")
+    message.author.name = "TestUser"
+    message.webhook_id = None
+
+    with patch('bot.request_queue.put', new_callable=AsyncMock) as mock_put, \
+         patch('bot.ALLOWED_CHANNELS', [message.channel.id]), \
+         patch('bot.ADMIN_IDS', []), \
+         patch.object(history_store, 'cache_dir', tmp_path):
+        history_store.clear()
+        await bot.on_message(message)
+        await bot.on_message(message)  # e.g. redelivered after a gateway resume
+
+        assert mock_put.await_count == 1
+        assert [e["id"] for e in await history_store.get("555")] == ["1234567890"]
+        history_store.clear()
 
 @pytest.mark.asyncio
 async def test_slowmode_bypass_for_bot():
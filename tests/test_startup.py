@@ -0,0 +1,74 @@
+import asyncio
+from src.startup import Startup
+import pytest
+
+@pytest.mark.asyncio
+async def test_phases_run_concurrently_and_once():
+    calls = []
+
+    async def slow(name):
+        calls.append(name)
+        await asyncio.sleep(0.05)
+
+    startup = Startup()
+    assert startup.begin()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await startup.run(("a", lambda: slow("a")), ("b", lambda: slow("b")), ("c", lambda: calls.append("c")))
+    assert loop.time() - start < 0.09  # a and b overlapped
+    assert sorted(calls) == ["a", "b", "c"]
+    assert set(startup.timings) == {"a", "b", "c"}
+
+    assert not startup.begin()  # on_ready again
+    await startup.run(("a", lambda: slow("a")), ("c", lambda: calls.append("c")))
+    assert sorted(calls) == ["a", "b", "c"]
+    assert "ready again (#2" in startup.report()
+
+@pytest.mark.asyncio
+async def test_failed_phase_is_retried_next_time():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("not yet")
+
+    startup = Startup()
+    startup.begin()
+    await startup.run(("flaky", flaky))
+    assert not startup.done("flaky")
+    startup.begin()
+    await startup.run(("flaky", flaky))
+    assert startup.done("flaky")
+    assert len(attempts) == 2
+
+@pytest.mark.asyncio
+async def test_deferred_phase_does_not_block_and_runs_once():
+    release = asyncio.Event()
+    runs = []
+
+    async def welcome():
+        runs.append(1)
+        await release.wait()
+
+    startup = Startup()
+    startup.begin()
+    startup.defer("welcome", welcome)
+    startup.defer("welcome", welcome)  # already running
+    await asyncio.sleep(0)
+    assert runs == [1]
+
+    release.set()
+    await asyncio.sleep(0.01)
+    startup.defer("welcome", welcome)  # already done
+    assert runs == [1]
+    assert startup.done("welcome")
+
+@pytest.mark.asyncio
+async def test_close_cancels_deferred_phases():
+    startup = Startup()
+    startup.begin()
+    startup.defer("forever", lambda: asyncio.sleep(3600))
+    await asyncio.sleep(0)
+    await startup.close()
+    assert not startup.done("forever")
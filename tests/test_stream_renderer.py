@@ -0,0 +1,166 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+import asyncio
+import time
+import discord
+from src import stream_renderer
+from src.stream_renderer import StreamRenderer, retry_after
+import pytest
+
+class FakeMessage:
+    def __init__(self, content, fail_with=None):
+        self.content = content
+        self.edits = []
+        self.fail_with = list(fail_with or [])
+
+    async def edit(self, content):
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        self.edits.append(content)
+        self.content = content
+
+def rate_limited(seconds):
+    response = SimpleNamespace(status=429, reason="Too Many Requests", headers={"Retry-After": str(seconds)})
+    return discord.HTTPException(response, "rate limited")
+
+@pytest.fixture(autouse=True)
+def clear_cooldowns():
+    stream_renderer._channel_cooldowns.clear()
+    yield
+    stream_renderer._channel_cooldowns.clear()
+
+@pytest.mark.asyncio
+async def test_only_latest_content_is_rendered():
+    message = FakeMessage("🤔 Thinking...")
+    renderer = StreamRenderer(SimpleNamespace(id=1), message, suffix="…", min_interval=0.05)
+    text = ""
+    for word in ["a", "b", "c", "d", "e", "f"]:
+        text += word
+        renderer.update(text)
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.06)
+    await renderer.finish(text)
+
+    assert message.content == "abcdef"
+    assert len(message.edits) < 6  # intermediate frames were coalesced
+    assert renderer.skipped > 0
+    assert all(edit.endswith("…") for edit in message.edits[:-1])
+    # Frames only ever move forward
+    frames = [edit.rstrip("…") for edit in message.edits]
+    assert frames == sorted(frames, key=len)
+
+@pytest.mark.asyncio
+async def test_edits_are_bounded_per_reply():
+    message = FakeMessage("")
+    renderer = StreamRenderer(SimpleNamespace(id=2), message, min_interval=0, max_edits=3)
+    for i in range(1, 20):
+        renderer.update("x" * i)
+        await asyncio.sleep(0)
+    await renderer.finish("x" * 20)
+
+    assert len(message.edits) == 4  # 3 frames + the final content
+    assert message.content == "x" * 20
+
+@pytest.mark.asyncio
+async def test_rate_limit_backs_off_whole_channel():
+    message = FakeMessage("", fail_with=[rate_limited(0.05)])
+    renderer = StreamRenderer(SimpleNamespace(id=3), message, min_interval=0.01, max_interval=1)
+    renderer.update("hello")
+    await asyncio.sleep(0.01)
+
+    assert renderer.rate_limited == 1
+    assert renderer.interval == 0.02
+    assert stream_renderer._channel_cooldowns[3] > 0
+    assert message.edits == []  # waiting out Retry-After
+
+    await asyncio.sleep(0.08)
+    assert message.edits == ["hello"]
+    await renderer.finish("hello world")
+    assert message.content == "hello world"
+
+@pytest.mark.asyncio
+async def test_first_frame_sends_new_message():
+    sent = FakeMessage("hi")
+    channel = SimpleNamespace(id=4, send=AsyncMock(return_value=sent))
+    renderer = StreamRenderer(channel, min_interval=0)
+    renderer.update("hi")
+    await asyncio.sleep(0)
+    assert await renderer.finish("hi there") is sent
+    channel.send.assert_awaited_once_with("hi")
+    assert sent.content == "hi there"
+
+@pytest.mark.asyncio
+async def test_cancel_sends_nothing_more():
+    message = FakeMessage("")
+    renderer = StreamRenderer(SimpleNamespace(id=5), message, min_interval=0.05)
+    renderer._last_edit = time.monotonic()  # next frame is due later
+    renderer.update("secret")
+    renderer.cancel()
+    await asyncio.sleep(0.06)
+    assert message.edits == []
+
+def test_retry_after_reads_headers():
+    assert retry_after(rate_limited(2.5)) == 2.5
+    assert retry_after(discord.HTTPException(SimpleNamespace(status=500, reason="x"), "boom")) is None
+    assert retry_after(SimpleNamespace(retry_after=3)) == 3.0
+
+@pytest.mark.asyncio
+async def test_long_reply_rolls_over_and_freezes_finished_messages():
+    sent = []
+
+    async def send(content):
+        message = FakeMessage(content)
+        sent.append(message)
+        return message
+
+    channel = SimpleNamespace(id=6, send=send)
+    renderer = StreamRenderer(channel, min_interval=0, limit=50)
+    text = ""
+    for i in range(30):
+        text += f"line {i}\n"
+        renderer.update(text)
+        await asyncio.sleep(0)
+    last = await renderer.finish(text)
+
+    assert last is sent[-1]
+    assert len(sent) > 1
+    assert all(len(m.content) <= 50 for m in sent)
+    assert "".join(m.content for m in sent) == text
+    # Frozen messages were only edited while they were the live one
+    for message in sent[:-1]:
+        assert message.content.endswith("\n")
+
+@pytest.mark.asyncio
+async def test_rollover_waits_for_stable_text():
+    message = FakeMessage("")
+    channel = SimpleNamespace(id=7, send=AsyncMock())
+    renderer = StreamRenderer(channel, message, min_interval=0, limit=20)
+    renderer.update("hello there <@Someone#12", stable=5)
+    await asyncio.sleep(0)
+
+    channel.send.assert_not_called()  # the unresolved mention can't be frozen yet
+    assert message.edits == ["hello there <@Someon"]
+
+@pytest.mark.asyncio
+async def test_failure_after_rollover_only_touches_the_live_message():
+    sent = []
+
+    async def send(content):
+        message = FakeMessage(content)
+        sent.append(message)
+        return message
+
+    first = FakeMessage("🤔 Thinking...")
+    renderer = StreamRenderer(SimpleNamespace(id=8, send=send), first, min_interval=0, limit=50)
+    text = ""
+    for i in range(10):
+        text += f"line {i}\n"
+        renderer.update(text)
+        await asyncio.sleep(0)
+    assert sent  # rolled over into a second message
+    frozen = first.content
+    await renderer.fail("😵‍💫 Oops!")
+    await asyncio.sleep(0.01)
+
+    assert first.content == frozen
+    assert sent[-1].content == "😵‍💫 Oops!"
@@ -0,0 +1,155 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+from src.history_records import HistoryRecord
+from src.summarizer import HistorySummarizer, entry_key
+import pytest
+
+def make_history(n, start=0):
+    return [HistoryRecord.from_dict({"id": str(i), "role": "user", "name": "alice", "discriminator": "0",
+                                     "user_id": "42", "content": f"message {i}"}) for i in range(start, start + n)]
+
+def make_summarizer(tmp_path, reply="the summary", **kwargs):
+    complete = AsyncMock(return_value=reply)
+    options = dict(enabled=True, trigger=6, keep=2, cache_dir=tmp_path, complete=complete)
+    options.update(kwargs)
+    return HistorySummarizer(**options), complete
+
+@pytest.mark.asyncio
+async def test_split_without_summary_sends_the_whole_history(tmp_path):
+    summarizer, _ = make_summarizer(tmp_path)
+    history = make_history(5)
+    assert await summarizer.split("1", history) == (None, history)
+
+@pytest.mark.asyncio
+async def test_summarize_folds_all_but_the_newest_entries(tmp_path):
+    summarizer, complete = make_summarizer(tmp_path)
+    history = make_history(8)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        assert await summarizer.summarize("1")
+
+    prompt = complete.call_args.args[0][1]["content"]
+    assert "alice#0 (42) says: message 0" in prompt and "message 5" in prompt and "message 6" not in prompt
+    summary, recent = await summarizer.split("1", history)
+    assert summary == "the summary"
+    assert recent == history[6:]
+
+    # Persisted: a fresh summarizer picks up where this one left off
+    fresh, _ = make_summarizer(tmp_path)
+    assert await fresh.split("1", history + make_history(1, 8)) == ("the summary", history[6:] + make_history(1, 8))
+
+@pytest.mark.asyncio
+async def test_next_run_sends_the_current_summary_and_only_new_entries(tmp_path):
+    summarizer, complete = make_summarizer(tmp_path)
+    history = make_history(8)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        await summarizer.summarize("1")
+    history += make_history(4, 8)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        await summarizer.summarize("1")
+
+    prompt = complete.call_args.args[0][1]["content"]
+    assert prompt.startswith("Current summary:\nthe summary")
+    assert "message 5" not in prompt and "message 6" in prompt and "message 9" in prompt
+    assert (await summarizer.summary("1")).covered == entry_key(history[9])
+
+@pytest.mark.asyncio
+async def test_evicted_entries_are_summarized_not_lost(tmp_path):
+    summarizer, complete = make_summarizer(tmp_path)
+    evicted, history = make_history(3), make_history(4, 3)
+    for entry in evicted:
+        summarizer.evicted("1", entry)
+
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        await summarizer.summarize("1")
+
+    assert "message 0" in complete.call_args.args[0][1]["content"]
+    assert not summarizer._evicted["1"]
+    assert (await summarizer.split("1", history))[1] == history[2:]
+
+@pytest.mark.asyncio
+async def test_failed_summary_changes_nothing(tmp_path):
+    summarizer, _ = make_summarizer(tmp_path, reply=None)
+    history = make_history(8)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        assert not await summarizer.summarize("1")
+
+    assert summarizer.failures == 1
+    assert await summarizer.split("1", history) == (None, history)
+    assert not list(tmp_path.glob("*.lbsum"))
+
+@pytest.mark.asyncio
+async def test_worker_summarizes_in_the_background_once_over_the_trigger(tmp_path):
+    summarizer, complete = make_summarizer(tmp_path)
+    summarizer.start()
+    try:
+        history = make_history(6)
+        with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+            await summarizer.split("1", history)
+            await asyncio.sleep(0.01)
+            complete.assert_not_called()  # 6 uncovered entries: not over the trigger yet
+
+            history.append(make_history(1, 6)[0])
+            assert await summarizer.split("1", history) == (None, history)  # the reply doesn't wait
+            await asyncio.sleep(0.01)
+        complete.assert_awaited_once()
+        assert await summarizer.split("1", history) == ("the summary", history[5:])
+    finally:
+        await summarizer.close()
+
+@pytest.mark.asyncio
+async def test_wipe_deletes_summaries(tmp_path):
+    summarizer, _ = make_summarizer(tmp_path)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=make_history(8)):
+        await summarizer.summarize("1")
+
+    assert await summarizer.wipe() == 1
+    assert await summarizer.split("1", make_history(8)) == (None, make_history(8))
+
+@pytest.mark.asyncio
+async def test_covered_entry_gone_means_the_history_is_uncovered_not_everything(tmp_path):
+    summarizer, complete = make_summarizer(tmp_path)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=make_history(8)):
+        await summarizer.summarize("1")  # covers up to message 5
+
+    fresh, complete = make_summarizer(tmp_path)
+    fresh.evicted("1", make_history(1, 4)[0])  # older than the covered entry, which fell out of the history too
+    history = make_history(8, 10)
+    assert await fresh.split("1", history) == ("the summary", history)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=history):
+        await fresh.summarize("1")
+    prompt = complete.call_args.args[0][1]["content"]
+    assert "message 4" not in prompt and "message 10" in prompt
+
+@pytest.mark.asyncio
+async def test_evicted_backlog_survives_a_restart(tmp_path):
+    summarizer, _ = make_summarizer(tmp_path)
+    summarizer.start()
+    for entry in make_history(3):
+        summarizer.evicted("1", entry)
+    await summarizer.close()
+
+    fresh, complete = make_summarizer(tmp_path)
+    fresh.evicted("1", make_history(1, 3)[0])
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=make_history(4, 4)):
+        await fresh.summarize("1")
+    prompt = complete.call_args.args[0][1]["content"]
+    assert prompt.index("message 0") < prompt.index("message 3") < prompt.index("message 5")
+
+@pytest.mark.asyncio
+async def test_summary_finishing_after_wipe_is_dropped(tmp_path):
+    release = asyncio.Event()
+
+    async def slow_complete(messages):
+        await release.wait()
+        return "stale summary"
+
+    summarizer, _ = make_summarizer(tmp_path, complete=slow_complete)
+    with patch('src.summarizer.load_channel_history', new_callable=AsyncMock, return_value=make_history(8)):
+        running = asyncio.create_task(summarizer.summarize("1"))
+        await asyncio.sleep(0.01)
+        await summarizer.wipe()
+        release.set()
+        assert not await running
+
+    assert not list(tmp_path.glob("*.lbsum"))
+    assert await summarizer.split("1", make_history(8)) == (None, make_history(8))
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+from src.member_index import member_directory
+from src.user_list import render_user_list, user_activity
+import pytest
+
+BOT_ID = 999999999999999999
+
+@pytest.fixture
+def big_guild():
+    guild = SimpleNamespace(id=7777, roles=[])
+    guild.members = [
+        SimpleNamespace(id=100000000000000000 + i, name=f"user{i}", discriminator="0", guild=guild)
+        for i in range(5000)
+    ]
+    guild.members.append(SimpleNamespace(id=BOT_ID, name="LousyBot", discriminator="0", guild=guild))
+    yield guild
+    member_directory.forget(guild)
+
+def user_msg(member, content="hi"):
+    return {"role": "user", "name": member.name, "discriminator": member.discriminator,
+            "user_id": str(member.id), "content": content}
+
+def test_prompt_section_is_bounded_on_big_guilds(big_guild):
+    text = render_user_list(big_guild, bot_user_id=BOT_ID, history=[], strategy="all", limit=50)
+    assert text.count("\n- ") == 50
+    assert "more members not listed" in text
+
+def test_recent_strategy_lists_speakers(big_guild):
+    history = [user_msg(big_guild.members[1]), user_msg(big_guild.members[2])]
+    text = render_user_list(big_guild, bot_user_id=BOT_ID, history=history, strategy="recent", limit=10)
+
+    assert "user1#0" in text
+    assert "user2#0" in text
+    assert "LousyBot#0 | 999999999999999999 | (Your Account)" in text
+    assert "user3#0" not in text
+
+def test_mentioned_strategy_includes_mentions(big_guild):
+    target = big_guild.members[42]
+    history = [user_msg(big_guild.members[1], f"hey <@{target.id}> and @user7#0")]
+    text = render_user_list(big_guild, history=history, strategy="mentioned", limit=10)
+
+    assert "user42#0" in text
+    assert "user7#0" in text
+    assert "user1#0" in text
+
+def test_active_strategy_uses_activity(big_guild):
+    for _ in range(3):
+        user_activity.record(big_guild.id, big_guild.members[9].id)
+    user_activity.record(big_guild.id, big_guild.members[8].id)
+
+    text = render_user_list(big_guild, history=[], strategy="active", limit=1)
+    assert "user9#0" in text
+    assert "user8#0" not in text
+
+def test_auto_lists_everyone_on_small_guilds():
+    guild = SimpleNamespace(id=8888, roles=[], members=[
+        SimpleNamespace(id=100000000000000001, name="alice", discriminator="0"),
+        SimpleNamespace(id=100000000000000002, name="bob", discriminator="0"),
+    ])
+    text = render_user_list(guild, history=[], strategy="auto", limit=10)
+    assert text == ("Server User List:\n- alice#0 | 100000000000000001\n- bob#0 | 100000000000000002")
+    member_directory.forget(guild)
+
+def test_rendered_section_cached_until_membership_changes(big_guild):
+    history = [user_msg(big_guild.members[1])]
+    first = render_user_list(big_guild, history=history, strategy="all", limit=20)
+    assert render_user_list(big_guild, history=history, strategy="all", limit=20) is first
+
+    newcomer = SimpleNamespace(id=100000000000000000 - 1, name="aaa_newcomer", discriminator="0", guild=big_guild)
+    member_directory.on_member_join(newcomer)
+    updated = render_user_list(big_guild, history=history, strategy="all", limit=20)
+    assert updated is not first
+    assert "aaa_newcomer#0" in updated
+
+def test_uncapped_selection_strategies(big_guild):
+    history = [user_msg(member) for member in big_guild.members[:3]]
+    user_activity.record(big_guild.id, big_guild.members[9].id)
+
+    recent = render_user_list(big_guild, history=history, strategy="recent", limit=None)
+    assert all(f"user{i}#0" in recent for i in range(3))
+    assert "user3#0" not in recent
+    assert "user9#0" in render_user_list(big_guild, history=[], strategy="active", limit=None)
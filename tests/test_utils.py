@@ -0,0 +1,41 @@
+from src.utils import split_message, split_point
+
+def test_short_text_is_one_message():
+    assert list(split_message("hello")) == ["hello"]
+    assert list(split_message("")) == []
+
+def test_split_prefers_paragraphs_then_lines_then_sentences():
+    text = "a" * 60 + "\n\n" + "b" * 20 + "\n" + "c" * 30
+    assert split_point(text, 100) == (62, "", "")
+
+    text = "a" * 60 + "\n" + "b" * 20 + ". " + "c" * 30
+    assert split_point(text, 100) == (61, "", "")
+
+    text = "a" * 55 + ". " + "b" * 10 + " " + "c" * 50
+    assert split_point(text, 100) == (57, "", "")
+
+    assert split_point("a" * 150, 100) == (100, "", "")
+
+def test_split_avoids_code_blocks():
+    text = "intro words here\n" + "x" * 40 + "\n```py\n" + "print(1)\n" * 8 + "```\nafter"
+    cut, closing, reopen = split_point(text, 100)
+    assert text[:cut].count("```") % 2 == 0
+    assert (closing, reopen) == ("", "")
+
+def test_split_inside_long_code_block_reopens_it():
+    text = "```py\n" + "print(1)\n" * 40 + "```"
+    parts = list(split_message(text, 100))
+    assert len(parts) > 1
+    assert all(len(p) <= 100 for p in parts)
+    assert all(p.startswith("```py\n") and p.rstrip().endswith("```") for p in parts)
+    assert "".join(p[len("```py\n"):-3] for p in parts) == "print(1)\n" * 40
+
+def test_split_respects_max_cut():
+    text = "word " * 40
+    cut, _, _ = split_point(text, 100, max_cut=80)
+    assert cut <= 80
+    assert split_point(text, 100, max_cut=30) is None
+
+def test_every_part_fits():
+    text = ("word " * 7 + "\n```\n" + "y" * 300 + "\n```\n") * 20
+    assert all(0 < len(p) <= 120 for p in split_message(text, 120))